@@ -0,0 +1,74 @@
+"""
+HealthyLife Pro - Running totals
+Per-day counters kept up to date by the write handlers, so the dashboard and
+analytics never have to re-add a user's meals, exercises or habits.
+"""
+
+def empty_totals():
+    """Counters for a day with nothing logged"""
+    return {
+        'calories_burned': 0,
+        'exercise_minutes': 0,
+        'calories_eaten': 0,
+        'meal_count': 0,
+        'habits_completed': 0,
+    }
+
+def rebuild_totals(data):
+    """Recompute the counters from a user's raw entries"""
+    return {
+        'calories_burned': sum(ex.calories for ex in data.exercises),
+        'exercise_minutes': sum(ex.duration for ex in data.exercises),
+        'calories_eaten': sum(meal.calories for meal in data.meals),
+        'meal_count': len(data.meals),
+        'habits_completed': sum(1 for v in data.habits.values() if v),
+    }
+
+def needs_rebuild(data):
+    """Whether a user's data predates some of the current counters"""
+    return data.totals is None or data.totals.keys() != empty_totals().keys()
+
+def check_totals(data):
+    """Counters that disagree with the raw entries, as {name: (stored, actual)}"""
+    stored = data.totals or {}
+    actual = rebuild_totals(data)
+    return {name: (stored.get(name), value)
+            for name, value in actual.items() if stored.get(name) != value}
+
+def add_meal(data, meal):
+    """Log a meal, replacing any earlier meal of the same type"""
+    totals = data.totals
+    kept = []
+    for existing in data.meals:
+        if existing.type == meal.type:
+            totals['calories_eaten'] -= existing.calories
+            totals['meal_count'] -= 1
+        else:
+            kept.append(existing)
+    kept.append(meal)
+    data.meals = kept
+    totals['calories_eaten'] += meal.calories
+    totals['meal_count'] += 1
+
+def add_exercise(data, exercise):
+    """Log an exercise"""
+    data.exercises.append(exercise)
+    totals = data.totals
+    totals['calories_burned'] += exercise.calories
+    totals['exercise_minutes'] += exercise.duration
+
+def update_habits(data, changes):
+    """Apply habit changes, adjusting the completed count by the difference"""
+    habits = data.habits
+    delta = 0
+    for name, completed in changes.items():
+        delta += bool(completed) - bool(habits.get(name, False))
+        habits[name] = completed
+    data.totals['habits_completed'] += delta
+
+def add_sleep(data, sleep):
+    """Log last night's sleep, updating the recent-nights stats if the user has them"""
+    data.sleep_data = sleep
+    if data.sleep_log is not None:
+        # A second entry for the same day replaces the first there too
+        data.sleep_log.record(data.last_updated, sleep)
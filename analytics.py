@@ -0,0 +1,133 @@
+"""
+HealthyLife Pro - Analytics engine
+Rolling-window sums, averages, streaks and habit completion computed from
+small per-day rollups, so a 90-day window reads 90 rollups no matter how many
+meals and exercises the user logged.
+"""
+
+from history import day_range, shift_day
+
+# A rollup is a flat list of per-day numbers in this order
+ROLLUP_FIELDS = (
+    'water_count',
+    'exercise_sessions',
+    'exercise_minutes',
+    'calories_burned',
+    'meal_count',
+    'calories_eaten',
+    'habits_completed',
+    'habits_total',
+    'sleep_hours',
+    'sleep_quality',
+)
+(WATER, SESSIONS, MINUTES, BURNED, MEALS, EATEN,
+ HABITS_DONE, HABITS_TOTAL, SLEEP_HOURS, SLEEP_QUALITY) = range(len(ROLLUP_FIELDS))
+
+WATER_GOAL = 8
+WINDOWS = (7, 30, 90)
+
+def _sleep(sleep_data):
+    duration = sleep_data.get('duration') or 0
+    quality = sleep_data.get('quality', 0) if duration else 0
+    return duration, quality
+
+def _live_sleep(sleep):
+    if sleep is None or not sleep.duration:
+        return 0, 0
+    return sleep.duration, sleep.quality
+
+def rollup_day(record):
+    """Rollup for a sealed day record"""
+    exercises = record.get('exercises', [])
+    meals = record.get('meals', [])
+    habits = record.get('habits', {})
+    sleep_hours, sleep_quality = _sleep(record.get('sleep_data', {}))
+    return [
+        record.get('water_count', 0),
+        len(exercises),
+        sum(ex.get('duration', 0) for ex in exercises),
+        sum(ex.get('calories', 0) for ex in exercises),
+        len(meals),
+        sum(meal.get('calories', 0) for meal in meals),
+        sum(1 for v in habits.values() if v),
+        len(habits),
+        sleep_hours,
+        sleep_quality,
+    ]
+
+def live_rollup(data):
+    """Rollup for the day in progress, read from its running totals"""
+    totals = data.totals
+    sleep_hours, sleep_quality = _live_sleep(data.sleep_data)
+    return [
+        data.water_count,
+        len(data.exercises),
+        totals['exercise_minutes'],
+        totals['calories_burned'],
+        totals['meal_count'],
+        totals['calories_eaten'],
+        totals['habits_completed'],
+        len(data.habits),
+        sleep_hours,
+        sleep_quality,
+    ]
+
+def _streaks(flags):
+    """(current, longest) run of True values; today may still be in progress"""
+    longest = run = 0
+    for flag in flags:
+        run = run + 1 if flag else 0
+        longest = max(longest, run)
+    current = 0
+    # An unfinished today doesn't break a streak that ran through yesterday
+    tail = flags if flags and flags[-1] else flags[:-1]
+    for flag in reversed(tail):
+        if not flag:
+            break
+        current += 1
+    return {'current': current, 'longest': longest}
+
+def _average(total, count):
+    return round(total / count, 1) if count else 0
+
+def summarize(rollups, end, window):
+    """Stats for the `window` days ending at `end`, from a {day: rollup} map"""
+    days = day_range(shift_day(end, -(window - 1)), end)
+    logged = [rollups[day] for day in days if day in rollups]
+
+    def column(index):
+        return sum(r[index] for r in logged)
+
+    nights = [r for r in logged if r[SLEEP_HOURS]]
+    habits_total = column(HABITS_TOTAL)
+    empty = [0] * len(ROLLUP_FIELDS)
+    daily = [rollups.get(day, empty) for day in days]
+
+    return {
+        'window': window,
+        'start': days[0],
+        'end': end,
+        'days_logged': len(logged),
+        'totals': {
+            'water_count': column(WATER),
+            'exercise_sessions': column(SESSIONS),
+            'exercise_minutes': column(MINUTES),
+            'calories_burned': column(BURNED),
+            'calories_eaten': column(EATEN),
+        },
+        'averages': {
+            'water_count': _average(column(WATER), len(logged)),
+            'exercise_minutes': _average(column(MINUTES), len(logged)),
+            'calories_burned': _average(column(BURNED), len(logged)),
+            'calories_eaten': _average(column(EATEN), len(logged)),
+            'sleep_hours': _average(sum(r[SLEEP_HOURS] for r in nights), len(nights)),
+            'sleep_quality': _average(sum(r[SLEEP_QUALITY] for r in nights), len(nights)),
+        },
+        'exercise_days': sum(1 for r in logged if r[SESSIONS]),
+        'habit_completion': round(column(HABITS_DONE) / habits_total * 100) if habits_total else 0,
+        'streaks': {
+            'water_goal': _streaks([r[WATER] >= WATER_GOAL for r in daily]),
+            'exercise': _streaks([r[SESSIONS] > 0 for r in daily]),
+            'all_habits': _streaks([0 < r[HABITS_TOTAL] == r[HABITS_DONE] for r in daily]),
+        },
+    }
@@ -4,51 +4,263 @@ HealthyLife Pro - Complete Working Web Application
 Run this file and go to http://localhost:5000
 """
 
-from flask import Flask, request, jsonify, session
+from flask import Flask, Response, g, request, jsonify, session
+import argparse
+import hmac
 import json
-from datetime import datetime
+import os
+import re
+import secrets
+import time
+import uuid
+from contextlib import contextmanager
+
+import aggregates
+import rollover
+from analytics import live_rollup, rollup_day, summarize
+from assets import IMMUTABLE_CACHE_CONTROL, StaticAsset, build_assets
+from bulk import BatchNotSaved, export_stream, import_stream
+from events import RESYNC, EventBroker, create_event_channel
+from foods import MAX_RESULTS, search_foods
+from fragments import MAX_FRAGMENTS, FragmentCache
+from history import MAX_RANGE_DAYS, expand_day, parse_day, seal_day, shift_day
+from locks import UserLocks
+from met import MetTable
+from metrics import BYTES, Metrics, instrument_storage
+from records import (DayState, Exercise, Meal, Sleep, validate_habits, validate_profile,
+                     validate_water)
+from responses import (REVALIDATE_CACHE_CONTROL, compress_body, compressible, etag_matches,
+                       source_tag, user_etag)
+from rollover import RolloverScheduler
+from server import check_shared_state, serve
+from sleep import SLEEP_HISTORY_DAYS, TARGET_HOURS, SleepLog
+from sessions import ServerSideSessionInterface, create_session_store
+from storage import SaveConflict, create_storage
 
 app = Flask(__name__)
 app.secret_key = 'healthylife-secret-key-2024'
 
-# Simple in-memory storage
-users_data = {}
+# Request, render and storage timings for /metrics; HEALTHYLIFE_METRICS=0 turns them off
+metrics = Metrics()
+metrics.enabled = os.environ.get('HEALTHYLIFE_METRICS', '1') != '0'
+metrics.histogram('request_duration_seconds', 'Time to handle a request, by route')
+metrics.counter('requests_total', 'Requests handled, by route and status')
+metrics.histogram('request_size_bytes', 'Request body size, by route', BYTES)
+metrics.histogram('response_size_bytes', 'Response body size (not streamed), by route', BYTES)
+metrics.histogram('render_duration_seconds', 'Time spent in each page render helper')
+metrics.histogram('storage_duration_seconds', 'Time spent in each storage call')
+timed_render = metrics.timed('render_duration_seconds', 'helper')
+
+# Users' data lives in a pluggable backend (in-memory unless configured);
+# HEALTHYLIFE_WRITE_BEHIND=<seconds> batches SQLite saves and
+# HEALTHYLIFE_CACHE_USERS=<count> keeps active users in memory in front of it
+storage = instrument_storage(
+    create_storage(os.environ.get('HEALTHYLIFE_STORAGE', 'memory://'),
+                   write_behind=float(os.environ.get('HEALTHYLIFE_WRITE_BEHIND', 0)),
+                   max_batch=int(os.environ.get('HEALTHYLIFE_WRITE_BATCH', 500)),
+                   cache_users=int(os.environ.get('HEALTHYLIFE_CACHE_USERS', 0)),
+                   cache_ttl=float(os.environ.get('HEALTHYLIFE_CACHE_TTL', 0))),
+    metrics)
+
+# Sessions are kept server-side; the cookie only carries an opaque id
+session_store = create_session_store(os.environ.get('HEALTHYLIFE_SESSIONS')
+                                     or os.environ.get('HEALTHYLIFE_STORAGE', 'memory://'))
+app.config['SESSION_COOKIE_NAME'] = 'healthylife_sid'
+app.session_interface = ServerSideSessionInterface(session_store)
+
+# Same-user requests take turns; different users run in parallel. Locks
+# only cover this process: a save that another worker beat raises
+# SaveConflict and the change is applied again to their data.
+user_locks = UserLocks()
+SAVE_ATTEMPTS = 5
+
+# Dashboard sections' HTML per user, re-rendered only when they change;
+# HEALTHYLIFE_FRAGMENT_CACHE=<entries>, 0 turns it off
+fragment_cache = FragmentCache(int(os.environ.get('HEALTHYLIFE_FRAGMENT_CACHE', MAX_FRAGMENTS)))
+
+# MET values for estimating the calories of exercises logged without them
+met_table = MetTable.load()
+
+# Live change events for each user's open dashboards. Each open stream holds
+# one of a gunicorn worker's threads, so at most HEALTHYLIFE_EVENT_STREAMS
+# are served per process (unset: no cap); HEALTHYLIFE_EVENTS carries events
+# between worker processes (by default through HEALTHYLIFE_STORAGE's SQLite file)
+broker = EventBroker(
+    max_streams=(int(os.environ['HEALTHYLIFE_EVENT_STREAMS'])
+                 if os.environ.get('HEALTHYLIFE_EVENT_STREAMS') else None),
+    channel=create_event_channel(os.environ.get('HEALTHYLIFE_EVENTS')
+                                 or os.environ.get('HEALTHYLIFE_STORAGE', 'memory://')))
+EVENT_KEEPALIVE_SECONDS = 15
+
+# Active users' days are started in the background just after their midnight;
+# HEALTHYLIFE_ROLLOVER_SWEEP=<seconds> between sweeps, 0 leaves it to requests
+rollovers = RolloverScheduler()
+ROLLOVER_SWEEP_SECONDS = float(os.environ.get('HEALTHYLIFE_ROLLOVER_SWEEP',
+                                              rollover.SWEEP_INTERVAL))
+
+def current_user_id():
+    """Get the current session's user id, giving a new visitor one of their own
+
+    A new visitor's id only lasts for this request unless they change
+    something (see remember_user), so crawlers and health checks that only
+    read pages leave no session or user behind.
+    """
+    user_id = session.get('user_id')
+    if user_id is None:
+        user_id = g.get('new_user_id')
+        if user_id is None:
+            user_id = g.new_user_id = uuid.uuid4().hex
+    return user_id
+
+def remember_user(user_id):
+    """Start a session for a new visitor whose data has just been saved"""
+    if session.get('user_id') != user_id:
+        session['user_id'] = user_id
+
+def new_user_data():
+    """Fresh data for a user with nothing logged"""
+    # A random first version keeps a user recreated under the same id (say,
+    # after being evicted) from reusing an ETag of their old data
+    return DayState(rollover.today(), totals=aggregates.empty_totals(),
+                    version=secrets.randbits(32), sleep_log=SleepLog())
+
+def save_user_data(user_id, data, days=None):
+    """Save a user's data as a new version, so copies of their pages go stale
+
+    Imported past-day entries, as {day: [(kind, entry), ...]}, are saved
+    with it: both or, on SaveConflict, neither.
+    """
+    data.version += 1
+    if days:
+        storage.save_with_days(user_id, data, days)
+    else:
+        storage.save(user_id, data)
+
+def retry_conflicts(attempt):
+    """Call attempt() until it saves without another worker's save getting in first"""
+    for _ in range(SAVE_ATTEMPTS - 1):
+        try:
+            return attempt()
+        except SaveConflict:
+            continue
+    return attempt()
 
 def get_user_data():
     """Get current user's data"""
-    user_id = session.get('user_id', 'demo_user')
-    session['user_id'] = user_id
+    user_id = current_user_id()
+    with user_locks(user_id):
+        return load_user_data(user_id)
+
+def load_user_data(user_id):
+    """Load a user's data, rolling it over to today as needed
+
+    A user with nothing stored gets fresh data, which is only saved by their
+    first change. Callers must hold the user's lock.
+    """
+    def attempt():
+        data = storage.load(user_id)
+        if data is None:
+            return new_user_data()
+        return refresh_user_data(user_id, data)
+    return retry_conflicts(attempt)
+
+def advance_day(data):
+    """Roll data over to the user's today and fill in any missing totals, in memory only
+
+    Returns whether data changed and, if a day ended, the (day, record,
+    rollup) to seal into history; callers store both.
+    """
+    # Seal the finished day into history and start a fresh one. A day ahead of
+    # today (after moving to a timezone further west) is kept until today catches up.
+    today = rollover.today(data.profile.get('timezone'))
+    if data.last_updated < today:
+        day, record = data.last_updated, seal_day(data)
+        data.start_day(today)
+        data.totals = aggregates.empty_totals()
+        return True, (day, record, rollup_day(record))
+    if aggregates.needs_rebuild(data):
+        # Data saved before some of the running totals existed
+        data.totals = aggregates.rebuild_totals(data)
+        return True, None
+    return False, None
+
+def refresh_user_data(user_id, data):
+    """Roll loaded data over to the user's today and fill in any missing totals
+
+    Callers must hold the user's lock.
+    """
+    changed, sealed = advance_day(data)
+    if sealed:
+        storage.seal_day(user_id, *sealed)
+    if changed:
+        save_user_data(user_id, data)
     
-    if user_id not in users_data:
-        users_data[user_id] = {
-            'water_count': 0,
-            'habits': {
-                'meditation': False,
-                'exercise': False,
-                'reading': False,
-                'water_intake': False,
-                'healthy_eating': False
-            },
-            'meals': [],
-            'exercises': [],
-            'sleep_data': {},
-            'last_updated': datetime.now().strftime('%Y-%m-%d')
-        }
+    rollovers.track(user_id, data.profile.get('timezone'), data.last_updated)
+    return data
+
+def roll_over_user(user_id):
+    """Start a tracked user's new day ahead of their next request"""
+    with user_locks(user_id):
+        data = storage.load(user_id)
+        if data is None:
+            # Forgotten by the storage since; their next visit starts afresh
+            rollovers.forget(user_id)
+            return
+        day = data.last_updated
+        try:
+            data = refresh_user_data(user_id, data)
+        except SaveConflict:
+            # Another worker saved them first, rolling them over if it was due
+            return
+        if data.last_updated != day and broker.has_subscribers(user_id):
+            broker.publish(user_id, live_event(data, *FRAGMENTS), data.version)
+
+if ROLLOVER_SWEEP_SECONDS > 0:
+    rollovers.start(roll_over_user, ROLLOVER_SWEEP_SECONDS)
+
+@contextmanager
+def view_user_data():
+    """Get current user's data, holding their lock while it is read"""
+    user_id = current_user_id()
+    with user_locks(user_id):
+        yield load_user_data(user_id)
+
+def edit_user_data(change, reply=None, sections=(), days=None):
+    """Apply change(data) to current user's data, save it and return reply(data)
+
+    The user's lock is held from load to reply, so concurrent changes for the
+    same user are applied one after another instead of overwriting each other;
+    if another worker saves the user in between, change is applied again to
+    their data, so it must only depend on the data it is given.
+    Open dashboards are then sent the change, re-rendering `sections`; cached
+    fragments of the other sections stay valid. Without a reply the saved
+    data is returned. `days` are past-day entries saved along with the change.
+    """
+    user_id = current_user_id()
     
-    # Reset data if it's a new day
-    today = datetime.now().strftime('%Y-%m-%d')
-    if users_data[user_id]['last_updated'] != today:
-        users_data[user_id].update({
-            'water_count': 0,
-            'habits': {k: False for k in users_data[user_id]['habits']},
-            'meals': [],
-            'exercises': [],
-            'sleep_data': {},
-            'last_updated': today
-        })
+    def attempt():
+        data = load_user_data(user_id)
+        change(data)
+        # A change of timezone can end the day
+        _, sealed = advance_day(data)
+        if sealed:
+            storage.seal_day(user_id, *sealed)
+        version = data.version
+        save_user_data(user_id, data, days)
+        return data, version
     
-    return users_data[user_id]
-
+    with user_locks(user_id):
+        data, version = retry_conflicts(attempt)
+        remember_user(user_id)
+        rollovers.track(user_id, data.profile.get('timezone'), data.last_updated)
+        fragment_cache.advance(user_id, version, data.version,
+                               [section for section in FRAGMENTS if section not in sections])
+        result = data if reply is None else reply(data)
+        if broker.has_subscribers(user_id):
+            broker.publish(user_id, live_event(data, *sections), data.version)
+    return result
+
+@timed_render
 def generate_water_glasses(water_count):
     """Generate water glass HTML"""
     glasses = []
@@ -57,6 +269,7 @@ def generate_water_glasses(water_count):
         glasses.append(f'<div class="water-glass {filled_class}" onclick="toggleWaterGlass({i})">{i+1}</div>')
     return ''.join(glasses)
 
+@timed_render
 def generate_habit_items(habits):
     """Generate habit items HTML"""
     items = []
@@ -74,6 +287,7 @@ def generate_habit_items(habits):
         ''')
     return ''.join(items)
 
+@timed_render
 def generate_meal_items(meals):
     """Generate meal items HTML"""
     if not meals:
@@ -83,13 +297,14 @@ def generate_meal_items(meals):
     for meal in meals:
         items.append(f'''
         <div class="meal-item">
-            <h4>{meal["type"].title()} ({meal["timestamp"]})</h4>
-            <p><strong>Items:</strong> {meal["items"]}</p>
-            <p><strong>Calories:</strong> {meal["calories"]}</p>
+            <h4>{meal.type.title()} ({meal.timestamp})</h4>
+            <p><strong>Items:</strong> {meal.items}</p>
+            <p><strong>Calories:</strong> {meal.calories}</p>
         </div>
         ''')
     return ''.join(items)
 
+@timed_render
 def generate_exercise_items(exercises):
     """Generate exercise items HTML"""
     if not exercises:
@@ -99,351 +314,737 @@ def generate_exercise_items(exercises):
     for exercise in exercises:
         items.append(f'''
         <div class="exercise-item">
-            <h4>{exercise["name"]} ({exercise["timestamp"]})</h4>
-            <p><strong>Duration:</strong> {exercise["duration"]} minutes</p>
-            <p><strong>Calories Burned:</strong> {exercise["calories"]}</p>
+            <h4>{exercise.name} ({exercise.timestamp})</h4>
+            <p><strong>Duration:</strong> {exercise.duration} minutes</p>
+            <p><strong>Calories Burned:</strong> {exercise.calories}</p>
         </div>
         ''')
     return ''.join(items)
 
-@app.route('/')
-def index():
-    """Main page with embedded HTML, CSS, and JavaScript"""
-    data = get_user_data()
-    
-    # Calculate statistics
-    water_progress = int(data['water_count'] / 8 * 100)
-    exercise_calories = sum(ex.get('calories', 0) for ex in data['exercises'])
-    activity_progress = min(int(exercise_calories / 500 * 100), 100)
-    nutrition_progress = min(int(len(data['meals']) / 3 * 100), 100)
-    meal_calories = sum(meal.get('calories', 0) for meal in data['meals'])
-    
-    completed_habits = sum(1 for v in data['habits'].values() if v)
-    total_habits = len(data['habits'])
-    habit_completion = int(completed_habits / total_habits * 100) if total_habits > 0 else 0
-    
-    sleep_progress = 0
-    sleep_display = 'No data'
-    if data['sleep_data'].get('duration'):
-        sleep_progress = min(int(data['sleep_data']['duration'] / 8 * 100), 100)
-        sleep_display = f"{data['sleep_data']['duration']}h (Quality: {data['sleep_data']['quality']}/10)"
-    
-    html_content = f'''
+# Stylesheet and script for the page, served as fingerprinted assets
+PAGE_CSS = '''\
+* {
+    margin: 0;
+    padding: 0;
+    box-sizing: border-box;
+}
+
+body {
+    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+    line-height: 1.6;
+    color: #333;
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    min-height: 100vh;
+}
+
+.container {
+    max-width: 1400px;
+    margin: 0 auto;
+    padding: 20px;
+}
+
+header {
+    text-align: center;
+    margin-bottom: 40px;
+    color: white;
+}
+
+header h1 {
+    font-size: 3.5rem;
+    margin-bottom: 10px;
+    text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
+    animation: glow 2s ease-in-out infinite alternate;
+}
+
+@keyframes glow {
+    from { text-shadow: 2px 2px 4px rgba(0,0,0,0.3); }
+    to { text-shadow: 2px 2px 20px rgba(255,255,255,0.5); }
+}
+
+.nav-tabs {
+    display: flex;
+    justify-content: center;
+    flex-wrap: wrap;
+    gap: 15px;
+    margin-bottom: 30px;
+}
+
+.tab-btn {
+    background: rgba(255, 255, 255, 0.2);
+    border: 2px solid rgba(255, 255, 255, 0.3);
+    color: white;
+    padding: 15px 30px;
+    cursor: pointer;
+    border-radius: 50px;
+    font-size: 16px;
+    font-weight: 600;
+    transition: all 0.3s ease;
+    backdrop-filter: blur(10px);
+}
+
+.tab-btn:hover, .tab-btn.active {
+    background: rgba(255, 255, 255, 0.3);
+    border-color: rgba(255, 255, 255, 0.8);
+    transform: translateY(-3px);
+    box-shadow: 0 10px 25px rgba(0,0,0,0.2);
+}
+
+.tab-content {
+    display: none;
+    background: rgba(255, 255, 255, 0.95);
+    border-radius: 25px;
+    padding: 40px;
+    box-shadow: 0 25px 50px rgba(0,0,0,0.15);
+    backdrop-filter: blur(10px);
+}
+
+.tab-content.active {
+    display: block;
+    animation: slideIn 0.6s ease;
+}
+
+@keyframes slideIn {
+    from { opacity: 0; transform: translateY(30px); }
+    to { opacity: 1; transform: translateY(0); }
+}
+
+.dashboard-grid {
+    display: grid;
+    grid-template-columns: repeat(auto-fit, minmax(320px, 1fr));
+    gap: 25px;
+    margin-bottom: 30px;
+}
+
+.card {
+    background: linear-gradient(135deg, #f8fafc 0%, #e2e8f0 100%);
+    border-radius: 20px;
+    padding: 30px;
+    box-shadow: 0 15px 35px rgba(0,0,0,0.1);
+    transition: all 0.4s ease;
+    position: relative;
+    overflow: hidden;
+}
+
+.card::before {
+    content: '';
+    position: absolute;
+    top: 0;
+    left: 0;
+    right: 0;
+    height: 4px;
+    background: linear-gradient(90deg, #667eea, #764ba2);
+}
+
+.card:hover {
+    transform: translateY(-10px);
+    box-shadow: 0 25px 50px rgba(0,0,0,0.2);
+}
+
+.card h3 {
+    color: #4a5568;
+    margin-bottom: 20px;
+    font-size: 1.5rem;
+}
+
+.progress-container {
+    margin: 15px 0;
+}
+
+.progress-bar {
+    width: 100%;
+    height: 12px;
+    background: #e2e8f0;
+    border-radius: 6px;
+    overflow: hidden;
+    position: relative;
+}
+
+.progress-fill {
+    height: 100%;
+    background: linear-gradient(90deg, #667eea, #764ba2);
+    border-radius: 6px;
+    transition: width 0.8s ease;
+}
+
+.water-tracker {
+    display: flex;
+    gap: 8px;
+    flex-wrap: wrap;
+    margin-top: 15px;
+    justify-content: center;
+}
+
+.water-glass {
+    width: 40px;
+    height: 60px;
+    background: #e2e8f0;
+    border-radius: 0 0 20px 20px;
+    cursor: pointer;
+    transition: all 0.3s ease;
+    border: 3px solid #667eea;
+    display: flex;
+    align-items: flex-end;
+    justify-content: center;
+    color: #667eea;
+    font-weight: bold;
+    font-size: 12px;
+    padding-bottom: 5px;
+}
+
+.water-glass:hover {
+    transform: scale(1.1);
+}
+
+.water-glass.filled {
+    background: linear-gradient(to top, #4facfe 0%, #00f2fe 100%);
+    color: white;
+}
+
+.habit-item {
+    background: white;
+    padding: 20px;
+    border-radius: 15px;
+    display: flex;
+    justify-content: space-between;
+    align-items: center;
+    box-shadow: 0 5px 15px rgba(0,0,0,0.08);
+    margin-bottom: 15px;
+}
+
+.habit-checkbox {
+    width: 30px;
+    height: 30px;
+    border: 2px solid #667eea;
+    border-radius: 6px;
+    cursor: pointer;
+    display: flex;
+    align-items: center;
+    justify-content: center;
+    transition: all 0.3s ease;
+    font-size: 18px;
+    font-weight: bold;
+}
+
+.habit-checkbox.checked {
+    background: #667eea;
+    color: white;
+}
+
+.btn {
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: white;
+    border: none;
+    padding: 15px 30px;
+    border-radius: 12px;
+    cursor: pointer;
+    font-size: 16px;
+    font-weight: 600;
+    transition: all 0.3s ease;
+    box-shadow: 0 5px 15px rgba(102, 126, 234, 0.4);
+}
+
+.btn:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 10px 25px rgba(102, 126, 234, 0.6);
+}
+
+.input-group {
+    margin-bottom: 20px;
+}
+
+.input-group label {
+    display: block;
+    margin-bottom: 8px;
+    font-weight: 600;
+    color: #4a5568;
+}
+
+.input-group input, .input-group select, .input-group textarea {
+    width: 100%;
+    padding: 12px 15px;
+    border: 2px solid #e2e8f0;
+    border-radius: 10px;
+    font-size: 16px;
+    transition: all 0.3s ease;
+}
+
+.input-group input:focus, .input-group select:focus, .input-group textarea:focus {
+    outline: none;
+    border-color: #667eea;
+    box-shadow: 0 0 0 3px rgba(102, 126, 234, 0.1);
+}
+
+.stats-grid {
+    display: grid;
+    grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
+    gap: 20px;
+}
+
+.stat-card {
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: white;
+    padding: 25px;
+    border-radius: 20px;
+    text-align: center;
+}
+
+.stat-number {
+    font-size: 2.5rem;
+    font-weight: bold;
+    margin-bottom: 10px;
+}
+
+.notification {
+    position: fixed;
+    top: 20px;
+    right: 20px;
+    background: #48bb78;
+    color: white;
+    padding: 15px 25px;
+    border-radius: 10px;
+    box-shadow: 0 10px 25px rgba(0,0,0,0.2);
+    transform: translateX(400px);
+    transition: transform 0.3s ease;
+    z-index: 1000;
+}
+
+.notification.show {
+    transform: translateX(0);
+}
+
+.notification.error {
+    background: #e53e3e;
+}
+
+.meal-item, .exercise-item {
+    background: rgba(255, 255, 255, 0.7);
+    padding: 15px;
+    margin: 10px 0;
+    border-radius: 10px;
+    border-left: 4px solid #667eea;
+}
+
+.food-result {
+    padding: 8px 15px;
+    margin-top: 4px;
+    border-radius: 10px;
+    background: rgba(102, 126, 234, 0.08);
+    cursor: pointer;
+}
+
+.food-result:hover {
+    background: rgba(102, 126, 234, 0.2);
+}
+
+@media (max-width: 768px) {
+    .container { padding: 10px; }
+    header h1 { font-size: 2.5rem; }
+    .tab-content { padding: 20px; }
+    .dashboard-grid { grid-template-columns: 1fr; }
+}
+'''
+
+PAGE_JS = '''\
+function showTab(tabName) {
+    document.querySelectorAll('.tab-content').forEach(tab => tab.classList.remove('active'));
+    document.querySelectorAll('.tab-btn').forEach(btn => btn.classList.remove('active'));
+    document.getElementById(tabName).classList.add('active');
+    event.target.classList.add('active');
+    if (tabName === 'sleep') {
+        loadSleepTrends();
+    }
+}
+
+// Quick runs of clicks only send their final state, once the clicking stops
+const SEND_DELAY_MS = 400;
+const pendingPosts = {};
+
+function postLater(url, body, onDone) {
+    if (pendingPosts[url]) {
+        clearTimeout(pendingPosts[url].timer);
+    }
+    pendingPosts[url] = {
+        body: body,
+        timer: setTimeout(() => {
+            delete pendingPosts[url];
+            fetch(url, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify(body())
+            })
+            .then(response => response.json())
+            .then(onDone);
+        }, SEND_DELAY_MS)
+    };
+}
+
+// Don't lose the last clicks if the page is closed before they are sent
+window.addEventListener('pagehide', () => {
+    Object.entries(pendingPosts).forEach(([url, pending]) => {
+        clearTimeout(pending.timer);
+        navigator.sendBeacon(url, new Blob([JSON.stringify(pending.body())], {type: 'application/json'}));
+    });
+});
+
+function toggleWaterGlass(index) {
+    if (index < currentData.water_count) {
+        currentData.water_count = index;
+    } else {
+        currentData.water_count = index + 1;
+    }
+
+    updateWaterDisplay();
+
+    postLater('/api/water', () => ({count: currentData.water_count}), data => {
+        if (data.success) {
+            applyUpdate(data.update);
+        }
+        if (data.success && currentData.water_count >= 8) {
+            showNotification('🎉 Congratulations! You have reached your daily water goal!');
+        }
+    });
+}
+
+function updateWaterDisplay() {
+    document.getElementById('water-count').textContent = currentData.water_count;
+    document.getElementById('water-progress').style.width = (currentData.water_count / 8 * 100) + '%';
+
+    const glasses = document.querySelectorAll('.water-glass');
+    glasses.forEach((glass, index) => {
+        if (index < currentData.water_count) {
+            glass.classList.add('filled');
+        } else {
+            glass.classList.remove('filled');
+        }
+    });
+}
+
+function toggleHabit(habitName) {
+    currentData.habits[habitName] = !currentData.habits[habitName];
+
+    const checkboxes = document.querySelectorAll('[onclick*="' + habitName + '"]');
+    checkboxes.forEach(checkbox => {
+        if (currentData.habits[habitName]) {
+            checkbox.classList.add('checked');
+            checkbox.textContent = '✓';
+        } else {
+            checkbox.classList.remove('checked');
+            checkbox.textContent = '';
+        }
+    });
+
+    postLater('/api/habits', () => currentData.habits, data => {
+        if (data.success) {
+            applyUpdate(data.update);
+        }
+        if (data.success && currentData.habits[habitName]) {
+            showNotification('✅ Great job completing: ' + habitName.replace('_', ' ') + '!');
+        }
+    });
+}
+
+function addNewHabit() {
+    const input = document.getElementById('new-habit');
+    const habitName = input.value.trim().toLowerCase().replace(/\\s+/g, '_');
+
+    if (habitName && !currentData.habits[habitName]) {
+        currentData.habits[habitName] = false;
+        input.value = '';
+
+        fetch('/api/habits', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(currentData.habits)
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                currentData.habits = data.habits;
+                applyUpdate(data.update);
+                showNotification('New habit added: ' + habitName.replace('_', ' ') + '!');
+            }
+        });
+    } else if (currentData.habits[habitName]) {
+        showNotification('Habit already exists!', 'error');
+    }
+}
+
+// Food search: picking a match adds it to the meal along with its calories
+const FOOD_SEARCH_DELAY_MS = 150;
+let foodSearchTimer = null;
+
+function searchFoods() {
+    clearTimeout(foodSearchTimer);
+    const query = document.getElementById('food-search').value.trim();
+    const results = document.getElementById('food-results');
+    if (!query) {
+        results.innerHTML = '';
+        return;
+    }
+    foodSearchTimer = setTimeout(() => {
+        fetch('/api/foods?q=' + encodeURIComponent(query))
+        .then(response => response.json())
+        .then(data => {
+            if (document.getElementById('food-search').value.trim() !== query) {
+                return;  // The user kept typing; a newer search is on its way
+            }
+            results.innerHTML = '';
+            data.foods.forEach(food => {
+                const item = document.createElement('div');
+                item.className = 'food-result';
+                item.textContent = `${food.name} · ${food.portion} · ${food.calories} kcal`;
+                item.onclick = () => addFood(food);
+                results.appendChild(item);
+            });
+        });
+    }, FOOD_SEARCH_DELAY_MS);
+}
+
+function addFood(food) {
+    const items = document.getElementById('meal-items');
+    const calories = document.getElementById('meal-calories');
+    const entry = `${food.name} (${food.portion})`;
+    items.value = items.value.trim() ? items.value.trim() + ', ' + entry : entry;
+    calories.value = (parseInt(calories.value) || 0) + food.calories;
+    document.getElementById('food-search').value = '';
+    document.getElementById('food-results').innerHTML = '';
+}
+
+function logMeal() {
+    const mealType = document.getElementById('meal-type').value;
+    const mealItems = document.getElementById('meal-items').value.trim();
+    const mealCalories = parseInt(document.getElementById('meal-calories').value);
+
+    if (!mealItems || !mealCalories) {
+        showNotification('Please fill in all meal information', 'error');
+        return;
+    }
+
+    fetch('/api/meals', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({
+            type: mealType,
+            items: mealItems,
+            calories: mealCalories
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            showNotification(mealType.charAt(0).toUpperCase() + mealType.slice(1) + ' logged successfully!');
+            document.getElementById('meal-items').value = '';
+            document.getElementById('meal-calories').value = '';
+            currentData.meals = data.meals;
+            applyUpdate(data.update);
+        }
+    });
+}
+
+function logExercise() {
+    const name = document.getElementById('exercise-name').value.trim();
+    const duration = parseInt(document.getElementById('exercise-duration').value);
+    const calories = parseInt(document.getElementById('exercise-calories').value);
+
+    if (!name || !duration) {
+        showNotification('Please enter the exercise and its duration', 'error');
+        return;
+    }
+
+    // Calories left blank are estimated by the server from the exercise's MET value
+    const exercise = {name: name, duration: duration};
+    if (calories) {
+        exercise.calories = calories;
+    }
+
+    fetch('/api/exercises', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify(exercise)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            showNotification(data.error, 'error');
+        } else if (data.success) {
+            const logged = data.exercises[data.exercises.length - 1];
+            showNotification('Exercise "' + name + '" logged successfully!' +
+                             (data.estimated ? ' About ' + logged.calories + ' calories burned.' : ''));
+            document.getElementById('exercise-name').value = '';
+            document.getElementById('exercise-duration').value = '';
+            document.getElementById('exercise-calories').value = '';
+            currentData.exercises = data.exercises;
+            applyUpdate(data.update);
+        }
+    });
+}
+
+function updateQualityValue(value) {
+    document.getElementById('quality-value').textContent = value;
+}
+
+function logSleep() {
+    const bedtime = document.getElementById('bedtime').value;
+    const wakeTime = document.getElementById('wake-time').value;
+    const quality = parseInt(document.getElementById('sleep-quality').value);
+
+    if (!bedtime || !wakeTime) {
+        showNotification('Please enter both bedtime and wake time', 'error');
+        return;
+    }
+
+    fetch('/api/sleep', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({
+            bedtime: bedtime,
+            wake_time: wakeTime,
+            quality: quality
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            showNotification('Sleep logged: ' + data.sleep_data.duration + 'h with quality ' + quality + '/10');
+            currentData.sleep_data = data.sleep_data;
+            applyUpdate(data.update);
+            loadSleepTrends();
+        } else {
+            showNotification(data.error || 'Error logging sleep', 'error');
+        }
+    });
+}
+
+function loadSleepTrends() {
+    fetch('/api/sleep/analytics')
+    .then(response => response.json())
+    .then(stats => {
+        if (!stats.nights) {
+            return;
+        }
+        const debt = stats.sleep_debt_hours;
+        document.getElementById('sleep-debt').textContent =
+            debt > 0 ? debt + 'h short of ' + stats.target_hours + 'h a night' : 'None';
+        document.getElementById('sleep-bedtime').textContent = stats.bedtime.mean === null ? '-' :
+            stats.bedtime.mean + ' (± ' + stats.bedtime.deviation_minutes + ' min)';
+        document.getElementById('sleep-consistency').textContent = stats.consistency_score + '/100';
+        const trend = stats.quality.trend_per_night;
+        document.getElementById('sleep-trend').textContent = trend === null ? '-' :
+            (trend > 0 ? 'Improving' : trend < 0 ? 'Declining' : 'Steady') +
+            ' (' + (trend > 0 ? '+' : '') + trend + ' a night)';
+        document.getElementById('sleep-nights').textContent = stats.nights;
+    });
+}
+
+// Patch the page regions a write changed instead of reloading the page
+function applyUpdate(update) {
+    if (!update) {
+        return;
+    }
+    Object.entries(update.html || {}).forEach(([id, html]) => {
+        document.getElementById(id).innerHTML = html;
+    });
+    Object.entries(update.text || {}).forEach(([id, text]) => {
+        document.getElementById(id).textContent = text;
+    });
+    Object.entries(update.width || {}).forEach(([id, percent]) => {
+        document.getElementById(id).style.width = percent + '%';
+    });
+}
+
+function showNotification(message, type = 'success') {
+    const notification = document.getElementById('notification');
+    notification.textContent = message;
+    notification.className = 'notification ' + type;
+    notification.classList.add('show');
+
+    setTimeout(() => {
+        notification.classList.remove('show');
+    }, 3000);
+}
+
+// Apply changes made on this user's other devices and tabs as they happen
+function listenForUpdates() {
+    if (!window.EventSource) {
+        return;
+    }
+    const source = new EventSource('/api/events');
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED) {
+            // Refused (the server's streams are all busy); try again later
+            setTimeout(listenForUpdates, 30000);
+        }
+    });
+    source.addEventListener('update', event => {
+        if (Object.keys(pendingPosts).length) {
+            // Local clicks not sent yet are newer; the reply to them will patch the page
+            return;
+        }
+        const message = JSON.parse(event.data);
+        currentData = message.current;
+        applyUpdate(message.update);
+    });
+}
+
+// Days end at midnight where the user is; tell the server which timezone that is
+function syncTimezone() {
+    const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
+    if (!timezone || currentData.profile.timezone === timezone) {
+        return Promise.resolve();
+    }
+    return fetch('/api/profile', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({timezone: timezone})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            currentData = data.current;
+            applyUpdate(data.update);
+        }
+    });
+}
+
+// A first visit's timezone is its first save, which starts its session;
+// the event stream opens after it so both use the same user
+syncTimezone().finally(listenForUpdates);
+
+function saveWeight(value) {
+    const weight = parseFloat(value);
+    if (!weight) {
+        return;
+    }
+    fetch('/api/profile', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({weight_kg: weight})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            showNotification(data.error, 'error');
+        } else if (data.success) {
+            currentData = data.current;
+            showNotification('Weight saved');
+        }
+    });
+}
+
+if (currentData.profile.weight_kg) {
+    document.getElementById('weight-kg').value = currentData.profile.weight_kg;
+}
+'''
+
+# Static page shell; {{name}} marks a per-user slot filled in by render_dashboard()
+PAGE_TEMPLATE = '''
 <!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>🌟 HealthyLife Pro</title>
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            line-height: 1.6;
-            color: #333;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-        }}
-
-        .container {{
-            max-width: 1400px;
-            margin: 0 auto;
-            padding: 20px;
-        }}
-
-        header {{
-            text-align: center;
-            margin-bottom: 40px;
-            color: white;
-        }}
-
-        header h1 {{
-            font-size: 3.5rem;
-            margin-bottom: 10px;
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-            animation: glow 2s ease-in-out infinite alternate;
-        }}
-
-        @keyframes glow {{
-            from {{ text-shadow: 2px 2px 4px rgba(0,0,0,0.3); }}
-            to {{ text-shadow: 2px 2px 20px rgba(255,255,255,0.5); }}
-        }}
-
-        .nav-tabs {{
-            display: flex;
-            justify-content: center;
-            flex-wrap: wrap;
-            gap: 15px;
-            margin-bottom: 30px;
-        }}
-
-        .tab-btn {{
-            background: rgba(255, 255, 255, 0.2);
-            border: 2px solid rgba(255, 255, 255, 0.3);
-            color: white;
-            padding: 15px 30px;
-            cursor: pointer;
-            border-radius: 50px;
-            font-size: 16px;
-            font-weight: 600;
-            transition: all 0.3s ease;
-            backdrop-filter: blur(10px);
-        }}
-
-        .tab-btn:hover, .tab-btn.active {{
-            background: rgba(255, 255, 255, 0.3);
-            border-color: rgba(255, 255, 255, 0.8);
-            transform: translateY(-3px);
-            box-shadow: 0 10px 25px rgba(0,0,0,0.2);
-        }}
-
-        .tab-content {{
-            display: none;
-            background: rgba(255, 255, 255, 0.95);
-            border-radius: 25px;
-            padding: 40px;
-            box-shadow: 0 25px 50px rgba(0,0,0,0.15);
-            backdrop-filter: blur(10px);
-        }}
-
-        .tab-content.active {{
-            display: block;
-            animation: slideIn 0.6s ease;
-        }}
-
-        @keyframes slideIn {{
-            from {{ opacity: 0; transform: translateY(30px); }}
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
-
-        .dashboard-grid {{
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(320px, 1fr));
-            gap: 25px;
-            margin-bottom: 30px;
-        }}
-
-        .card {{
-            background: linear-gradient(135deg, #f8fafc 0%, #e2e8f0 100%);
-            border-radius: 20px;
-            padding: 30px;
-            box-shadow: 0 15px 35px rgba(0,0,0,0.1);
-            transition: all 0.4s ease;
-            position: relative;
-            overflow: hidden;
-        }}
-
-        .card::before {{
-            content: '';
-            position: absolute;
-            top: 0;
-            left: 0;
-            right: 0;
-            height: 4px;
-            background: linear-gradient(90deg, #667eea, #764ba2);
-        }}
-
-        .card:hover {{
-            transform: translateY(-10px);
-            box-shadow: 0 25px 50px rgba(0,0,0,0.2);
-        }}
-
-        .card h3 {{
-            color: #4a5568;
-            margin-bottom: 20px;
-            font-size: 1.5rem;
-        }}
-
-        .progress-container {{
-            margin: 15px 0;
-        }}
-
-        .progress-bar {{
-            width: 100%;
-            height: 12px;
-            background: #e2e8f0;
-            border-radius: 6px;
-            overflow: hidden;
-            position: relative;
-        }}
-
-        .progress-fill {{
-            height: 100%;
-            background: linear-gradient(90deg, #667eea, #764ba2);
-            border-radius: 6px;
-            transition: width 0.8s ease;
-        }}
-
-        .water-tracker {{
-            display: flex;
-            gap: 8px;
-            flex-wrap: wrap;
-            margin-top: 15px;
-            justify-content: center;
-        }}
-
-        .water-glass {{
-            width: 40px;
-            height: 60px;
-            background: #e2e8f0;
-            border-radius: 0 0 20px 20px;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            border: 3px solid #667eea;
-            display: flex;
-            align-items: flex-end;
-            justify-content: center;
-            color: #667eea;
-            font-weight: bold;
-            font-size: 12px;
-            padding-bottom: 5px;
-        }}
-
-        .water-glass:hover {{
-            transform: scale(1.1);
-        }}
-
-        .water-glass.filled {{
-            background: linear-gradient(to top, #4facfe 0%, #00f2fe 100%);
-            color: white;
-        }}
-
-        .habit-item {{
-            background: white;
-            padding: 20px;
-            border-radius: 15px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            box-shadow: 0 5px 15px rgba(0,0,0,0.08);
-            margin-bottom: 15px;
-        }}
-
-        .habit-checkbox {{
-            width: 30px;
-            height: 30px;
-            border: 2px solid #667eea;
-            border-radius: 6px;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            transition: all 0.3s ease;
-            font-size: 18px;
-            font-weight: bold;
-        }}
-
-        .habit-checkbox.checked {{
-            background: #667eea;
-            color: white;
-        }}
-
-        .btn {{
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            padding: 15px 30px;
-            border-radius: 12px;
-            cursor: pointer;
-            font-size: 16px;
-            font-weight: 600;
-            transition: all 0.3s ease;
-            box-shadow: 0 5px 15px rgba(102, 126, 234, 0.4);
-        }}
-
-        .btn:hover {{
-            transform: translateY(-2px);
-            box-shadow: 0 10px 25px rgba(102, 126, 234, 0.6);
-        }}
-
-        .input-group {{
-            margin-bottom: 20px;
-        }}
-
-        .input-group label {{
-            display: block;
-            margin-bottom: 8px;
-            font-weight: 600;
-            color: #4a5568;
-        }}
-
-        .input-group input, .input-group select, .input-group textarea {{
-            width: 100%;
-            padding: 12px 15px;
-            border: 2px solid #e2e8f0;
-            border-radius: 10px;
-            font-size: 16px;
-            transition: all 0.3s ease;
-        }}
-
-        .input-group input:focus, .input-group select:focus, .input-group textarea:focus {{
-            outline: none;
-            border-color: #667eea;
-            box-shadow: 0 0 0 3px rgba(102, 126, 234, 0.1);
-        }}
-
-        .stats-grid {{
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-            gap: 20px;
-        }}
-
-        .stat-card {{
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 25px;
-            border-radius: 20px;
-            text-align: center;
-        }}
-
-        .stat-number {{
-            font-size: 2.5rem;
-            font-weight: bold;
-            margin-bottom: 10px;
-        }}
-
-        .notification {{
-            position: fixed;
-            top: 20px;
-            right: 20px;
-            background: #48bb78;
-            color: white;
-            padding: 15px 25px;
-            border-radius: 10px;
-            box-shadow: 0 10px 25px rgba(0,0,0,0.2);
-            transform: translateX(400px);
-            transition: transform 0.3s ease;
-            z-index: 1000;
-        }}
-
-        .notification.show {{
-            transform: translateX(0);
-        }}
-
-        .notification.error {{
-            background: #e53e3e;
-        }}
-
-        .meal-item, .exercise-item {{
-            background: rgba(255, 255, 255, 0.7);
-            padding: 15px;
-            margin: 10px 0;
-            border-radius: 10px;
-            border-left: 4px solid #667eea;
-        }}
-
-        @media (max-width: 768px) {{
-            .container {{ padding: 10px; }}
-            header h1 {{ font-size: 2.5rem; }}
-            .tab-content {{ padding: 20px; }}
-            .dashboard-grid {{ grid-template-columns: 1fr; }}
-        }}
-    </style>
+    <link rel="stylesheet" href="{{css_url}}">
 </head>
 <body>
     <div class="container">
@@ -466,42 +1067,42 @@ def index():
             <div class="dashboard-grid">
                 <div class="card">
                     <h3>💧 Hydration Tracker</h3>
-                    <p><strong>Today's Goal:</strong> <span id="water-count">{data['water_count']}</span>/8 glasses</p>
+                    <p><strong>Today's Goal:</strong> <span id="water-count">{{water_count}}</span>/8 glasses</p>
                     <div class="progress-container">
                         <div class="progress-bar">
-                            <div id="water-progress" class="progress-fill" style="width: {water_progress}%"></div>
+                            <div id="water-progress" class="progress-fill" style="width: {{water_progress}}%"></div>
                         </div>
                     </div>
                     <div class="water-tracker" id="water-glasses">
-                        {generate_water_glasses(data['water_count'])}
+                        {{water_glasses}}
                     </div>
                 </div>
 
                 <div class="card">
                     <h3>🎯 Today's Habits</h3>
                     <div id="habit-summary">
-                        {generate_habit_items(data['habits'])}
+                        {{habit_items}}
                     </div>
                 </div>
 
                 <div class="card">
                     <h3>🏃‍♂️ Activity Overview</h3>
-                    <p><strong>Exercises Today:</strong> <span id="exercise-count">{len(data['exercises'])}</span></p>
-                    <p><strong>Total Calories Burned:</strong> <span id="calories-burned">{exercise_calories}</span></p>
+                    <p><strong>Exercises Today:</strong> <span id="exercise-count">{{exercise_count}}</span></p>
+                    <p><strong>Total Calories Burned:</strong> <span id="calories-burned">{{exercise_calories}}</span></p>
                     <div class="progress-container">
                         <div class="progress-bar">
-                            <div id="activity-progress" class="progress-fill" style="width: {activity_progress}%"></div>
+                            <div id="activity-progress" class="progress-fill" style="width: {{activity_progress}}%"></div>
                         </div>
                     </div>
                 </div>
 
                 <div class="card">
                     <h3>🍽️ Nutrition Summary</h3>
-                    <p><strong>Meals Logged:</strong> <span id="meals-count">{len(data['meals'])}</span>/3</p>
-                    <p><strong>Calories Consumed:</strong> <span id="calories-consumed">{meal_calories}</span></p>
+                    <p><strong>Meals Logged:</strong> <span id="meals-count">{{meal_count}}</span>/3</p>
+                    <p><strong>Calories Consumed:</strong> <span id="calories-consumed">{{meal_calories}}</span></p>
                     <div class="progress-container">
                         <div class="progress-bar">
-                            <div id="nutrition-progress" class="progress-fill" style="width: {nutrition_progress}%"></div>
+                            <div id="nutrition-progress" class="progress-fill" style="width: {{nutrition_progress}}%"></div>
                         </div>
                     </div>
                 </div>
@@ -513,7 +1114,7 @@ def index():
             <div class="card">
                 <h3>✅ Daily Habits Tracker</h3>
                 <div id="habits-list">
-                    {generate_habit_items(data['habits'])}
+                    {{habit_items}}
                 </div>
                 <div style="margin-top: 30px;">
                     <div class="input-group">
@@ -539,6 +1140,12 @@ def index():
                             <option value="snack">Snack</option>
                         </select>
                     </div>
+                    <div class="input-group">
+                        <label>Find a Food:</label>
+                        <input type="text" id="food-search" placeholder="Search foods to add them with their calories"
+                               autocomplete="off" oninput="searchFoods()">
+                        <div id="food-results"></div>
+                    </div>
                     <div class="input-group">
                         <label>Food Items:</label>
                         <textarea id="meal-items" placeholder="List the foods you ate" rows="3"></textarea>
@@ -553,7 +1160,7 @@ def index():
                 <div class="card">
                     <h3>📊 Today's Nutrition</h3>
                     <div id="todays-meals">
-                        {generate_meal_items(data['meals'])}
+                        {{meal_items}}
                     </div>
                 </div>
             </div>
@@ -574,7 +1181,12 @@ def index():
                     </div>
                     <div class="input-group">
                         <label>Calories Burned:</label>
-                        <input type="number" id="exercise-calories" placeholder="Estimated calories">
+                        <input type="number" id="exercise-calories" placeholder="Leave blank to estimate from your weight">
+                    </div>
+                    <div class="input-group">
+                        <label>Your Weight (kg):</label>
+                        <input type="number" id="weight-kg" placeholder="Used to estimate calories burned"
+                               onchange="saveWeight(this.value)">
                     </div>
                     <button class="btn" onclick="logExercise()">Log Exercise</button>
                 </div>
@@ -582,7 +1194,7 @@ def index():
                 <div class="card">
                     <h3>🏃‍♂️ Today's Workouts</h3>
                     <div id="todays-exercises">
-                        {generate_exercise_items(data['exercises'])}
+                        {{exercise_items}}
                     </div>
                 </div>
             </div>
@@ -610,12 +1222,17 @@ def index():
                     </div>
                     <div>
                         <h4>Sleep Statistics</h4>
-                        <p><strong>Last Night:</strong> <span id="last-sleep">{sleep_display}</span></p>
+                        <p><strong>Last Night:</strong> <span id="last-sleep">{{sleep_display}}</span></p>
                         <div class="progress-container">
                             <div class="progress-bar">
-                                <div id="sleep-progress" class="progress-fill" style="width: {sleep_progress}%"></div>
+                                <div id="sleep-progress" class="progress-fill" style="width: {{sleep_progress}}%"></div>
                             </div>
                         </div>
+                        <h4>Recent Nights (<span id="sleep-nights">0</span>)</h4>
+                        <p><strong>Sleep Debt:</strong> <span id="sleep-debt">-</span></p>
+                        <p><strong>Usual Bedtime:</strong> <span id="sleep-bedtime">-</span></p>
+                        <p><strong>Consistency:</strong> <span id="sleep-consistency">-</span></p>
+                        <p><strong>Quality Trend:</strong> <span id="sleep-trend">-</span></p>
                     </div>
                 </div>
             </div>
@@ -625,19 +1242,19 @@ def index():
         <div id="analytics" class="tab-content">
             <div class="stats-grid">
                 <div class="stat-card">
-                    <div class="stat-number">{data['water_count']}</div>
+                    <div class="stat-number" id="stat-water">{{water_count}}</div>
                     <div class="stat-label">Daily Water (glasses)</div>
                 </div>
                 <div class="stat-card">
-                    <div class="stat-number">{1 if data['exercises'] else 0}</div>
+                    <div class="stat-number" id="stat-exercise">{{exercise_days}}</div>
                     <div class="stat-label">Exercise Days Today</div>
                 </div>
                 <div class="stat-card">
-                    <div class="stat-number">{habit_completion}%</div>
+                    <div class="stat-number" id="stat-habits">{{habit_completion}}%</div>
                     <div class="stat-label">Habit Completion Rate</div>
                 </div>
                 <div class="stat-card">
-                    <div class="stat-number">{exercise_calories}</div>
+                    <div class="stat-number" id="stat-calories">{{exercise_calories}}</div>
                     <div class="stat-label">Total Calories Burned</div>
                 </div>
             </div>
@@ -647,308 +1264,659 @@ def index():
     <div class="notification" id="notification"></div>
 
     <script>
-        let currentData = {json.dumps(data)};
-
-        function showTab(tabName) {{
-            document.querySelectorAll('.tab-content').forEach(tab => tab.classList.remove('active'));
-            document.querySelectorAll('.tab-btn').forEach(btn => btn.classList.remove('active'));
-            document.getElementById(tabName).classList.add('active');
-            event.target.classList.add('active');
-        }}
-
-        function toggleWaterGlass(index) {{
-            if (index < currentData.water_count) {{
-                currentData.water_count = index;
-            }} else {{
-                currentData.water_count = index + 1;
-            }}
-            
-            updateWaterDisplay();
-            
-            fetch('/api/water', {{
-                method: 'POST',
-                headers: {{'Content-Type': 'application/json'}},
-                body: JSON.stringify({{count: currentData.water_count}})
-            }})
-            .then(response => response.json())
-            .then(data => {{
-                if (data.success && currentData.water_count >= 8) {{
-                    showNotification('🎉 Congratulations! You have reached your daily water goal!');
-                }}
-            }});
-        }}
-
-        function updateWaterDisplay() {{
-            document.getElementById('water-count').textContent = currentData.water_count;
-            document.getElementById('water-progress').style.width = (currentData.water_count / 8 * 100) + '%';
-            
-            const glasses = document.querySelectorAll('.water-glass');
-            glasses.forEach((glass, index) => {{
-                if (index < currentData.water_count) {{
-                    glass.classList.add('filled');
-                }} else {{
-                    glass.classList.remove('filled');
-                }}
-            }});
-        }}
-
-        function toggleHabit(habitName) {{
-            currentData.habits[habitName] = !currentData.habits[habitName];
-            
-            const checkboxes = document.querySelectorAll('[onclick*="' + habitName + '"]');
-            checkboxes.forEach(checkbox => {{
-                if (currentData.habits[habitName]) {{
-                    checkbox.classList.add('checked');
-                    checkbox.textContent = '✓';
-                }} else {{
-                    checkbox.classList.remove('checked');
-                    checkbox.textContent = '';
-                }}
-            }});
-            
-            fetch('/api/habits', {{
-                method: 'POST',
-                headers: {{'Content-Type': 'application/json'}},
-                body: JSON.stringify(currentData.habits)
-            }})
-            .then(response => response.json())
-            .then(data => {{
-                if (data.success && currentData.habits[habitName]) {{
-                    showNotification('✅ Great job completing: ' + habitName.replace('_', ' ') + '!');
-                }}
-            }});
-        }}
-
-        function addNewHabit() {{
-            const input = document.getElementById('new-habit');
-            const habitName = input.value.trim().toLowerCase().replace(/\\s+/g, '_');
-            
-            if (habitName && !currentData.habits[habitName]) {{
-                currentData.habits[habitName] = false;
-                input.value = '';
-                
-                fetch('/api/habits', {{
-                    method: 'POST',
-                    headers: {{'Content-Type': 'application/json'}},
-                    body: JSON.stringify(currentData.habits)
-                }})
-                .then(response => response.json())
-                .then(data => {{
-                    if (data.success) {{
-                        showNotification('New habit added: ' + habitName.replace('_', ' ') + '!');
-                        location.reload();
-                    }}
-                }});
-            }} else if (currentData.habits[habitName]) {{
-                showNotification('Habit already exists!', 'error');
-            }}
-        }}
-
-        function logMeal() {{
-            const mealType = document.getElementById('meal-type').value;
-            const mealItems = document.getElementById('meal-items').value.trim();
-            const mealCalories = parseInt(document.getElementById('meal-calories').value);
-            
-            if (!mealItems || !mealCalories) {{
-                showNotification('Please fill in all meal information', 'error');
-                return;
-            }}
-            
-            fetch('/api/meals', {{
-                method: 'POST',
-                headers: {{'Content-Type': 'application/json'}},
-                body: JSON.stringify({{
-                    type: mealType,
-                    items: mealItems,
-                    calories: mealCalories
-                }})
-            }})
-            .then(response => response.json())
-            .then(data => {{
-                if (data.success) {{
-                    showNotification(mealType.charAt(0).toUpperCase() + mealType.slice(1) + ' logged successfully!');
-                    document.getElementById('meal-items').value = '';
-                    document.getElementById('meal-calories').value = '';
-                    location.reload();
-                }}
-            }});
-        }}
-
-        function logExercise() {{
-            const name = document.getElementById('exercise-name').value.trim();
-            const duration = parseInt(document.getElementById('exercise-duration').value);
-            const calories = parseInt(document.getElementById('exercise-calories').value);
-            
-            if (!name || !duration || !calories) {{
-                showNotification('Please fill in all exercise information', 'error');
-                return;
-            }}
-            
-            fetch('/api/exercises', {{
-                method: 'POST',
-                headers: {{'Content-Type': 'application/json'}},
-                body: JSON.stringify({{
-                    name: name,
-                    duration: duration,
-                    calories: calories
-                }})
-            }})
-            .then(response => response.json())
-            .then(data => {{
-                if (data.success) {{
-                    showNotification('Exercise "' + name + '" logged successfully!');
-                    document.getElementById('exercise-name').value = '';
-                    document.getElementById('exercise-duration').value = '';
-                    document.getElementById('exercise-calories').value = '';
-                    location.reload();
-                }}
-            }});
-        }}
-
-        function updateQualityValue(value) {{
-            document.getElementById('quality-value').textContent = value;
-        }}
-
-        function logSleep() {{
-            const bedtime = document.getElementById('bedtime').value;
-            const wakeTime = document.getElementById('wake-time').value;
-            const quality = parseInt(document.getElementById('sleep-quality').value);
-            
-            if (!bedtime || !wakeTime) {{
-                showNotification('Please enter both bedtime and wake time', 'error');
-                return;
-            }}
-            
-            fetch('/api/sleep', {{
-                method: 'POST',
-                headers: {{'Content-Type': 'application/json'}},
-                body: JSON.stringify({{
-                    bedtime: bedtime,
-                    wake_time: wakeTime,
-                    quality: quality
-                }})
-            }})
-            .then(response => response.json())
-            .then(data => {{
-                if (data.success) {{
-                    showNotification('Sleep logged: ' + data.sleep_data.duration + 'h with quality ' + quality + '/10');
-                    location.reload();
-                }} else {{
-                    showNotification(data.error || 'Error logging sleep', 'error');
-                }}
-            }});
-        }}
-
-        function showNotification(message, type = 'success') {{
-            const notification = document.getElementById('notification');
-            notification.textContent = message;
-            notification.className = 'notification ' + type;
-            notification.classList.add('show');
-            
-            setTimeout(() => {{
-                notification.classList.remove('show');
-            }}, 3000);
-        }}
+        let currentData = {{current_data}};
     </script>
+    <script src="{{js_url}}"></script>
 </body>
 </html>
 '''
-    return html_content
+
+_SLOT_RE = re.compile(r'\{\{(\w+)\}\}')
+
+def compile_page(template, **static):
+    """Split a page template into pre-encoded chunks around its named slots
+
+    Slots named in `static` are filled in once here rather than per render.
+    """
+    template = _SLOT_RE.sub(lambda m: str(static.get(m.group(1), m.group(0))), template)
+    parts = _SLOT_RE.split(template)
+    chunks = tuple(part.encode('utf-8') for part in parts[0::2])
+    slots = tuple(parts[1::2])
+    return chunks, slots
+
+def render_page(page, values):
+    """Fill a compiled page's slots and return the encoded body"""
+    chunks, slots = page
+    encoded = {name: str(value).encode('utf-8') for name, value in values.items()}
+    out = [chunks[0]]
+    for slot, chunk in zip(slots, chunks[1:]):
+        out.append(encoded[slot])
+        out.append(chunk)
+    return b''.join(out)
+
+CSS_ASSET = StaticAsset('app.css', PAGE_CSS, 'text/css; charset=utf-8')
+JS_ASSET = StaticAsset('app.js', PAGE_JS, 'application/javascript; charset=utf-8')
+ASSETS = build_assets(CSS_ASSET, JS_ASSET)
+STATIC_SLOTS = {'css_url': CSS_ASSET.url, 'js_url': JS_ASSET.url}
+
+# Compiled once at import time so a request only pays for its own fragments
+PAGE_SHELL = compile_page(PAGE_TEMPLATE, **STATIC_SLOTS)
+
+# In every per-user ETag, so new page markup or report code is never answered with a 304
+RESPONSE_TAG = source_tag(__file__, aggregates.__file__,
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analytics.py'),
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sleep.py'))
+
+def dashboard_stats(data):
+    """Compute the dashboard numbers shown around the rendered fragments"""
+    totals = data.totals
+    water_progress = int(data.water_count / 8 * 100)
+    exercise_calories = totals['calories_burned']
+    activity_progress = min(int(exercise_calories / 500 * 100), 100)
+    nutrition_progress = min(int(totals['meal_count'] / 3 * 100), 100)
+    meal_calories = totals['calories_eaten']
+    
+    completed_habits = totals['habits_completed']
+    total_habits = len(data.habits)
+    habit_completion = int(completed_habits / total_habits * 100) if total_habits > 0 else 0
+    
+    sleep_progress = 0
+    sleep_display = 'No data'
+    sleep = data.sleep_data
+    if sleep and sleep.duration:
+        sleep_progress = min(int(sleep.duration / 8 * 100), 100)
+        sleep_display = f"{sleep.duration}h (Quality: {sleep.quality}/10)"
+    
+    return {
+        'water_count': data.water_count,
+        'water_progress': water_progress,
+        'exercise_count': len(data.exercises),
+        'exercise_calories': exercise_calories,
+        'activity_progress': activity_progress,
+        'meal_count': totals['meal_count'],
+        'meal_calories': meal_calories,
+        'nutrition_progress': nutrition_progress,
+        'sleep_display': sleep_display,
+        'sleep_progress': sleep_progress,
+        'exercise_days': 1 if data.exercises else 0,
+        'habit_completion': habit_completion,
+    }
+
+def dashboard_values(data, user_id=None):
+    """Compute the per-user slot values for the dashboard page
+
+    With a user_id, section fragments come from the fragment cache.
+    """
+    values = dashboard_stats(data)
+    for section, (_, render) in FRAGMENTS.items():
+        if user_id is None:
+            html = render(data)
+        else:
+            html = fragment_cache.get(user_id, section, data.version, lambda: render(data))
+        values[FRAGMENT_SLOTS[section]] = html
+    values['current_data'] = json.dumps(data.to_json())
+    return values
+
+# Element ids patched by applyUpdate() in the page script, per dashboard stat
+STAT_TEXT_IDS = {
+    'water-count': 'water_count',
+    'exercise-count': 'exercise_count',
+    'calories-burned': 'exercise_calories',
+    'meals-count': 'meal_count',
+    'calories-consumed': 'meal_calories',
+    'last-sleep': 'sleep_display',
+    'stat-water': 'water_count',
+    'stat-exercise': 'exercise_days',
+    'stat-calories': 'exercise_calories',
+}
+STAT_WIDTH_IDS = {
+    'water-progress': 'water_progress',
+    'activity-progress': 'activity_progress',
+    'nutrition-progress': 'nutrition_progress',
+    'sleep-progress': 'sleep_progress',
+}
+
+# Fragment renderers per section, and the element ids each one fills
+FRAGMENTS = {
+    'water': (('water-glasses',), lambda data: generate_water_glasses(data.water_count)),
+    'habits': (('habit-summary', 'habits-list'), lambda data: generate_habit_items(data.habits)),
+    'meals': (('todays-meals',), lambda data: generate_meal_items(data.meals)),
+    'exercises': (('todays-exercises',), lambda data: generate_exercise_items(data.exercises)),
+}
+# The page slot each section fills
+FRAGMENT_SLOTS = {'water': 'water_glasses', 'habits': 'habit_items', 'meals': 'meal_items',
+                  'exercises': 'exercise_items'}
+
+def dashboard_update(data, *sections):
+    """Build the DOM patch for a write: re-rendered sections plus fresh stats"""
+    stats = dashboard_stats(data)
+    html = {}
+    for section in sections:
+        element_ids, render = FRAGMENTS[section]
+        fragment = render(data)
+        for element_id in element_ids:
+            html[element_id] = fragment
+    text = {element_id: stats[key] for element_id, key in STAT_TEXT_IDS.items()}
+    text['stat-habits'] = f"{stats['habit_completion']}%"
+    width = {element_id: stats[key] for element_id, key in STAT_WIDTH_IDS.items()}
+    return {'html': html, 'text': text, 'width': width}
+
+def live_event(data, *sections):
+    """Encoded event telling open dashboards about a change"""
+    return json.dumps({'update': dashboard_update(data, *sections), 'current': data.to_json()},
+                      separators=(',', ':'))
+
+@timed_render
+def render_dashboard(data, user_id=None):
+    """Render the dashboard page for one user's data, reusing their cached fragments"""
+    return render_page(PAGE_SHELL, dashboard_values(data, user_id))
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Per-route latency, status and sizes for /metrics"""
+    if metrics.enabled:
+        elapsed = time.perf_counter() - g.request_start
+        # One proxy lookup instead of one per attribute
+        current = request._get_current_object()
+        rule = current.url_rule
+        labels = (('route', rule.rule if rule else 'unmatched'), ('method', current.method))
+        metrics.observe('request_duration_seconds', labels, elapsed)
+        metrics.inc('requests_total', labels + (('status', response.status_code),))
+        metrics.observe('request_size_bytes', labels, int(current.environ.get('CONTENT_LENGTH') or 0))
+        if not response.is_streamed:
+            metrics.observe('response_size_bytes', labels, len(response.get_data()))
+    return response
+
+# Registered after the metrics hook so it runs first and sizes are recorded compressed
+@app.after_request
+def compress_response(response):
+    """Compress larger HTML, JSON and text bodies for clients that accept it"""
+    accept_encoding = request.headers.get('Accept-Encoding')
+    if (not accept_encoding or response.status_code != 200 or response.is_streamed
+            or not compressible(response.mimetype) or 'Content-Encoding' in response.headers):
+        return response
+    encoding, body = compress_body(response.get_data(), accept_encoding)
+    if encoding != 'identity':
+        # The identity body suits every client, so only compressed ones need Vary
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+    return response
+
+def not_modified(etag):
+    """304 reply for a client whose copy is current"""
+    return Response(status=304, headers={'ETag': etag, 'Cache-Control': REVALIDATE_CACHE_CONTROL,
+                                         'Vary': 'Accept-Encoding'})
+
+@app.route('/')
+def index():
+    """Main page with embedded HTML, CSS, and JavaScript"""
+    with view_user_data() as data:
+        # Unchanged since the client's copy: skip rendering altogether
+        etag = user_etag(current_user_id(), data.version, RESPONSE_TAG)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return not_modified(etag)
+        page = render_dashboard(data, current_user_id())
+    return Response(page, mimetype='text/html',
+                    headers={'ETag': etag, 'Cache-Control': REVALIDATE_CACHE_CONTROL})
+
+@app.route('/assets/<filename>')
+def static_asset(filename):
+    """Serve a fingerprinted stylesheet or script"""
+    asset = ASSETS.get(filename)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    
+    headers = {'Cache-Control': IMMUTABLE_CACHE_CONTROL, 'Vary': 'Accept-Encoding'}
+    encoding, body = asset.select(request.headers.get('Accept-Encoding'))
+    headers['ETag'] = asset.etag(encoding)
+    if asset.matches(request.headers.get('If-None-Match')):
+        return Response(status=304, headers=headers)
+    
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(body, content_type=asset.content_type, headers=headers)
+
+def invalid(error):
+    """400 response for an entry that failed validation"""
+    return jsonify({'error': str(error)}), 400
+
+# Writes shared with asgi.py. Each validates a request body, raising
+# ValueError, and returns (change, reply, sections) for edit_user_data: the
+# change to the user's data, the reply built from the saved data and the
+# sections the change re-renders.
+
+def water_write(payload):
+    """Set today's water count"""
+    water = validate_water(payload)
+    def change(data):
+        data.water_count = water['count']
+    def reply(data):
+        return {'success': True, 'water_count': data.water_count,
+                'update': dashboard_update(data)}
+    return change, reply, ('water',)
+
+def habits_write(payload):
+    """Tick or untick habits"""
+    changes = validate_habits({'habits': payload})['habits']
+    def change(data):
+        aggregates.update_habits(data, changes)
+    def reply(data):
+        return {'success': True, 'habits': dict(data.habits),
+                'update': dashboard_update(data, 'habits')}
+    return change, reply, ('habits',)
+
+def meal_write(payload):
+    """Log a meal"""
+    new_meal = Meal.from_json(payload)
+    def change(data):
+        new_meal.timestamp = rollover.clock(data.profile.get('timezone'))
+        aggregates.add_meal(data, new_meal)
+    def reply(data):
+        return {'success': True, 'meals': [meal.to_json() for meal in data.meals],
+                'update': dashboard_update(data, 'meals')}
+    return change, reply, ('meals',)
+
+def exercise_write(payload):
+    """Log an exercise, estimating its calories from its MET value if none are given"""
+    new_exercise = Exercise.from_json(payload)
+    estimated = new_exercise.calories is None
+    if estimated and met_table.lookup(new_exercise.name) is None:
+        raise ValueError(f'No MET value for "{new_exercise.name}"; enter the calories burned')
+    def change(data):
+        new_exercise.timestamp = rollover.clock(data.profile.get('timezone'))
+        if estimated:
+            new_exercise.calories = None
+        met_table.fill_calories([new_exercise], data.profile.get('weight_kg'))
+        aggregates.add_exercise(data, new_exercise)
+    def reply(data):
+        return {'success': True, 'exercises': [ex.to_json() for ex in data.exercises],
+                'estimated': estimated, 'update': dashboard_update(data, 'exercises')}
+    return change, reply, ('exercises',)
+
+def sleep_write(payload):
+    """Log a night's sleep"""
+    sleep = Sleep.from_json(payload)
+    def change(data):
+        aggregates.add_sleep(data, sleep)
+    def reply(data):
+        return {'success': True, 'sleep_data': sleep.to_json(),
+                'update': dashboard_update(data)}
+    return change, reply, ()
+
+def profile_write(payload):
+    """Change the user's settings; a new timezone can end the day, so every section may change"""
+    changes = validate_profile(payload)
+    def change(data):
+        data.profile.update(changes)
+    def reply(data):
+        return {'success': True, 'profile': dict(data.profile),
+                'current': data.to_json(), 'update': dashboard_update(data, *FRAGMENTS)}
+    return change, reply, tuple(FRAGMENTS)
+
+def write_response(write):
+    """Reply to a write: validate the body with write() and apply its change"""
+    try:
+        change, reply, sections = write(request.json)
+    except ValueError as error:
+        return invalid(error)
+    return jsonify(edit_user_data(change, reply, sections))
 
 @app.route('/api/water', methods=['POST'])
 def update_water():
     """Update water count"""
-    data = get_user_data()
-    request_data = request.json
-    data['water_count'] = request_data.get('count', 0)
-    return jsonify({'success': True, 'water_count': data['water_count']})
+    return write_response(water_write)
 
 @app.route('/api/habits', methods=['POST'])
 def update_habits():
     """Update habits"""
-    data = get_user_data()
-    data['habits'].update(request.json)
-    return jsonify({'success': True, 'habits': data['habits']})
+    return write_response(habits_write)
 
 @app.route('/api/meals', methods=['POST'])
 def add_meal():
     """Add a meal"""
-    data = get_user_data()
-    new_meal = request.json
-    new_meal['timestamp'] = datetime.now().strftime('%H:%M')
-    
-    # Remove existing meal of same type
-    data['meals'] = [m for m in data['meals'] if m.get('type') != new_meal.get('type')]
-    data['meals'].append(new_meal)
-    
-    return jsonify({'success': True, 'meals': data['meals']})
+    return write_response(meal_write)
 
 @app.route('/api/exercises', methods=['POST'])
 def add_exercise():
-    """Add an exercise"""
-    data = get_user_data()
-    new_exercise = request.json
-    new_exercise['timestamp'] = datetime.now().strftime('%H:%M')
-    data['exercises'].append(new_exercise)
-    
-    return jsonify({'success': True, 'exercises': data['exercises']})
+    """Add an exercise, estimating its calories from its MET value if none are given"""
+    return write_response(exercise_write)
 
 @app.route('/api/sleep', methods=['POST'])
 def add_sleep():
     """Add sleep data"""
-    data = get_user_data()
-    sleep_data = request.json
+    return write_response(sleep_write)
+
+def sleep_log_from_history(days, data):
+    """Recent-nights log from sealed (day, record) pairs and today's sleep"""
+    nights = []
+    for day, record in days:
+        if record.get('sleep_data'):
+            try:
+                nights.append((day, Sleep.from_json(record['sleep_data'])))
+            except ValueError:
+                continue
+    if data.sleep_data is not None:
+        nights.append((data.last_updated, data.sleep_data))
+    return SleepLog.from_nights(nights)
+
+def sleep_history_span(today):
+    """First and last sealed day a recent-nights log is built from"""
+    return shift_day(today, -SLEEP_HISTORY_DAYS), shift_day(today, -1)
+
+def sleep_log_change(days):
+    """Change building a user's recent-nights log from their sealed (day, record) pairs"""
+    def change(data):
+        data.sleep_log = sleep_log_from_history(days, data)
+    return change
+
+def sleep_report(data):
+    """Recent-nights stats against the user's nightly sleep target"""
+    return data.sleep_log.stats(data.profile.get('sleep_target_hours', TARGET_HOURS))
+
+@app.route('/api/sleep/analytics')
+def get_sleep_analytics():
+    """Sleep debt, bedtime and wake-time regularity and quality trend over recent nights"""
+    user_id = current_user_id()
+    with user_locks(user_id):
+        data = load_user_data(user_id)
+        if data.sleep_log is None:
+            # Built from history once; after that each logged night updates it
+            days = storage.load_days(user_id, *sleep_history_span(data.last_updated))
+            data = edit_user_data(sleep_log_change(days))
+        etag = user_etag(user_id, data.version, RESPONSE_TAG, 'sleep')
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return not_modified(etag)
+        stats = sleep_report(data)
     
+    response = jsonify(stats)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    return response
+
+@app.route('/api/foods')
+def food_search():
+    """Foods matching ?q= with their calories per portion, for meal logging"""
     try:
-        bedtime = sleep_data['bedtime']
-        wake_time = sleep_data['wake_time']
-        
-        bed_hour, bed_min = map(int, bedtime.split(':'))
-        wake_hour, wake_min = map(int, wake_time.split(':'))
-        
-        bed_total = bed_hour * 60 + bed_min
-        wake_total = wake_hour * 60 + wake_min
-        
-        if wake_total < bed_total:
-            wake_total += 24 * 60
-        
-        duration = round((wake_total - bed_total) / 60.0, 1)
-        sleep_data['duration'] = duration
-        
-        data['sleep_data'] = sleep_data
-        
-        return jsonify({'success': True, 'sleep_data': sleep_data})
-    except (ValueError, KeyError):
-        return jsonify({'error': 'Invalid time format'}), 400
+        limit = min(max(int(request.args.get('limit', 8)), 1), MAX_RESULTS)
+    except ValueError:
+        return invalid('limit must be a whole number')
+    foods = search_foods(request.args.get('q', ''), limit)
+    response = jsonify({'foods': [food.to_json() for food in foods]})
+    # Answers only depend on the bundled food list
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+@app.route('/api/profile', methods=['GET', 'POST'])
+def user_profile():
+    """Get or change the user's settings: their timezone, weight and nightly sleep target"""
+    if request.method == 'GET':
+        with view_user_data() as data:
+            return jsonify({'profile': dict(data.profile)})
+    
+    return write_response(profile_write)
 
-@app.route('/api/analytics')
-def get_analytics():
-    """Get analytics data"""
-    data = get_user_data()
+def parse_window(value):
+    """Rolling window in days from ?window=, raising ValueError if invalid"""
+    try:
+        window = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid window') from None
+    if not 1 <= window <= MAX_RANGE_DAYS:
+        raise ValueError(f'Window must be 1 to {MAX_RANGE_DAYS} days')
+    return window
+
+def sealed_span(today, window):
+    """First and last sealed day an analytics request reads (at least a week)"""
+    return shift_day(today, -(max(window, 7) - 1)), shift_day(today, -1)
+
+def analytics_report(data, sealed, window):
+    """Analytics for today's data plus the (day, rollup) pairs sealed before it"""
+    # Sealed rollups for the earlier days plus the live one for today
+    today = data.last_updated
+    rollups = dict(sealed)
+    rollups[today] = live_rollup(data)
+    weekly = summarize(rollups, today, 7)
     
-    completed_habits = sum(1 for completed in data['habits'].values() if completed)
-    total_habits = len(data['habits'])
+    completed_habits = data.totals['habits_completed']
+    total_habits = len(data.habits)
     completion_rate = (completed_habits / total_habits * 100) if total_habits > 0 else 0
     
-    total_calories_burned = sum(ex.get('calories', 0) for ex in data['exercises'])
-    exercise_days = 1 if data['exercises'] else 0
+    total_calories_burned = data.totals['calories_burned']
     
-    analytics = {
-        'weekly_water': data['water_count'],
-        'weekly_exercise': exercise_days,
+    return {
+        'weekly_water': weekly['totals']['water_count'],
+        'weekly_exercise': weekly['exercise_days'],
         'habit_completion': round(completion_rate),
-        'total_calories': total_calories_burned
+        'total_calories': total_calories_burned,
+        'rolling': summarize(rollups, today, window)
     }
+
+@app.route('/api/analytics')
+def get_analytics():
+    """Get analytics data, with rolling stats over ?window= days (default 7)"""
+    try:
+        window = parse_window(request.args.get('window', 7))
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    
+    with view_user_data() as data:
+        etag = user_etag(current_user_id(), data.version, RESPONSE_TAG, window)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return not_modified(etag)
+        sealed = storage.load_rollups(current_user_id(), *sealed_span(data.last_updated, window))
+        analytics = analytics_report(data, sealed, window)
+    
+    response = jsonify(analytics)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    return response
+
+def requested_range(today, default_days, max_days=None):
+    """Validated (start, end) day keys from ?start= and ?end=, oldest first"""
+    end = request.args.get('end', today)
+    start = request.args.get('start') or shift_day(end, -(default_days - 1))
+    span = (parse_day(end) - parse_day(start)).days
+    if span < 0 or (max_days is not None and span >= max_days):
+        raise ValueError(f'Range must cover 1 to {max_days} days' if max_days
+                         else 'start must not be after end')
+    return start, end
+
+@app.route('/api/history')
+def get_history():
+    """Get logged days between ?start= and ?end= (YYYY-MM-DD, inclusive)"""
+    with view_user_data() as data:
+        today = data.last_updated
+        live = seal_day(data)
+    try:
+        start, end = requested_range(today, 7, MAX_RANGE_DAYS)
+    except (TypeError, ValueError) as error:
+        return jsonify({'error': str(error)}), 400
+    
+    days = [expand_day(day, record)
+            for day, record in storage.load_days(current_user_id(), start, end)]
+    if start <= today <= end:
+        days.append(expand_day(today, live))
+    
+    return jsonify({'start': start, 'end': end, 'days': days})
+
+def log_entry(data, kind, entry):
+    """Apply a validated entry to today's data"""
+    if kind == 'meal':
+        aggregates.add_meal(data, entry)
+    elif kind == 'exercise':
+        aggregates.add_exercise(data, entry)
+    elif kind == 'sleep':
+        aggregates.add_sleep(data, entry)
+    elif kind == 'water':
+        data.water_count = entry['count']
+    elif kind == 'habits':
+        aggregates.update_habits(data, entry['habits'])
+
+@app.route('/api/import', methods=['POST'])
+def import_entries():
+    """Bulk-import NDJSON meals, exercises, sleep, water and habits"""
+    user_data = get_user_data()
+    today = user_data.last_updated
+    weight_kg = user_data.profile.get('weight_kg')
+    
+    def commit(batch):
+        # Exercises imported without calories get them in one pass per batch
+        met_table.fill_calories([entry for entries in batch.values()
+                                 for kind, entry in entries if kind == 'exercise'], weight_kg)
+        todays_entries = batch.pop(today, None)
+        
+        def change(data):
+            if any(kind == 'sleep' for entries in batch.values() for kind, _ in entries):
+                # Past nights changed; the recent-nights log is rebuilt from history
+                data.sleep_log = None
+            for kind, entry in todays_entries or ():
+                log_entry(data, kind, entry)
+        # Saved even with nothing for today: past days feed analytics, so it needs a
+        # new version. Past days land with that save or, if it keeps conflicting, not at all.
+        try:
+            edit_user_data(change, sections=FRAGMENTS, days=batch)
+        except SaveConflict:
+            raise BatchNotSaved('Other changes to your data kept getting in first; '
+                                'send these lines again') from None
     
-    return jsonify(analytics)
+    summary = import_stream(request.stream, today, commit, mets=met_table)
+    return jsonify({'success': not summary['failed'], **summary})
+
+@app.route('/api/export')
+def export_entries():
+    """Stream history between ?start= and ?end= as NDJSON (default: 10 years)"""
+    user_id = current_user_id()
+    with view_user_data() as data:
+        today = data.last_updated
+        live = (today, seal_day(data))
+    try:
+        start, end = requested_range(today, 3653)
+    except (TypeError, ValueError) as error:
+        return jsonify({'error': str(error)}), 400
+    
+    lines = export_stream(lambda first, last: storage.load_days(user_id, first, last),
+                          start, end, live)
+    return Response(lines, mimetype='application/x-ndjson', headers={
+        'Content-Disposition': 'attachment; filename="healthylife-export.ndjson"'
+    })
+
+@app.route('/api/events')
+def live_events():
+    """Stream this user's dashboard changes as server-sent events"""
+    user_id = current_user_id()
+    subscription = broker.subscribe(user_id)
+    if subscription is None:
+        return jsonify({'error': 'Too many open event streams'}), 429, {'Retry-After': '30'}
+    
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = subscription.next(EVENT_KEEPALIVE_SECONDS)
+                if event is RESYNC:
+                    # Missed events: send the whole dashboard instead
+                    with user_locks(user_id):
+                        event = live_event(load_user_data(user_id), *FRAGMENTS)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield f'event: update\ndata: {event}\n\n'
+        finally:
+            broker.unsubscribe(subscription)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def is_admin_request():
+    """Only requests carrying HEALTHYLIFE_ADMIN_TOKEN may see server internals
+
+    With no token configured the admin routes stay off: behind a local
+    reverse proxy every request would come from 127.0.0.1.
+    """
+    token = os.environ.get('HEALTHYLIFE_ADMIN_TOKEN')
+    if not token:
+        return False
+    expected = token.encode('utf-8')
+    offered = (request.headers.get('X-Admin-Token', ''),
+               request.headers.get('Authorization', '').removeprefix('Bearer '))
+    # Constant-time, so response timing doesn't reveal how much of a guess was right
+    return any(hmac.compare_digest(value.encode('utf-8'), expected) for value in offered)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request, render and storage timings in Prometheus text format"""
+    if not is_admin_request():
+        return jsonify({'error': 'Not found'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/stats')
+def admin_stats():
+    """Counters from the storage layer, live events, rollover sweeps and the fragment cache"""
+    if not is_admin_request():
+        return jsonify({'error': 'Not found'}), 404
+    stats = {
+        'storage': {'backend': type(storage).__name__},
+        'events': {'subscribers': broker.subscriber_count()},
+        'rollover': rollovers.stats(),
+        'fragments': fragment_cache.stats(),
+    }
+    if hasattr(storage, 'stats'):
+        stats['storage'].update(storage.stats())
+    return jsonify(stats)
+
+def parse_args(argv=None):
+    """Command-line options; production settings can also come from the environment"""
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description='HealthyLife Pro')
+    parser.add_argument('--production', action='store_true',
+                        default=env('HEALTHYLIFE_MODE') == 'production',
+                        help='multi-worker server instead of the debug dev server')
+    parser.add_argument('--host', default=env('HEALTHYLIFE_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(env('HEALTHYLIFE_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(env('HEALTHYLIFE_WORKERS', 2)),
+                        help='worker processes (production)')
+    parser.add_argument('--threads', type=int, default=int(env('HEALTHYLIFE_THREADS', 4)),
+                        help='threads per worker, at least 2 (production)')
+    parser.add_argument('--keepalive', type=int, default=int(env('HEALTHYLIFE_KEEPALIVE', 5)),
+                        help='seconds to hold idle keep-alive connections open (production)')
+    parser.add_argument('--timeout', type=int, default=30,
+                        help='restart a worker stuck on one request this long (production)')
+    parser.add_argument('--graceful-timeout', type=int, default=30,
+                        help='seconds workers get to finish requests on reload or stop (production)')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='recycle each worker after this many requests, 0 for never (production)')
+    return parser.parse_args(argv)
 
 def main():
     """Run the application"""
+    args = parse_args()
+    if args.production:
+        try:
+            check_shared_state(storage, session_store, args.workers, broker)
+        except ValueError as error:
+            raise SystemExit(f"❌ {error}")
+        if args.threads < 2:
+            raise SystemExit("❌ Live event streams each hold a thread, so a worker needs "
+                             "at least 2 (--threads 2) to keep serving other requests")
+        # Live event streams may take at most half of each worker's threads
+        os.environ.setdefault('HEALTHYLIFE_EVENT_STREAMS', str(args.threads // 2))
+        print(f"🚀 HealthyLife Pro (production): {args.workers} workers x {args.threads} threads "
+              f"on http://{args.host}:{args.port}")
+        serve('app:app', host=args.host, port=args.port, workers=args.workers,
+              threads=args.threads, keepalive=args.keepalive, timeout=args.timeout,
+              graceful_timeout=args.graceful_timeout, max_requests=args.max_requests)
+        return
+    
     print("🌟 Starting HealthyLife Pro Web Application...")
     print("🚀 Server starting...")
     print("\n" + "="*60)
     print("🌐 HealthyLife Pro is now running!")
-    print("📍 Open your browser and go to: http://localhost:5000")
+    print(f"📍 Open your browser and go to: http://localhost:{args.port}")
     print("\n💡 Features available:")
     print("   • 💧 Water intake tracking (click the glasses!)")
     print("   • ✅ Daily habits management")
@@ -961,8 +1929,8 @@ def main():
     print("🎯 Data resets daily for fresh tracking")
     print("=" * 60 + "\n")
     
-    # Run the Flask app
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Run the Flask dev server (reloader and debugger on; local use only)
+    app.run(debug=True, host=args.host, port=args.port)
 
 if __name__ == '__main__':
     main()
@@ -979,14 +1947,42 @@ if __name__ == '__main__':
 3. RUN the application:
    python app.py
 
+   Optional: pip install brotli   (smaller CSS/JS downloads)
+   Optional: keep data across restarts and workers with SQLite:
+   HEALTHYLIFE_STORAGE=sqlite:///healthylife.db python app.py
+   PRODUCTION: pre-fork workers with gunicorn (pip install gunicorn);
+   several workers need shared storage, so pair them with SQLite:
+   HEALTHYLIFE_STORAGE=sqlite:///healthylife.db python app.py --production --workers 4 --threads 8
+   (or HEALTHYLIFE_MODE=production; kill -HUP <master pid> reloads gracefully)
+
+   Sessions follow HEALTHYLIFE_STORAGE unless HEALTHYLIFE_SESSIONS says otherwise
+   (memory:// or sqlite:///sessions.db); each browser gets its own user, saved
+   from its first change, and stored sessions expire along with their cookie.
+
+   Optional: batch SQLite saves from quick runs of clicks (single worker):
+   HEALTHYLIFE_WRITE_BEHIND=0.25 HEALTHYLIFE_WRITE_BATCH=500 (see /api/admin/stats)
+   Optional: cache active users in front of SQLite (single worker), dropping
+   the least recently used and anyone idle for the TTL in seconds:
+   HEALTHYLIFE_CACHE_USERS=10000 HEALTHYLIFE_CACHE_TTL=900
+   In-memory storage keeps at most 100000 users (or HEALTHYLIFE_CACHE_USERS).
+
+   Each user's day ends at midnight in their browser's timezone (saved to
+   /api/profile on first visit). Active users' days are started in the
+   background every HEALTHYLIFE_ROLLOVER_SWEEP seconds (30; 0 leaves it to requests).
+   Dashboard sections are cached as rendered HTML until they change
+   (HEALTHYLIFE_FRAGMENT_CACHE=20000 entries; hit rates in /api/admin/stats).
+
+   Optional: async server for many long-lived connections (pip install uvicorn):
+   uvicorn asgi:application --port 5000
+
 4. OPEN your browser:
    Go to: http://localhost:5000
 
 5. START TRACKING:
    ✅ Click water glasses to track hydration
    ✅ Toggle habits on/off
-   ✅ Log meals and exercises
-   ✅ Track sleep quality
+   ✅ Log meals (search the built-in food list for calories) and exercises
+   ✅ Track sleep quality, debt and bedtime regularity
    ✅ View real-time analytics
 
 🎉 FEATURES:
@@ -1007,9 +2003,42 @@ if __name__ == '__main__':
 - Water intake tracking (8 glasses daily goal)
 - Customizable habit management
 - Meal logging with calorie counting
-- Exercise tracking with duration/calories
+- Exercise tracking with duration/calories (estimated from MET values and your weight if left blank)
 - Sleep monitoring with quality rating
 - Analytics dashboard with progress stats
-
-Data automatically resets each day for fresh daily tracking!
+- Day-by-day history: GET /api/history?start=YYYY-MM-DD&end=YYYY-MM-DD
+- Rolling analytics: GET /api/analytics?window=7 (or 30, 90, ...)
+- Sleep analytics: GET /api/sleep/analytics (debt, bedtime regularity, quality trend)
+- Bulk NDJSON import/export: POST /api/import, GET /api/export
+- Live updates across devices: GET /api/events (server-sent events). Each
+  --production worker serves at most threads/2 streams (HEALTHYLIFE_EVENT_STREAMS),
+  so it needs --threads 2 or more; uvicorn asgi:application serves them without
+  holding a thread each. Events reach other workers through HEALTHYLIFE_EVENTS
+  (default: HEALTHYLIFE_STORAGE)
+- Prometheus metrics and server counters: GET /metrics, GET /api/admin/stats
+  (off unless HEALTHYLIFE_ADMIN_TOKEN is set; send it as a Bearer token)
+- Population stats across all users (pip install numpy):
+  HEALTHYLIFE_STORAGE=sqlite:///healthylife.db python batch_analytics.py
+
+📏 BENCHMARKS:
+   python bench.py suite      # every route: req/s, p50/p90/p99, memory per request
+                              # (--json out.json, then --compare out.json on a later commit)
+   python bench.py render     # dashboard renders/sec, before vs after
+   python bench.py fragments  # dashboard renders with the fragment cache on/off
+   python bench.py assets     # bytes per reload with cached CSS/JS
+   python bench.py totals     # running totals agree with raw entries
+   python bench.py analytics  # rolling analytics latency, a year of history
+   python bench.py batch      # population analytics over a million user-days
+   python bench.py memory     # per-record memory, dicts vs slotted records
+   python bench.py stress     # many threads, every /api/* route, no lost updates
+   python bench.py load       # Flask vs ASGI req/sec and p99 (pip install uvicorn)
+   python bench.py writes     # SQLite rows written for click bursts, write-behind on/off
+   python bench.py soak       # flat memory and cache hit rate as new users keep arriving
+   python bench.py wire       # bytes on the wire for a recorded session, gzip/br and ETags
+   python bench.py foods      # food search index load time and autocomplete latency
+   python bench.py met        # MET lookups and bulk exercise calorie estimates
+   python bench.py sleep      # per-night sleep stats update vs rescanning the window
+   python bench.py metrics    # per-request overhead of the /metrics instrumentation
+
+Each day starts fresh, and finished days are kept in your history!
 """
\ No newline at end of file
@@ -0,0 +1,432 @@
+"""
+HealthyLife Pro - ASGI entry point
+Serves the dashboard and the /api/water, /api/habits, /api/meals,
+/api/exercises, /api/sleep, /api/sleep/analytics, /api/profile, /api/foods,
+/api/analytics and /api/events
+contracts of app.py from an asyncio event loop, so long-lived keep-alive
+connections and live event streams cost no thread each.
+Storage calls go through AsyncStorage and never block the loop.
+Validation, changes and replies are app.py's own (its *_write functions and
+reply builders); this module only awaits locks and storage around them.
+
+Run with: pip install uvicorn && uvicorn asgi:application --port 8000
+Sessions are shared with the Flask app through its session store.
+"""
+
+import asyncio
+import json
+import uuid
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from werkzeug.http import dump_cookie
+
+import app
+from events import RESYNC
+from foods import MAX_RESULTS, search_foods
+from locks import AsyncUserLocks
+from responses import (REVALIDATE_CACHE_CONTROL, compress_body, compressible, etag_matches,
+                       user_etag)
+from rollover import RolloverScheduler
+from sessions import SESSION_ID_RE, SESSION_LIFETIME, MemorySessionStore, new_session_id
+from storage import AsyncStorage, SaveConflict
+
+MAX_BODY_BYTES = 64 * 1024
+
+storage = AsyncStorage(app.storage)
+user_locks = AsyncUserLocks()
+rollovers = RolloverScheduler()
+SESSION_COOKIE = app.app.config['SESSION_COOKIE_NAME']
+
+class Request:
+    """The parts of an HTTP request the handlers need"""
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {name.decode('latin-1'): value.decode('latin-1')
+                        for name, value in scope['headers']}
+        self.args = {key: values[0] for key, values in
+                     parse_qs(scope['query_string'].decode('latin-1')).items()}
+        self.body = body
+        self.user_id = None
+        self.new_user = False
+        self.new_session_id = None
+
+    async def open_session(self):
+        """Find the session's user, or give a new visitor an id until their first change"""
+        cookie = SimpleCookie(self.headers.get('cookie', ''))
+        session_id = cookie[SESSION_COOKIE].value if SESSION_COOKIE in cookie else None
+        if session_id and SESSION_ID_RE.match(session_id):
+            data = await session_call(app.session_store.load, session_id)
+            if data and data.get('user_id'):
+                self.user_id = data['user_id']
+                return
+        self.user_id = uuid.uuid4().hex
+        self.new_user = True
+
+    async def remember_user(self):
+        """Start a session for a new visitor whose data has just been saved"""
+        if self.new_user and self.new_session_id is None:
+            self.new_session_id = new_session_id()
+            await session_call(app.session_store.save, self.new_session_id,
+                               {'user_id': self.user_id})
+
+    def json(self):
+        """The body parsed as JSON, raising ValueError if it is not"""
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise ValueError('Invalid JSON') from None
+
+class Response:
+    """Status, headers and body of a reply"""
+
+    def __init__(self, body=b'', status=200, content_type=None, headers=None):
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.status = status
+        self.headers = dict(headers or {})
+        if content_type:
+            self.headers['Content-Type'] = content_type
+
+class EventStream:
+    """A reply streaming a subscription's events until the client goes away"""
+
+    def __init__(self, subscription):
+        self.subscription = subscription
+
+async def session_call(func, *args):
+    """Call the session store, off the event loop unless it is in memory"""
+    if isinstance(app.session_store, MemorySessionStore):
+        return func(*args)
+    return await storage.run(func, *args)
+
+def json_response(payload, status=200):
+    """JSON reply, encoded the way Flask's jsonify does"""
+    return Response(app.app.json.dumps(payload, separators=(',', ':')) + '\n', status,
+                    'application/json')
+
+def invalid(error):
+    """400 reply for an entry that failed validation"""
+    return json_response({'error': str(error)}, 400)
+
+def not_modified(etag):
+    """304 reply for a client whose copy is current"""
+    return Response(status=304, headers={'ETag': etag, 'Cache-Control': REVALIDATE_CACHE_CONTROL,
+                                         'Vary': 'Accept-Encoding'})
+
+def compress_response(request, response):
+    """Compress larger HTML, JSON and text bodies for clients that accept it"""
+    accept_encoding = request.headers.get('accept-encoding')
+    if (not accept_encoding or response.status != 200 or 'Content-Encoding' in response.headers
+            or not compressible(response.headers.get('Content-Type'))):
+        return response
+    encoding, response.body = compress_body(response.body, accept_encoding)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+async def save_user_data(user_id, data):
+    """Async twin of app.save_user_data"""
+    data.version += 1
+    await storage.save(user_id, data)
+
+async def retry_conflicts(attempt):
+    """Async twin of app.retry_conflicts"""
+    for _ in range(app.SAVE_ATTEMPTS - 1):
+        try:
+            return await attempt()
+        except SaveConflict:
+            continue
+    return await attempt()
+
+async def load_user_data(user_id):
+    """Async twin of app.load_user_data; callers must hold the user's lock"""
+    async def attempt():
+        data = await storage.load(user_id)
+        if data is None:
+            return app.new_user_data()
+        return await refresh_user_data(user_id, data)
+    return await retry_conflicts(attempt)
+
+async def refresh_user_data(user_id, data):
+    """Async twin of app.refresh_user_data; callers must hold the user's lock"""
+    changed, sealed = app.advance_day(data)
+    if sealed:
+        await storage.seal_day(user_id, *sealed)
+    if changed:
+        await save_user_data(user_id, data)
+
+    rollovers.track(user_id, data.profile.get('timezone'), data.last_updated)
+    return data
+
+async def roll_over_user(user_id):
+    """Start a tracked user's new day ahead of their next request"""
+    async with user_locks(user_id):
+        data = await storage.load(user_id)
+        if data is None:
+            rollovers.forget(user_id)
+            return
+        day = data.last_updated
+        try:
+            await refresh_user_data(user_id, data)
+        except SaveConflict:
+            return
+        if data.last_updated != day and app.broker.has_subscribers(user_id):
+            app.broker.publish(user_id, app.live_event(data, *app.FRAGMENTS), data.version)
+
+async def sweep_rollovers(interval):
+    """Background task rolling users over shortly after their midnight"""
+    while True:
+        await asyncio.sleep(interval)
+        await rollovers.sweep_async(roll_over_user)
+
+async def edit_user_data(request, change, reply=None, sections=()):
+    """Async twin of app.edit_user_data, for the request's user"""
+    async with user_locks(request.user_id):
+        result = await change_user_data(request.user_id, change, reply, sections)
+    await request.remember_user()
+    return result
+
+async def change_user_data(user_id, change, reply=None, sections=()):
+    """The body of edit_user_data; callers must hold the user's lock, which is not re-entrant"""
+    async def attempt():
+        data = await load_user_data(user_id)
+        change(data)
+        _, sealed = app.advance_day(data)
+        if sealed:
+            await storage.seal_day(user_id, *sealed)
+        version = data.version
+        await save_user_data(user_id, data)
+        return data, version
+
+    data, version = await retry_conflicts(attempt)
+    rollovers.track(user_id, data.profile.get('timezone'), data.last_updated)
+    app.fragment_cache.advance(user_id, version, data.version,
+                               [section for section in app.FRAGMENTS if section not in sections])
+    result = data if reply is None else reply(data)
+    if app.broker.has_subscribers(user_id):
+        app.broker.publish(user_id, app.live_event(data, *sections), data.version)
+    return result
+
+def write_handler(write):
+    """Handler for one of app.py's writes"""
+    async def handler(request):
+        try:
+            change, reply, sections = write(request.json())
+        except ValueError as error:
+            return invalid(error)
+        return json_response(await edit_user_data(request, change, reply, sections))
+    handler.__doc__ = write.__doc__
+    return handler
+
+async def index(request):
+    """Main page"""
+    async with user_locks(request.user_id):
+        data = await load_user_data(request.user_id)
+        etag = user_etag(request.user_id, data.version, app.RESPONSE_TAG)
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return not_modified(etag)
+        page = app.render_dashboard(data, request.user_id)
+    return Response(page, content_type='text/html; charset=utf-8',
+                    headers={'ETag': etag, 'Cache-Control': REVALIDATE_CACHE_CONTROL})
+
+async def static_asset(request):
+    """Serve a fingerprinted stylesheet or script"""
+    asset = app.ASSETS.get(request.path[len('/assets/'):])
+    if asset is None:
+        return json_response({'error': 'Not found'}, 404)
+
+    headers = {'Cache-Control': app.IMMUTABLE_CACHE_CONTROL, 'Vary': 'Accept-Encoding'}
+    encoding, body = asset.select(request.headers.get('accept-encoding'))
+    headers['ETag'] = asset.etag(encoding)
+    if asset.matches(request.headers.get('if-none-match')):
+        return Response(status=304, headers=headers)
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(body, content_type=asset.content_type, headers=headers)
+
+async def get_sleep_analytics(request):
+    """Sleep debt, bedtime and wake-time regularity and quality trend over recent nights"""
+    async with user_locks(request.user_id):
+        data = await load_user_data(request.user_id)
+        if data.sleep_log is None:
+            days = await storage.load_days(request.user_id,
+                                           *app.sleep_history_span(data.last_updated))
+            data = await change_user_data(request.user_id, app.sleep_log_change(days))
+        etag = user_etag(request.user_id, data.version, app.RESPONSE_TAG, 'sleep')
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return not_modified(etag)
+        stats = app.sleep_report(data)
+    response = json_response(stats)
+    response.headers.update({'ETag': etag, 'Cache-Control': REVALIDATE_CACHE_CONTROL})
+    return response
+
+async def food_search(request):
+    """Foods matching ?q= with their calories per portion, for meal logging"""
+    try:
+        limit = min(max(int(request.args.get('limit', 8)), 1), MAX_RESULTS)
+    except ValueError:
+        return invalid('limit must be a whole number')
+    # The first search reads the small food file; later ones are in-memory lookups
+    foods = search_foods(request.args.get('q', ''), limit)
+    response = json_response({'foods': [food.to_json() for food in foods]})
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+async def user_profile(request):
+    """Get the user's settings"""
+    async with user_locks(request.user_id):
+        data = await load_user_data(request.user_id)
+        return json_response({'profile': dict(data.profile)})
+
+async def get_analytics(request):
+    """Get analytics data, with rolling stats over ?window= days (default 7)"""
+    try:
+        window = app.parse_window(request.args.get('window', 7))
+    except ValueError as error:
+        return invalid(error)
+
+    async with user_locks(request.user_id):
+        data = await load_user_data(request.user_id)
+        etag = user_etag(request.user_id, data.version, app.RESPONSE_TAG, window)
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return not_modified(etag)
+        sealed = await storage.load_rollups(request.user_id,
+                                            *app.sealed_span(data.last_updated, window))
+        analytics = app.analytics_report(data, sealed, window)
+    response = json_response(analytics)
+    response.headers.update({'ETag': etag, 'Cache-Control': REVALIDATE_CACHE_CONTROL})
+    return response
+
+async def live_events(request):
+    """Stream this user's dashboard changes as server-sent events"""
+    subscription = app.broker.subscribe(request.user_id, asyncio.get_running_loop())
+    if subscription is None:
+        response = json_response({'error': 'Too many open event streams'}, 429)
+        response.headers['Retry-After'] = '30'
+        return response
+    return EventStream(subscription)
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def send_events(send, receive, request, stream):
+    """Send an EventStream's events, and keep-alives between them, until the client leaves"""
+    subscription = stream.subscription
+    disconnected = asyncio.create_task(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while True:
+            waiter = asyncio.ensure_future(subscription.next_async(app.EVENT_KEEPALIVE_SECONDS))
+            await asyncio.wait({waiter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                waiter.cancel()
+                return
+            event = waiter.result()
+            if event is RESYNC:
+                # Missed events: send the whole dashboard instead
+                async with user_locks(request.user_id):
+                    event = app.live_event(await load_user_data(request.user_id), *app.FRAGMENTS)
+            chunk = ': keep-alive\n\n' if event is None else f'event: update\ndata: {event}\n\n'
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'),
+                        'more_body': True})
+    finally:
+        disconnected.cancel()
+        app.broker.unsubscribe(subscription)
+
+ROUTES = {
+    ('GET', '/'): index,
+    ('POST', '/api/water'): write_handler(app.water_write),
+    ('POST', '/api/habits'): write_handler(app.habits_write),
+    ('POST', '/api/meals'): write_handler(app.meal_write),
+    ('POST', '/api/exercises'): write_handler(app.exercise_write),
+    ('POST', '/api/sleep'): write_handler(app.sleep_write),
+    ('GET', '/api/sleep/analytics'): get_sleep_analytics,
+    ('GET', '/api/foods'): food_search,
+    ('GET', '/api/profile'): user_profile,
+    ('POST', '/api/profile'): write_handler(app.profile_write),
+    ('GET', '/api/analytics'): get_analytics,
+    ('GET', '/api/events'): live_events,
+}
+
+def route(method, path):
+    """The handler for a request, or a 404/405 reply"""
+    if path.startswith('/assets/'):
+        handler = static_asset if method == 'GET' else None
+    else:
+        handler = ROUTES.get((method, path))
+    if handler is None:
+        if any(known == path for _, known in ROUTES) or path.startswith('/assets/'):
+            return json_response({'error': 'Method not allowed'}, 405)
+        return json_response({'error': 'Not found'}, 404)
+    return handler
+
+async def read_body(receive):
+    """The request body, or None if it is larger than MAX_BODY_BYTES"""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def send_response(send, response, request=None):
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+               for name, value in response.headers.items()]
+    headers.append((b'content-length', str(len(response.body)).encode('latin-1')))
+    if request is not None and request.new_session_id:
+        cookie = dump_cookie(SESSION_COOKIE, request.new_session_id, max_age=SESSION_LIFETIME,
+                             path='/', httponly=True, samesite='Lax')
+        headers.append((b'set-cookie', cookie.encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response.body})
+
+async def application(scope, receive, send):
+    """ASGI callable"""
+    if scope['type'] == 'lifespan':
+        sweeper = None
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if app.ROLLOVER_SWEEP_SECONDS > 0:
+                    sweeper = asyncio.create_task(sweep_rollovers(app.ROLLOVER_SWEEP_SECONDS))
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if sweeper is not None:
+                    sweeper.cancel()
+                storage.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    handler = route(scope['method'], scope['path'])
+    if isinstance(handler, Response):
+        await send_response(send, handler)
+        return
+    body = await read_body(receive)
+    if body is None:
+        await send_response(send, json_response({'error': 'Request body too large'}, 413))
+        return
+
+    request = Request(scope, body)
+    if handler not in (static_asset, food_search):
+        await request.open_session()
+    response = await handler(request)
+    if isinstance(response, EventStream):
+        await send_events(send, receive, request, response)
+        return
+    await send_response(send, compress_response(request, response), request)
@@ -0,0 +1,97 @@
+"""
+HealthyLife Pro - Static assets
+Content-hashed assets with precompressed variants computed once at startup
+"""
+
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Preferred order when a client accepts several encodings
+ENCODINGS = ('br', 'gzip', 'identity')
+
+# Fingerprinted URLs never change content, so clients may cache them forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def compress(body, encoding):
+    """Compress a body with the given content-coding"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=11)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    return body
+
+def available_encodings():
+    """Content-codings this process can produce"""
+    return tuple(e for e in ENCODINGS if e != 'br' or brotli is not None)
+
+def negotiate_encoding(accept_encoding, offered):
+    """Pick the best of `offered` for an Accept-Encoding header value"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+
+    for encoding in offered:
+        if encoding == 'identity':
+            return encoding
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > 0:
+            return encoding
+    return 'identity'
+
+class StaticAsset:
+    """One fingerprinted asset with its encoded variants"""
+
+    def __init__(self, name, body, content_type):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        stem, _, ext = name.rpartition('.')
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.filename = f'{stem}.{self.digest}.{ext}'
+        self.url = f'/assets/{self.filename}'
+        self.content_type = content_type
+        self.variants = {}
+        for encoding in available_encodings():
+            encoded = compress(body, encoding)
+            # Only keep a compressed variant when it actually saves bytes
+            if encoding == 'identity' or len(encoded) < len(body):
+                self.variants[encoding] = encoded
+
+    def etag(self, encoding):
+        """Strong ETag for one encoded representation"""
+        if encoding == 'identity':
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{encoding}"'
+
+    def matches(self, if_none_match):
+        """Whether an If-None-Match header names any of our representations"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        tags = {tag.strip() for tag in if_none_match.split(',')}
+        return any(self.etag(encoding) in tags for encoding in self.variants)
+
+    def select(self, accept_encoding):
+        """Return (encoding, body) for a request's Accept-Encoding"""
+        encoding = negotiate_encoding(accept_encoding, tuple(self.variants))
+        return encoding, self.variants[encoding]
+
+def build_assets(*assets):
+    """Index assets by fingerprinted filename"""
+    return {asset.filename: asset for asset in assets}
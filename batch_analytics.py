@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+HealthyLife Pro - Population analytics
+Loads every user's daily rollups into columnar NumPy arrays and computes
+cohort-level stats in vectorized passes.
+
+Run with: HEALTHYLIFE_STORAGE=sqlite:///healthylife.db python batch_analytics.py
+Requires: pip install numpy
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from analytics import (BURNED, HABITS_DONE, HABITS_TOTAL, ROLLUP_FIELDS, SLEEP_HOURS,
+                       SLEEP_QUALITY, WATER, WATER_GOAL)
+from storage import create_storage
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+
+class RollupColumns:
+    """All users' rollups as one row per user-day"""
+
+    def __init__(self, users, user_index, days, values):
+        self.users = users            # user ids, position = user index
+        self.user_index = user_index  # int32 user index per row
+        self.days = days              # datetime64[D] per row
+        self.values = values          # float32, one column per ROLLUP_FIELDS entry
+
+    def __len__(self):
+        return len(self.user_index)
+
+    def column(self, index):
+        """One rollup field for every row"""
+        return self.values[:, index]
+
+def load_columns(storage, batch_size=100000):
+    """Read every sealed rollup from storage into columnar arrays"""
+    user_ids = {}
+    index_parts, day_parts, value_parts = [], [], []
+    for batch in storage.iter_rollups(batch_size):
+        index_parts.append(np.fromiter(
+            (user_ids.setdefault(user_id, len(user_ids)) for user_id, _, _ in batch),
+            dtype=np.int32, count=len(batch)))
+        day_parts.append(np.array([day for _, day, _ in batch], dtype='datetime64[D]'))
+        value_parts.append(np.array([rollup for _, _, rollup in batch], dtype=np.float32))
+
+    if not value_parts:
+        return RollupColumns([], np.empty(0, np.int32), np.empty(0, 'datetime64[D]'),
+                             np.empty((0, len(ROLLUP_FIELDS)), np.float32))
+    return RollupColumns(list(user_ids), np.concatenate(index_parts),
+                         np.concatenate(day_parts), np.concatenate(value_parts))
+
+def _percentiles(values):
+    if not len(values):
+        return {f'p{p}': 0.0 for p in PERCENTILES}
+    points = np.percentile(values, PERCENTILES)
+    return {f'p{p}': round(float(v), 1) for p, v in zip(PERCENTILES, points)}
+
+def _mean(values):
+    return round(float(values.mean(dtype=np.float64)), 2) if len(values) else 0.0
+
+def cohort_stats(columns):
+    """Population-level hydration, sleep, exercise and habit stats"""
+    water = columns.column(WATER)
+    sleep_hours = columns.column(SLEEP_HOURS)
+    sleep_quality = columns.column(SLEEP_QUALITY)
+    burned = columns.column(BURNED)
+    done = columns.column(HABITS_DONE)
+    total = columns.column(HABITS_TOTAL)
+
+    nights = sleep_hours > 0
+    active = burned > 0
+
+    # Per-user habit adherence: completed / tracked habits over all their days
+    user_count = len(columns.users)
+    user_done = np.bincount(columns.user_index, weights=done, minlength=user_count)
+    user_total = np.bincount(columns.user_index, weights=total, minlength=user_count)
+    tracked = user_total > 0
+    adherence = user_done[tracked] / user_total[tracked] * 100
+
+    glasses = np.clip(water, 0, WATER_GOAL).astype(np.int64)
+    histogram = np.bincount(glasses, minlength=WATER_GOAL + 1)
+
+    return {
+        'users': user_count,
+        'user_days': len(columns),
+        'hydration': {
+            'mean_glasses': _mean(water),
+            'goal_met_rate': round(float((water >= WATER_GOAL).mean()) * 100, 1) if len(water) else 0.0,
+            'distribution': {(f'{g}+' if g == WATER_GOAL else str(g)): int(n)
+                             for g, n in enumerate(histogram)},
+        },
+        'sleep': {
+            'nights': int(nights.sum()),
+            'mean_hours': _mean(sleep_hours[nights]),
+            'mean_quality': _mean(sleep_quality[nights]),
+            'hours': _percentiles(sleep_hours[nights]),
+        },
+        'exercise': {
+            'active_days': int(active.sum()),
+            'calories': _percentiles(burned[active]),
+        },
+        'habits': {
+            'completion_rate': round(float(done.sum(dtype=np.float64) / total.sum(dtype=np.float64)) * 100, 1)
+                               if total.sum() else 0.0,
+            'user_adherence': _percentiles(adherence),
+        },
+    }
+
+def main():
+    """Print cohort stats for every user in the configured store"""
+    parser = argparse.ArgumentParser(description='HealthyLife Pro population analytics')
+    parser.add_argument('--storage', default=os.environ.get('HEALTHYLIFE_STORAGE', 'memory://'),
+                        help='storage URL, e.g. sqlite:///healthylife.db')
+    parser.add_argument('--batch-size', type=int, default=100000)
+    args = parser.parse_args()
+
+    storage = create_storage(args.storage)
+    try:
+        columns = load_columns(storage, args.batch_size)
+    finally:
+        storage.close()
+    print(json.dumps(cohort_stats(columns), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1057 @@
+#!/usr/bin/env python3
+"""
+HealthyLife Pro - Benchmarks
+Run with: python bench.py [suite|render|fragments|assets|totals|analytics|batch|memory|stress|load|writes|soak|wire|foods|met|sleep|metrics]
+"""
+
+import argparse
+import asyncio
+import gc
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import aggregates
+import app
+from analytics import WINDOWS, rollup_day
+from foods import FoodIndex, normalize
+from history import seal_day, shift_day
+from met import MetTable
+from records import DayState, Exercise, Meal, Sleep
+from rollover import RolloverScheduler
+from sleep import SleepLog
+from storage import MemoryStorage, SQLiteStorage, create_storage
+
+MEAL_TYPES = ['breakfast', 'lunch', 'dinner', 'snack']
+EXERCISE_NAMES = ['Running', 'Cycling', 'Swimming', 'Push-ups', 'Yoga', 'Walking']
+EXTRA_HABITS = ['stretching', 'journaling', 'no_sugar', 'walk_outside', 'floss']
+
+def synthetic_user_json(rng):
+    """One user's data, as plain JSON, with a random amount of logged activity"""
+    habits = {
+        'meditation': False,
+        'exercise': False,
+        'reading': False,
+        'water_intake': False,
+        'healthy_eating': False
+    }
+    for habit in rng.sample(EXTRA_HABITS, rng.randint(0, len(EXTRA_HABITS))):
+        habits[habit] = False
+    for habit in habits:
+        habits[habit] = rng.random() < 0.5
+
+    meals = [
+        {'type': meal_type, 'items': 'oats, banana, coffee', 'calories': rng.randint(150, 900),
+         'timestamp': f'{rng.randint(6, 21):02d}:{rng.randint(0, 59):02d}'}
+        for meal_type in rng.sample(MEAL_TYPES, rng.randint(0, len(MEAL_TYPES)))
+    ]
+    exercises = [
+        {'name': rng.choice(EXERCISE_NAMES), 'duration': rng.randint(10, 90),
+         'calories': rng.randint(50, 700),
+         'timestamp': f'{rng.randint(6, 21):02d}:{rng.randint(0, 59):02d}'}
+        for _ in range(rng.randint(0, 6))
+    ]
+    sleep_data = {}
+    if rng.random() < 0.7:
+        sleep_data = {'bedtime': '23:00', 'wake_time': '07:00',
+                      'quality': rng.randint(1, 10), 'duration': 8.0}
+
+    return {
+        'water_count': rng.randint(0, 8),
+        'habits': habits,
+        'meals': meals,
+        'exercises': exercises,
+        'sleep_data': sleep_data,
+        'last_updated': '2024-01-01'
+    }
+
+def synthetic_user(rng):
+    """Build one user's day state with a random amount of logged activity"""
+    data = DayState.from_json(synthetic_user_json(rng))
+    data.totals = aggregates.rebuild_totals(data)
+    return data
+
+def synthetic_population(size, seed=0):
+    """Build a reproducible list of synthetic users"""
+    rng = random.Random(seed)
+    return [synthetic_user(rng) for _ in range(size)]
+
+def legacy_renderer():
+    """Per-request full-page formatting, equivalent to the old f-string in index()"""
+    source = app.PAGE_TEMPLATE.replace('{', '{{').replace('}', '}}')
+    source = re.sub(r'\{\{\{\{(\w+)\}\}\}\}', r'{\1}', source)
+
+    def render(data):
+        return source.format(**app.STATIC_SLOTS, **app.dashboard_values(data)).encode('utf-8')
+    return render
+
+def measure(render, users, rounds):
+    """Return renders/sec for rendering every user `rounds` times"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for data in users:
+            render(data)
+    elapsed = time.perf_counter() - start
+    return rounds * len(users) / elapsed
+
+def bench_render(args):
+    """Compare dashboard renders/sec before and after the precompiled shell"""
+    users = synthetic_population(args.users)
+    legacy = legacy_renderer()
+    assert all(legacy(data) == app.render_dashboard(data) for data in users)
+
+    before = measure(legacy, users, args.rounds)
+    after = measure(app.render_dashboard, users, args.rounds)
+    print(f"Rendered {args.users} synthetic users x {args.rounds} rounds")
+    print(f"  before (full-page format): {before:10.0f} renders/sec")
+    print(f"  after  (precompiled shell): {after:10.0f} renders/sec")
+    print(f"  speedup: {after / before:.2f}x")
+
+def bench_fragments(args):
+    """Dashboard renders with and without the fragment cache, one write between views"""
+    rng = random.Random(args.seed)
+    population = synthetic_population(args.users)
+    store = MemoryStorage()
+    for user, data in enumerate(population):
+        store.save(f'fragments_{user}', data)
+    sections = ['water', 'habits', 'meals', 'exercises']
+    # The same sequence of views, each after a write touching one section
+    views = [(rng.randrange(args.users), rng.choice(sections)) for _ in range(args.views)]
+
+    print(f"{args.views} dashboard renders over {args.users} synthetic users,"
+          f" each after a write to one section")
+    for label, max_entries in (('uncached', 0), ('fragment cache', args.max_entries)):
+        cache = app.FragmentCache(max_entries)
+        original, app.fragment_cache = app.fragment_cache, cache
+        try:
+            start = time.perf_counter()
+            for user, section in views:
+                user_id = f'fragments_{user}'
+                data = store.load(user_id)
+                # What edit_user_data does for a write to `section`
+                data.version += 1
+                cache.advance(user_id, data.version - 1, data.version,
+                              [other for other in sections if other != section])
+                app.render_dashboard(data, user_id)
+            elapsed = time.perf_counter() - start
+        finally:
+            app.fragment_cache = original
+        rates = ', '.join(f"{name} {stats['hit_rate']:.0%}"
+                          for name, stats in sorted(cache.stats()['sections'].items())
+                          if stats['hit_rate'] is not None)
+        print(f"  {label:15s} {elapsed / args.views * 1e6:7.1f} us/render  {rates}")
+
+def bench_assets(args):
+    """Compare bytes per dashboard reload with inline versus cached assets"""
+    users = synthetic_population(args.users)
+    page = sum(len(app.render_dashboard(data)) for data in users) / len(users)
+    assets = app.ASSETS.values()
+    inline = page + sum(len(asset.variants['identity']) for asset in assets)
+
+    print(f"Average over {args.users} synthetic users")
+    print(f"  inline CSS/JS per reload:  {inline:10.0f} bytes")
+    print(f"  cached assets per reload:  {page:10.0f} bytes ({inline / page:.1f}x fewer)")
+    for asset in assets:
+        sizes = ', '.join(f'{enc} {len(body)}' for enc, body in asset.variants.items())
+        print(f"  {asset.filename}: {sizes}")
+
+def bench_totals(args):
+    """Replay random writes through the running totals and verify them"""
+    rng = random.Random(1)
+    users = synthetic_population(args.users)
+    start = time.perf_counter()
+    for _ in range(args.writes):
+        data = rng.choice(users)
+        action = rng.randrange(3)
+        if action == 0:
+            aggregates.add_meal(data, Meal(rng.choice(MEAL_TYPES), 'rice',
+                                           rng.randint(100, 900), '12:00'))
+        elif action == 1:
+            aggregates.add_exercise(data, Exercise(rng.choice(EXERCISE_NAMES), 30,
+                                                   rng.randint(50, 700), '18:00'))
+        else:
+            habit = rng.choice(list(data.habits) + EXTRA_HABITS)
+            aggregates.update_habits(data, {habit: rng.random() < 0.5})
+    elapsed = time.perf_counter() - start
+
+    broken = [problems for problems in map(aggregates.check_totals, users) if problems]
+    print(f"Applied {args.writes} writes across {args.users} users in {elapsed:.3f}s")
+    print(f"  users with inconsistent totals: {len(broken)}")
+    if broken:
+        print(f"  first mismatch: {broken[0]}")
+        raise SystemExit(1)
+
+def percentile(samples, pct):
+    """The pct-th percentile of a list of samples"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def bench_analytics(args):
+    """Latency of /api/analytics windows for a user with a year of SQLite history"""
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStorage(os.path.join(tmp, 'bench.db'))
+        original, app.storage = app.storage, store
+        try:
+            client = app.app.test_client()
+            user_id = 'analytics_user'
+            with client.session_transaction() as sess:
+                sess['user_id'] = user_id
+            # Reads no longer save a new visitor; a write creates the user
+            client.post('/api/water', json={'count': 1})
+            data = store.load(user_id)
+            if data is None:
+                raise SystemExit(f'{user_id} was not saved by their first write')
+            today = data.last_updated
+            for offset in range(1, args.days + 1):
+                record = seal_day(synthetic_user(rng))
+                store.seal_day(user_id, shift_day(today, -offset), record, rollup_day(record))
+
+            print(f"/api/analytics with {args.days} days of SQLite history")
+            for window in WINDOWS:
+                samples = []
+                for _ in range(args.requests):
+                    start = time.perf_counter()
+                    client.get(f'/api/analytics?window={window}')
+                    samples.append((time.perf_counter() - start) * 1000)
+                print(f"  window={window:3d}: p50 {percentile(samples, 50):6.2f} ms"
+                      f"  p99 {percentile(samples, 99):6.2f} ms")
+        finally:
+            app.storage = original
+            store.close()
+
+def bench_batch(args):
+    """Load and summarize a synthetic population with the NumPy batch job"""
+    import batch_analytics
+
+    rng = random.Random(3)
+    store = MemoryStorage()
+    templates = [rollup_day(seal_day(synthetic_user(rng))) for _ in range(1000)]
+    days = [shift_day('2024-01-01', offset) for offset in range(args.days)]
+    for user in range(args.users):
+        store.rollups[f'user-{user}'] = {day: rng.choice(templates) for day in days}
+
+    start = time.perf_counter()
+    columns = batch_analytics.load_columns(store)
+    loaded = time.perf_counter()
+    batch_analytics.cohort_stats(columns)
+    done = time.perf_counter()
+    print(f"{len(columns)} user-days from {args.users} users")
+    print(f"  load into columns: {loaded - start:7.2f} s")
+    print(f"  cohort stats:      {done - loaded:7.2f} s")
+
+def traced_size(build):
+    """Bytes still allocated by build()'s result, and the result itself"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size, result
+
+def bench_memory(args):
+    """Memory per record and per user: raw JSON dicts versus slotted records"""
+    rng = random.Random(4)
+    population = [synthetic_user_json(rng) for _ in range(args.users)]
+    meals = [meal for user in population for meal in user['meals']]
+    exercises = [ex for user in population for ex in user['exercises']]
+
+    rows = [
+        ('meal', len(meals),
+         lambda: [dict(meal) for meal in meals],
+         lambda: [Meal.from_json(meal) for meal in meals]),
+        ('exercise', len(exercises),
+         lambda: [dict(ex) for ex in exercises],
+         lambda: [Exercise.from_json(ex) for ex in exercises]),
+        ('user day', len(population),
+         lambda: [json.loads(json.dumps(user)) for user in population],
+         lambda: [DayState.from_json(user) for user in population]),
+    ]
+    print(f"Memory for {args.users} synthetic users")
+    for name, count, as_dicts, as_records in rows:
+        dict_bytes, _ = traced_size(as_dicts)
+        record_bytes, _ = traced_size(as_records)
+        print(f"  {name:9s} dict {dict_bytes / count:7.0f} B"
+              f"  slotted {record_bytes / count:7.0f} B"
+              f"  ({1 - record_bytes / dict_bytes:.0%} smaller)")
+
+def stress_worker(client, thread_id, rounds, statuses):
+    """One thread's share of the stress test: every /api/* route, over and over"""
+    rng = random.Random(thread_id)
+    today = datetime.now().strftime('%Y-%m-%d')
+    habit = f'thread_{thread_id}'
+    for round_number in range(rounds):
+        responses = [
+            client.post('/api/exercises', json={'name': 'Running', 'duration': 1, 'calories': 1}),
+            client.post('/api/meals', json={'type': rng.choice(MEAL_TYPES), 'items': 'rice',
+                                            'calories': rng.randint(100, 900)}),
+            client.post('/api/habits', json={habit: round_number % 2 == 0}),
+            client.post('/api/water', json={'count': rng.randint(0, 8)}),
+            client.post('/api/sleep', json={'bedtime': '23:00', 'wake_time': '07:00', 'quality': 7}),
+            client.post('/api/import', data=json.dumps({
+                'kind': 'exercise', 'day': today, 'name': 'Cycling', 'duration': 1, 'calories': 1})),
+            client.get('/'),
+            client.get('/api/analytics?window=30'),
+            client.get('/api/history'),
+            client.get('/api/export'),
+        ]
+        responses.append(client.post('/api/habits', json={habit: True}))
+        for response in responses:
+            response.get_data()
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+def stress_threads(thread_ids, users, rounds):
+    """Run stress_worker on one thread per id, returning the response status counts"""
+    statuses = {}
+    threads = []
+    for thread_id in thread_ids:
+        client = app.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = f'stress_{thread_id % users}'
+        threads.append(threading.Thread(target=stress_worker,
+                                        args=(client, thread_id, rounds, statuses)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+def stress_process(path, thread_ids, users, rounds):
+    """One worker process of the multi-process stress test, on a shared SQLite file"""
+    app.storage = SQLiteStorage(path)
+    try:
+        return stress_threads(thread_ids, users, rounds)
+    finally:
+        app.storage.close()
+
+def stress_problems(store, args, statuses):
+    """Lost updates, inconsistent totals and error responses after a stress run"""
+    problems = []
+    for user in range(args.users):
+        user_id = f'stress_{user}'
+        data = store.load(user_id)
+        writers = range(user, args.threads, args.users)
+        # Each round logs one exercise directly and one through /api/import
+        expected = 2 * args.rounds * len(writers)
+        if len(data.exercises) != expected:
+            problems.append(f'{user_id}: {len(data.exercises)} of {expected} exercises kept')
+        missing = [t for t in writers if data.habits.get(f'thread_{t}') is not True]
+        if missing:
+            problems.append(f'{user_id}: habit updates lost for threads {missing}')
+        mismatched = aggregates.check_totals(data)
+        if mismatched:
+            problems.append(f'{user_id}: inconsistent totals {mismatched}')
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    if errors:
+        problems.append(f'{errors} error responses: {statuses}')
+    return problems
+
+def stress_report(name, args, elapsed, statuses, problems):
+    requests = sum(statuses.values())
+    print(f"  {name:14s} {requests} requests from {args.threads} threads in {elapsed:.2f}s"
+          f"  ({requests / elapsed:.0f} req/s)  lost updates: {len(problems)}")
+    for problem in problems:
+        print(f"    {problem}")
+
+def stress_backend(name, store, args):
+    """Hammer one storage backend from many threads and count lost updates"""
+    original, app.storage = app.storage, store
+    try:
+        start = time.perf_counter()
+        statuses = stress_threads(range(args.threads), args.users, args.rounds)
+        elapsed = time.perf_counter() - start
+        problems = stress_problems(store, args, statuses)
+        stress_report(name, args, elapsed, statuses, problems)
+        return problems
+    finally:
+        app.storage = original
+
+def stress_processes(path, args):
+    """The stress test's threads split across worker processes sharing one SQLite file
+
+    User locks only reach threads of one process, so this is what checks
+    that SQLite saves themselves never let one worker overwrite another.
+    """
+    store = SQLiteStorage(path)
+    shares = [range(first, args.threads, args.processes) for first in range(args.processes)]
+    start = time.perf_counter()
+    # Spawned, not forked: the parent's threads and connections stay behind
+    with ProcessPoolExecutor(args.processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        results = list(pool.map(stress_process, [path] * args.processes, shares,
+                                [args.users] * args.processes, [args.rounds] * args.processes))
+    elapsed = time.perf_counter() - start
+    statuses = {}
+    for result in results:
+        for status, count in result.items():
+            statuses[status] = statuses.get(status, 0) + count
+    try:
+        problems = stress_problems(store, args, statuses)
+    finally:
+        store.close()
+    stress_report(f'sqlite x{args.processes} proc', args, elapsed, statuses, problems)
+    return problems
+
+def bench_stress(args):
+    """Concurrent writes to every /api/* route must never lose an update"""
+    print(f"Stress: {args.threads} threads sharing {args.users} users, {args.rounds} rounds each")
+    problems = stress_backend('memory', MemoryStorage(), args)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStorage(os.path.join(tmp, 'stress.db'))
+        try:
+            problems += stress_backend('sqlite', store, args)
+        finally:
+            store.close()
+        if args.processes > 1:
+            problems += stress_processes(os.path.join(tmp, 'processes.db'), args)
+    if problems:
+        raise SystemExit(1)
+
+LOAD_MIX = [
+    ('GET', '/api/analytics?window=30', None),
+    ('POST', '/api/water', {'count': 5}),
+    ('POST', '/api/meals', {'type': 'lunch', 'items': 'rice', 'calories': 500}),
+    ('GET', '/', None),
+]
+
+async def http_request(reader, writer, method, path, cookie, payload):
+    """Send one HTTP/1.1 request and read the reply
+
+    Returns (status, kept alive, cookie), where cookie is the "name=value"
+    of any cookie the server set, or else the one that was sent.
+    """
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    cookie_header = f'Cookie: {cookie}\r\n' if cookie else ''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\n{cookie_header}'
+                 f'Content-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length, keep_alive = 0, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+        elif name.lower() == 'connection' and value.strip().lower() == 'close':
+            keep_alive = False
+        elif name.lower() == 'set-cookie':
+            cookie = value.strip().split(';', 1)[0]
+    await reader.readexactly(length)
+    return status, keep_alive, cookie
+
+async def load_connection(port, deadline, samples, statuses):
+    """One client (one user) cycling through LOAD_MIX until the deadline
+
+    Reconnects whenever the server closes the connection (the Werkzeug dev
+    server does after every reply); the reconnect counts toward latency.
+    """
+    writer = cookie = None
+    step = 0
+    try:
+        while time.perf_counter() < deadline:
+            method, path, payload = LOAD_MIX[step % len(LOAD_MIX)]
+            start = time.perf_counter()
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            status, keep_alive, cookie = await http_request(reader, writer, method, path,
+                                                            cookie, payload)
+            samples.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+            step += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+async def load_run(port, connections, duration):
+    """Drive every connection at once for `duration` seconds"""
+    samples, statuses = [], {}
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(load_connection(port, deadline, samples, statuses)
+                           for _ in range(connections)))
+    return samples, statuses
+
+def wait_for_port(port, process, timeout=15.0):
+    """Block until a server subprocess accepts connections"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'server on port {port} exited early')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f'server on port {port} did not start')
+
+def bench_load(args):
+    """Requests/sec and latency of the Flask and ASGI servers under concurrent keep-alive clients"""
+    servers = [('flask', [sys.executable, '-c',
+                          'import app; app.app.run(host="127.0.0.1", port={port}, threaded=True)'])]
+    if importlib.util.find_spec('uvicorn'):
+        servers.append(('asgi', [sys.executable, '-m', 'uvicorn', 'asgi:application',
+                                 '--host', '127.0.0.1', '--port', '{port}', '--log-level', 'warning']))
+    else:
+        print("uvicorn is not installed; only the Flask server will be measured (pip install uvicorn)")
+
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    print(f"Load: {args.connections} keep-alive connections for {args.duration}s per server")
+    for number, (name, command) in enumerate(servers):
+        port = args.port + number
+        command = [part.format(port=port) for part in command]
+        process = subprocess.Popen(command, cwd=here, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port, process)
+            asyncio.run(load_run(port, args.connections, 1.0))   # warm up
+            samples, statuses = asyncio.run(load_run(port, args.connections, args.duration))
+        finally:
+            process.terminate()
+            process.wait()
+        errors = sum(count for status, count in statuses.items() if status >= 400)
+        print(f"  {name:6s} {len(samples) / args.duration:8.0f} req/s"
+              f"  p50 {percentile(samples, 50):7.2f} ms  p99 {percentile(samples, 99):7.2f} ms"
+              f"  errors {errors}")
+
+def bench_writes(args):
+    """SQLite writes for bursts of water clicks, with and without write-behind"""
+    print(f"{args.users} users x {args.clicks} quick water clicks each, SQLite")
+    with tempfile.TemporaryDirectory() as tmp:
+        for interval in (0, args.flush_interval):
+            store = create_storage(f"sqlite:///{os.path.join(tmp, f'writes{interval}.db')}",
+                                   write_behind=interval, max_batch=args.max_batch)
+            original, app.storage = app.storage, store
+            try:
+                clients = []
+                for user in range(args.users):
+                    client = app.app.test_client()
+                    with client.session_transaction() as sess:
+                        sess['user_id'] = f'writes_{user}'
+                    client.get('/')
+                    clients.append(client)
+
+                if interval:
+                    store.flush()
+                    before = store.stats()
+                start = time.perf_counter()
+                for click in range(args.clicks):
+                    for client in clients:
+                        client.post('/api/water', json={'count': click + 1})
+                if interval:
+                    store.flush()
+                elapsed = time.perf_counter() - start
+            finally:
+                app.storage = original
+
+            if interval:
+                stats = {key: value - before[key] for key, value in store.stats().items()
+                         if key in ('saves', 'coalesced', 'flushes', 'written')}
+                label = f"write-behind {interval}s"
+                detail = (f"{stats['written']} rows in {stats['flushes']} batches,"
+                          f" {stats['coalesced']} of {stats['saves']} saves coalesced")
+            else:
+                label = "direct"
+                detail = f"{args.users * args.clicks} rows, one per save"
+            store.close()
+            backend = getattr(store, 'backend', store)
+            lost = sum(backend.load(f'writes_{user}').water_count != args.clicks
+                       for user in range(args.users))
+            print(f"  {label:18s} {elapsed:6.2f}s  {detail}  (users with a stale count: {lost})")
+
+def soak_run(store, args):
+    """Drive one backend with mostly-new users; yields (users seen, traced KiB, stats)"""
+    rng = random.Random(args.seed)
+    hot = [f'hot_{n}' for n in range(args.hot_users)]
+    checkpoint = max(args.users // args.checkpoints, 1)
+    original, app.storage = app.storage, store
+    # The rollover tracker is bounded too; hold it to the same cap here
+    original_rollovers, app.rollovers = app.rollovers, RolloverScheduler(args.max_users)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for user in range(args.users):
+            # Each new visitor also brings a few requests from the regulars
+            for user_id in [f'soak_{user}'] + rng.sample(hot, args.hot_requests):
+                data = app.load_user_data(user_id)
+                data.water_count = (data.water_count + 1) % 9
+                app.save_user_data(user_id, data)
+            if (user + 1) % checkpoint == 0:
+                yield user + 1, tracemalloc.get_traced_memory()[0] / 1024, store.stats()
+    finally:
+        tracemalloc.stop()
+        app.storage = original
+        app.rollovers = original_rollovers
+
+def bench_soak(args):
+    """Memory and cache hit rates as a stream of distinct users keeps arriving"""
+    print(f"{args.users} distinct users, each with {args.hot_requests} requests from "
+          f"{args.hot_users} regulars; cap {args.max_users} users in memory")
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = [('memory', MemoryStorage(args.max_users)),
+                  ('sqlite+cache', create_storage(f"sqlite:///{os.path.join(tmp, 'soak.db')}",
+                                                  cache_users=args.max_users))]
+        for name, store in stores:
+            start = time.perf_counter()
+            for users, kib, stats in soak_run(store, args):
+                cache = stats.get('cache', stats)
+                detail = (f"hit rate {cache['hit_rate']:.1%}" if 'hit_rate' in cache else '')
+                print(f"  {name:12s} {users:9d} users  {kib:10.0f} KiB traced"
+                      f"  {cache['users']:7d} in memory  {cache['evictions']:9d} evicted  {detail}")
+            elapsed = time.perf_counter() - start
+            print(f"  {name:12s} {args.users * (1 + args.hot_requests) / elapsed:.0f} requests/s")
+            store.close()
+
+# One recorded visit: a cold page load, a morning's logging, checking analytics
+# and reloading the page a few times in between, as (method, path, JSON body)
+WIRE_SESSION = [
+    ('GET', '/', None), ('GET', 'css', None), ('GET', 'js', None),
+    ('POST', '/api/water', {'count': 2}),
+    ('POST', '/api/habits', {'meditation': True}),
+    ('POST', '/api/meals', {'type': 'breakfast', 'items': 'Oats, banana', 'calories': 420}),
+    ('GET', '/api/analytics', None),
+    ('GET', '/', None), ('GET', '/api/analytics', None),
+    ('POST', '/api/water', {'count': 4}),
+    ('POST', '/api/exercises', {'name': 'Running', 'duration': 30, 'calories': 300}),
+    ('GET', '/', None), ('GET', '/api/analytics', None), ('GET', '/api/analytics?window=30', None),
+    ('GET', '/', None), ('GET', '/api/analytics', None),
+    ('POST', '/api/meals', {'type': 'lunch', 'items': 'Salad, bread', 'calories': 650}),
+    ('POST', '/api/sleep', {'bedtime': '23:00', 'wake_time': '07:00', 'quality': 8}),
+    ('GET', '/', None), ('GET', '/', None), ('GET', '/api/analytics?window=30', None),
+]
+
+def wire_size(response):
+    """Bytes of a reply on the wire: status line, headers and body"""
+    head = len(f'HTTP/1.1 {response.status}\r\n\r\n')
+    head += sum(len(name) + len(value) + 4 for name, value in response.headers.items())
+    return head + len(response.data)
+
+def wire_session(client, compress, revalidate):
+    """Replay WIRE_SESSION like a browser would; returns (bytes, requests, 304s)"""
+    headers = {'Accept-Encoding': 'gzip, deflate, br'} if compress else {}
+    etags = {}
+    total = requests = unchanged = 0
+    for method, path, payload in WIRE_SESSION:
+        if path in ('css', 'js'):
+            path = (app.CSS_ASSET if path == 'css' else app.JS_ASSET).url
+        request_headers = dict(headers)
+        if revalidate and path in etags:
+            request_headers['If-None-Match'] = etags[path]
+        response = client.open(path, method=method, json=payload, headers=request_headers)
+        if 'ETag' in response.headers:
+            etags[path] = response.headers['ETag']
+        total += wire_size(response)
+        requests += 1
+        unchanged += response.status_code == 304
+    return total, requests, unchanged
+
+def bench_wire(args):
+    """Bytes on the wire for a recorded session, with compression and revalidation"""
+    modes = [('plain', False, False), ('compressed', True, False),
+             ('revalidated', False, True), ('both', True, True)]
+    print(f"Recorded session of {len(WIRE_SESSION)} requests, replayed by {args.users} users")
+    baseline = None
+    for label, compress, revalidate in modes:
+        total = requests = unchanged = 0
+        for user in range(args.users):
+            client = app.app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = f'wire_{label}_{user}'
+            size, count, not_modified = wire_session(client, compress, revalidate)
+            total, requests, unchanged = total + size, requests + count, unchanged + not_modified
+        baseline = baseline or total
+        print(f"  {label:12s} {total / args.users / 1024:8.1f} KiB per session"
+              f"  {unchanged / args.users:4.1f} answered 304  ({total / baseline:6.1%} of plain)")
+
+def bench_foods(args):
+    """Food index load time, memory and autocomplete latency"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = FoodIndex.load()
+    load_ms = (time.perf_counter() - start) * 1e3
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{len(index.foods)} foods indexed in {load_ms:.1f} ms (on first search), {size / 1024:.0f} KiB")
+
+    # What autocomplete sends while a name is typed, and the same names with a typo
+    rng = random.Random(args.seed)
+    names = [' '.join(normalize(food.name)) for food in index.foods]
+    typed = [name[:length] for name in names for length in range(1, len(name) + 1)]
+    typos = []
+    for name in names:
+        cut = rng.randrange(1, len(name))
+        typos.append(name[:cut] + name[cut + 1:])
+    for label, queries in (('prefix', typed), ('typo', typos)):
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query)
+            samples.append((time.perf_counter() - start) * 1e3)
+        print(f"  {label:6s} {len(queries):6d} queries  p50 {percentile(samples, 50):.3f} ms"
+              f"  p99 {percentile(samples, 99):.3f} ms  max {max(samples):.3f} ms")
+
+def bench_met(args):
+    """MET table load time, name lookups and bulk calorie estimates"""
+    start = time.perf_counter()
+    table = MetTable.load()
+    print(f"{len(table.mets)} activities indexed in {(time.perf_counter() - start) * 1e3:.1f} ms (at startup)")
+
+    names = EXERCISE_NAMES + ['Morning run', 'Rock climbing', 'Evening walk with the dog']
+    for name in names:
+        start = time.perf_counter()
+        for _ in range(args.lookups):
+            table.lookup(name)
+        elapsed = (time.perf_counter() - start) / args.lookups * 1e9
+        print(f"  lookup {name!r:30s} {elapsed:6.0f} ns  MET {table.lookup(name)}")
+
+    # A long history imported without calories, estimated one by one and in bulk
+    rng = random.Random(args.seed)
+    entries = [(rng.choice(EXERCISE_NAMES), rng.randint(10, 90)) for _ in range(args.entries)]
+    start = time.perf_counter()
+    one_by_one = [table.estimate(name, minutes, 72) for name, minutes in entries]
+    single = time.perf_counter() - start
+    exercises = [Exercise(name, minutes, None) for name, minutes in entries]
+    start = time.perf_counter()
+    table.fill_calories(exercises, 72)
+    batched = time.perf_counter() - start
+    assert [exercise.calories for exercise in exercises] == one_by_one
+    print(f"  {args.entries} entries  one by one {single * 1e3:7.1f} ms"
+          f"  batched {batched * 1e3:7.1f} ms  ({single / batched:.1f}x)")
+
+def bench_sleep(args):
+    """Cost of a logged night's sleep stats update, incremental versus rescanned"""
+    rng = random.Random(args.seed)
+    start_day = datetime(2024, 1, 1).date()
+    nights = []
+    for offset in range(args.nights):
+        bed = (22 * 60 + rng.randint(0, 150)) % (24 * 60)
+        wake = (bed + rng.randint(360, 540)) % (24 * 60)
+        payload = {'bedtime': f'{bed // 60:02d}:{bed % 60:02d}',
+                   'wake_time': f'{wake // 60:02d}:{wake % 60:02d}', 'quality': rng.randint(3, 10)}
+        nights.append((shift_day(start_day.isoformat(), offset), Sleep.from_json(payload)))
+
+    for window in args.windows:
+        log = SleepLog(window)
+        start = time.perf_counter()
+        for day, sleep in nights:
+            log.record(day, sleep)
+            stats = log.stats()
+        incremental = (time.perf_counter() - start) / len(nights) * 1e6
+
+        start = time.perf_counter()
+        for index in range(len(nights)):
+            rescanned = SleepLog.from_nights(nights[max(0, index - window + 1):index + 1], window).stats()
+        rescan = (time.perf_counter() - start) / len(nights) * 1e6
+        assert rescanned['nights'] == stats['nights']
+        assert abs(rescanned['sleep_debt_hours'] - stats['sleep_debt_hours']) < 0.11
+        print(f"  window {window:4d} nights  incremental {incremental:7.1f} us/night"
+              f"  rescanned {rescan:8.1f} us/night  ({rescan / incremental:5.1f}x)")
+
+def bench_metrics(args):
+    """Per-request cost of the /metrics instrumentation"""
+    client = app.app.test_client()
+    client.get('/')
+    routes = [('get', '/', None), ('post', '/api/water', {'count': 3}),
+              ('get', '/api/analytics', None)]
+
+    def run():
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            for method, path, payload in routes:
+                getattr(client, method)(path, json=payload)
+        return (time.perf_counter() - start) / (args.requests * len(routes)) * 1e6
+
+    original = app.metrics.enabled
+    try:
+        results = {}
+        for round_number in range(args.rounds):
+            # Alternate which goes first so warm-up and drift don't favour either
+            for enabled in ((False, True) if round_number % 2 else (True, False)):
+                app.metrics.enabled = enabled
+                results.setdefault(enabled, []).append(run())
+    finally:
+        app.metrics.enabled = original
+    off, on = min(results[False]), min(results[True])
+    print(f"{args.requests * len(routes)} requests per round, best of {args.rounds}")
+    print(f"  metrics off: {off:7.1f} us/request")
+    print(f"  metrics on:  {on:7.1f} us/request  (+{on - off:.1f} us, {(on - off) / off:+.1%})")
+
+def suite_routes(today):
+    """(name, method, path, payload) for every route the suite drives"""
+    import_line = json.dumps({'kind': 'exercise', 'day': today, 'name': 'Rowing',
+                              'duration': 20, 'calories': 180})
+    return [
+        ('index', 'get', '/', None),
+        ('asset', 'get', app.CSS_ASSET.url, None),
+        ('water', 'post', '/api/water', {'count': 5}),
+        ('habits', 'post', '/api/habits', {'reading': True, 'journaling': False}),
+        ('meals', 'post', '/api/meals', {'type': 'lunch', 'items': 'rice, beans', 'calories': 620}),
+        ('exercises', 'post', '/api/exercises', {'name': 'Running', 'duration': 30, 'calories': 300}),
+        ('sleep', 'post', '/api/sleep', {'bedtime': '23:10', 'wake_time': '06:50', 'quality': 7}),
+        ('analytics', 'get', '/api/analytics?window=30', None),
+        ('history', 'get', '/api/history', None),
+        ('export', 'get', f'/api/export?start={shift_day(today, -29)}', None),
+        ('import', 'post', '/api/import', import_line),
+        ('admin_stats', 'get', '/api/admin/stats', None),
+        ('metrics', 'get', '/metrics', None),
+    ]
+
+def suite_request(client, method, path, payload):
+    """Issue one request and read the whole body; returns the status code"""
+    # The admin routes only answer requests carrying the admin token
+    headers = {'X-Admin-Token': os.environ['HEALTHYLIFE_ADMIN_TOKEN']}
+    if isinstance(payload, str):
+        response = client.post(path, data=payload, headers=headers)
+    else:
+        response = getattr(client, method)(path, json=payload, headers=headers)
+    response.get_data()
+    return response.status_code
+
+def seed_suite_users(store, users, days, rng):
+    """Synthetic users with today's data and `days` of sealed history in `store`"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    clients = []
+    for number in range(users):
+        user_id = f'suite_{number}'
+        data = synthetic_user(rng)
+        data.last_updated = today
+        store.save(user_id, data)
+        for offset in range(1, days + 1):
+            record = seal_day(synthetic_user(rng))
+            store.seal_day(user_id, shift_day(today, -offset), record, rollup_day(record))
+        client = app.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        clients.append(client)
+    return today, clients
+
+def run_suite(args):
+    """Per-route throughput, latency percentiles and memory per request"""
+    rng = random.Random(args.seed)
+    os.environ.setdefault('HEALTHYLIFE_ADMIN_TOKEN', 'bench-suite')
+    store = MemoryStorage()
+    original, app.storage = app.storage, store
+    try:
+        today, clients = seed_suite_users(store, args.users, args.days, rng)
+        results = {}
+        for name, method, path, payload in suite_routes(today):
+            if args.route and name not in args.route:
+                continue
+            for client in clients[:args.warmup]:
+                suite_request(client, method, path, payload)
+
+            samples, errors = [], 0
+            start = time.perf_counter()
+            for number in range(args.requests):
+                client = clients[number % len(clients)]
+                began = time.perf_counter()
+                status = suite_request(client, method, path, payload)
+                samples.append((time.perf_counter() - began) * 1000)
+                errors += status >= 400
+            elapsed = time.perf_counter() - start
+
+            # Memory in a separate pass, since tracing slows every allocation down
+            peaks, retained = [], []
+            tracemalloc.start()
+            for number in range(args.alloc_requests):
+                client = clients[number % len(clients)]
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                suite_request(client, method, path, payload)
+                current, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - before)
+                retained.append(current - before)
+            tracemalloc.stop()
+
+            results[name] = {
+                'method': method.upper(),
+                'path': path,
+                'requests': args.requests,
+                'errors': errors,
+                'rps': round(args.requests / elapsed, 1),
+                'p50_ms': round(percentile(samples, 50), 3),
+                'p90_ms': round(percentile(samples, 90), 3),
+                'p99_ms': round(percentile(samples, 99), 3),
+                'max_ms': round(max(samples), 3),
+                'peak_kib': round(sum(peaks) / len(peaks) / 1024, 1) if peaks else None,
+                'retained_bytes': round(sum(retained) / len(retained)) if retained else None,
+            }
+        return results
+    finally:
+        app.storage = original
+
+def git_revision():
+    """The checked-out commit, if this is a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_suite(args):
+    """Drive every route through the test client and report per-route results"""
+    results = run_suite(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['routes']
+
+    print(f"{args.requests} requests per route across {args.users} synthetic users"
+          f" ({args.days} days of history each)")
+    print(f"  {'route':12s} {'req/s':>9s} {'p50 ms':>8s} {'p90 ms':>8s} {'p99 ms':>8s}"
+          f" {'peak KiB':>9s} {'errors':>6s}" + ('   p50 vs baseline' if baseline else ''))
+    for name, row in results.items():
+        line = (f"  {name:12s} {row['rps']:9.0f} {row['p50_ms']:8.3f} {row['p90_ms']:8.3f}"
+                f" {row['p99_ms']:8.3f} {row['peak_kib'] or 0:9.1f} {row['errors']:6d}")
+        if baseline and name in baseline:
+            line += f"   {row['p50_ms'] / baseline[name]['p50_ms'] - 1:+8.1%}"
+        print(line)
+
+    if args.json:
+        report = {
+            'revision': git_revision(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'params': {key: getattr(args, key) for key in
+                       ('users', 'days', 'requests', 'alloc_requests', 'warmup', 'seed')},
+            'routes': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if any(row['errors'] for row in results.values()):
+        raise SystemExit(1)
+
+def main():
+    """Run the selected benchmark"""
+    parser = argparse.ArgumentParser(description='HealthyLife Pro benchmarks')
+    sub = parser.add_subparsers(dest='benchmark')
+
+    render = sub.add_parser('render', help='dashboard page render throughput')
+    render.add_argument('--users', type=int, default=500)
+    render.add_argument('--rounds', type=int, default=20)
+    render.set_defaults(func=bench_render)
+
+    fragments = sub.add_parser('fragments', help='dashboard renders with the fragment cache on/off')
+    fragments.add_argument('--users', type=int, default=200)
+    fragments.add_argument('--views', type=int, default=20000)
+    fragments.add_argument('--max-entries', type=int, default=20000)
+    fragments.add_argument('--seed', type=int, default=22)
+    fragments.set_defaults(func=bench_fragments)
+
+    assets = sub.add_parser('assets', help='bytes per reload with cached assets')
+    assets.add_argument('--users', type=int, default=500)
+    assets.set_defaults(func=bench_assets)
+
+    totals = sub.add_parser('totals', help='verify running totals against raw entries')
+    totals.add_argument('--users', type=int, default=200)
+    totals.add_argument('--writes', type=int, default=50000)
+    totals.set_defaults(func=bench_totals)
+
+    analytics = sub.add_parser('analytics', help='rolling analytics latency over a year of history')
+    analytics.add_argument('--days', type=int, default=365)
+    analytics.add_argument('--requests', type=int, default=500)
+    analytics.set_defaults(func=bench_analytics)
+
+    batch = sub.add_parser('batch', help='NumPy population analytics over synthetic user-days')
+    batch.add_argument('--users', type=int, default=10000)
+    batch.add_argument('--days', type=int, default=100)
+    batch.set_defaults(func=bench_batch)
+
+    memory = sub.add_parser('memory', help='memory per record, dicts versus slotted records')
+    memory.add_argument('--users', type=int, default=20000)
+    memory.set_defaults(func=bench_memory)
+
+    stress = sub.add_parser('stress', help='hammer every /api/* route from many threads')
+    stress.add_argument('--threads', type=int, default=16)
+    stress.add_argument('--users', type=int, default=4)
+    stress.add_argument('--rounds', type=int, default=25)
+    stress.add_argument('--processes', type=int, default=4,
+                        help='also split the threads across this many processes on one SQLite file')
+    stress.set_defaults(func=bench_stress)
+
+    load = sub.add_parser('load', help='Flask vs ASGI throughput and latency under concurrent clients')
+    load.add_argument('--connections', type=int, default=50)
+    load.add_argument('--duration', type=float, default=10.0)
+    load.add_argument('--port', type=int, default=8301)
+    load.set_defaults(func=bench_load)
+
+    writes = sub.add_parser('writes', help='SQLite writes for click bursts, direct vs write-behind')
+    writes.add_argument('--users', type=int, default=200)
+    writes.add_argument('--clicks', type=int, default=8)
+    writes.add_argument('--flush-interval', type=float, default=0.25)
+    writes.add_argument('--max-batch', type=int, default=500)
+    writes.set_defaults(func=bench_writes)
+
+    wire = sub.add_parser('wire', help='bytes on the wire for a recorded session, gzip/br and ETags')
+    wire.add_argument('--users', type=int, default=20)
+    wire.set_defaults(func=bench_wire)
+
+    food = sub.add_parser('foods', help='food search index load time and autocomplete latency')
+    food.add_argument('--seed', type=int, default=23)
+    food.set_defaults(func=bench_foods)
+
+    mets = sub.add_parser('met', help='MET lookups and bulk exercise calorie estimates')
+    mets.add_argument('--lookups', type=int, default=100000)
+    mets.add_argument('--entries', type=int, default=200000)
+    mets.add_argument('--seed', type=int, default=24)
+    mets.set_defaults(func=bench_met)
+
+    sleep = sub.add_parser('sleep', help='per-night sleep stats update versus rescanning the window')
+    sleep.add_argument('--nights', type=int, default=2000)
+    sleep.add_argument('--windows', type=int, nargs='+', default=[14, 90, 365])
+    sleep.add_argument('--seed', type=int, default=25)
+    sleep.set_defaults(func=bench_sleep)
+
+    instrumentation = sub.add_parser('metrics', help='per-request overhead of /metrics instrumentation')
+    instrumentation.add_argument('--requests', type=int, default=200)
+    instrumentation.add_argument('--rounds', type=int, default=20)
+    instrumentation.set_defaults(func=bench_metrics)
+
+    soak = sub.add_parser('soak', help='memory stays flat as distinct users keep arriving')
+    soak.add_argument('--users', type=int, default=50000, help='distinct users (try millions)')
+    soak.add_argument('--max-users', type=int, default=10000)
+    soak.add_argument('--hot-users', type=int, default=1000)
+    soak.add_argument('--hot-requests', type=int, default=3, help='regulars\' requests per new user')
+    soak.add_argument('--checkpoints', type=int, default=5)
+    soak.add_argument('--seed', type=int, default=19)
+    soak.set_defaults(func=bench_soak)
+
+    suite = sub.add_parser('suite', help='every route: req/s, latency percentiles, memory per request')
+    suite.add_argument('--users', type=int, default=100)
+    suite.add_argument('--days', type=int, default=60, help='sealed history days per user')
+    suite.add_argument('--requests', type=int, default=1000, help='timed requests per route')
+    suite.add_argument('--alloc-requests', type=int, default=100, help='traced requests per route')
+    suite.add_argument('--warmup', type=int, default=20)
+    suite.add_argument('--seed', type=int, default=5)
+    suite.add_argument('--route', action='append', help='only this route (repeatable)')
+    suite.add_argument('--json', help='write machine-readable results to this file')
+    suite.add_argument('--compare', help='earlier --json results to compare p50 latency against')
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    if not getattr(args, 'func', None):
+        args = parser.parse_args(['render'])
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
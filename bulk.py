@@ -0,0 +1,160 @@
+"""
+HealthyLife Pro - Bulk import/export
+Newline-delimited JSON, one entry per line:
+
+    {"kind": "meal", "day": "2024-05-01", "type": "lunch", "items": "Salad", "calories": 450}
+    {"kind": "exercise", "day": "2024-05-01", "name": "Running", "duration": 30, "calories": 300}
+    {"kind": "exercise", "day": "2024-05-01", "name": "Yoga", "duration": 45}
+    {"kind": "sleep", "day": "2024-05-01", "bedtime": "23:00", "wake_time": "07:00", "quality": 8}
+    {"kind": "water", "day": "2024-05-01", "count": 6}
+    {"kind": "habits", "day": "2024-05-01", "habits": {"reading": true}}
+
+Imports are parsed line by line and committed in batches; exports are
+generated a chunk of days at a time, so neither side holds the whole history.
+A batch is saved whole or not at all; lines of a batch that could not be
+saved are reported as failed, so sending just those again is safe.
+Exercises without calories are imported if their activity has a MET value;
+the importer estimates their calories a batch at a time.
+"""
+
+import json
+
+from history import expand_day, parse_day, shift_day
+from records import Exercise, Meal, Sleep, validate_habits, validate_water
+
+VALIDATORS = {
+    'meal': Meal.from_json,
+    'exercise': Exercise.from_json,
+    'sleep': Sleep.from_json,
+    'water': validate_water,
+    'habits': validate_habits,
+}
+
+MAX_LINE_BYTES = 64 * 1024
+IMPORT_BATCH_SIZE = 500
+EXPORT_CHUNK_DAYS = 31
+MAX_REPORTED_ERRORS = 100
+
+class BatchNotSaved(Exception):
+    """Raised by an import's commit() when none of a batch could be saved"""
+
+def parse_line(line, today, mets=None):
+    """Validate one NDJSON line into (day, kind, entry)
+
+    Exercises may leave calories out if `mets` (a MetTable) knows the activity.
+    """
+    try:
+        payload = json.loads(line)
+    except ValueError:
+        raise ValueError('Invalid JSON') from None
+    if not isinstance(payload, dict):
+        raise ValueError('Each line must be a JSON object')
+
+    kind = payload.get('kind')
+    if kind not in VALIDATORS:
+        raise ValueError(f'kind must be one of {", ".join(VALIDATORS)}')
+    day = payload.get('day')
+    try:
+        parse_day(day)
+    except (TypeError, ValueError):
+        raise ValueError('day must be YYYY-MM-DD') from None
+    if day > today:
+        raise ValueError('day is in the future')
+    entry = VALIDATORS[kind](payload)
+    if kind == 'exercise' and entry.calories is None and (
+            mets is None or mets.lookup(entry.name) is None):
+        raise ValueError('calories are required for exercises without a known MET value')
+    return day, kind, entry
+
+def read_lines(stream):
+    """(line number, line) pairs from a binary stream, without reading it all"""
+    number = 0
+    while True:
+        line = stream.readline(MAX_LINE_BYTES + 1)
+        if not line:
+            return
+        number += 1
+        if len(line) > MAX_LINE_BYTES and not line.endswith(b'\n'):
+            # Skip the rest of an oversized line
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(MAX_LINE_BYTES)
+            yield number, None
+            continue
+        if line.strip():
+            yield number, line
+
+def import_stream(stream, today, commit, batch_size=IMPORT_BATCH_SIZE, mets=None):
+    """Import NDJSON entries, handing commit() a {day: [(kind, entry)]} batch at a time
+
+    A batch whose commit() raises BatchNotSaved is reported under "failed"
+    by the first and last line it held; lines in between that are not listed
+    under "errors" were in it.
+    """
+    imported = batches = 0
+    errors, failed = [], []
+    pending, pending_count, first_line, last_line = {}, 0, None, None
+
+    def flush():
+        nonlocal imported, batches, pending, pending_count, first_line
+        if pending:
+            try:
+                commit(pending)
+            except BatchNotSaved as error:
+                imported -= pending_count
+                failed.append({'first_line': first_line, 'last_line': last_line,
+                               'error': str(error)})
+            else:
+                batches += 1
+            pending, pending_count, first_line = {}, 0, None
+
+    for number, line in read_lines(stream):
+        try:
+            if line is None:
+                raise ValueError('Line too long')
+            day, kind, entry = parse_line(line, today, mets)
+        except ValueError as error:
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': number, 'error': str(error)})
+            continue
+        pending.setdefault(day, []).append((kind, entry))
+        pending_count += 1
+        if first_line is None:
+            first_line = number
+        last_line = number
+        imported += 1
+        if pending_count >= batch_size:
+            flush()
+    flush()
+
+    return {'imported': imported, 'batches': batches, 'errors': errors, 'failed': failed}
+
+def day_lines(day, record):
+    """NDJSON lines for one day's record"""
+    day_view = expand_day(day, record)
+    lines = []
+    if day_view['water_count']:
+        lines.append({'kind': 'water', 'day': day, 'count': day_view['water_count']})
+    if day_view['habits']:
+        lines.append({'kind': 'habits', 'day': day, 'habits': day_view['habits']})
+    lines.extend({'kind': 'meal', 'day': day, **meal} for meal in day_view['meals'])
+    lines.extend({'kind': 'exercise', 'day': day, **ex} for ex in day_view['exercises'])
+    if day_view['sleep_data']:
+        lines.append({'kind': 'sleep', 'day': day, **day_view['sleep_data']})
+    return [(json.dumps(line, separators=(',', ':')) + '\n').encode('utf-8') for line in lines]
+
+def export_stream(load_days, start, end, live=None):
+    """Yield NDJSON lines for every stored day from start to end
+
+    load_days(start, end) returns (day, record) pairs; it is called one chunk
+    of days at a time. `live` is an optional (day, record) for today.
+    """
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(shift_day(chunk_start, EXPORT_CHUNK_DAYS - 1), end)
+        chunk = b''.join(line for day, record in load_days(chunk_start, chunk_end)
+                         for line in day_lines(day, record))
+        if chunk:
+            yield chunk
+        chunk_start = shift_day(chunk_end, 1)
+    if live is not None and start <= live[0] <= end:
+        yield b''.join(day_lines(*live))
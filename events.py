@@ -0,0 +1,317 @@
+"""
+HealthyLife Pro - Live events
+In-process publish/subscribe for per-user change events, streamed to open
+dashboards as server-sent events. Each subscriber has a bounded backlog: a
+client that falls too far behind has its backlog dropped and is told to
+resync, so a slow connection never grows memory without limit.
+
+Events reach subscribers in the same process directly. With an event
+channel (HEALTHYLIFE_EVENTS="sqlite:///path.db", by default wherever
+HEALTHYLIFE_STORAGE keeps users' data) they also reach dashboards streaming
+from other worker processes, a poll interval later.
+"""
+
+import asyncio
+import secrets
+import sqlite3
+import threading
+import time
+from collections import deque
+
+MAX_PENDING_EVENTS = 32
+MAX_SUBSCRIBERS_PER_USER = 8
+# How often each process looks for other processes' events
+POLL_INTERVAL = 0.5
+# A process's note that it has a user's stream open lasts this long unless renewed
+LISTENER_TTL = 30
+# Events older than this are deleted from the channel
+EVENT_RETENTION = 60
+
+# Returned in place of an event when a subscriber's backlog was dropped
+RESYNC = object()
+
+class Subscription:
+    """One open event stream's pending events"""
+
+    def __init__(self, user_id, max_pending=MAX_PENDING_EVENTS):
+        self.user_id = user_id
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.lagged = False
+        # Version of the user's data in the newest event queued so far
+        self.version = None
+        self.ready = threading.Condition()
+
+    def push(self, event, version=None):
+        """Queue an event, dropping the backlog instead if it is full
+
+        An event about an older version than one already queued is dropped:
+        one relayed from another process can arrive after a newer local one.
+        """
+        with self.ready:
+            if version is not None:
+                if self.version is not None and version <= self.version:
+                    return
+                self.version = version
+            if len(self.pending) >= self.max_pending:
+                self.pending.clear()
+                self.lagged = True
+            else:
+                self.pending.append(event)
+            self.ready.notify()
+
+    def next(self, timeout):
+        """The next event, RESYNC if events were dropped, or None after timeout seconds"""
+        with self.ready:
+            if not self.pending and not self.lagged:
+                self.ready.wait(timeout)
+            if self.lagged:
+                self.lagged = False
+                self.pending.clear()
+                return RESYNC
+            return self.pending.popleft() if self.pending else None
+
+class AsyncSubscription(Subscription):
+    """A subscription read from an event loop; events may be pushed from any thread"""
+
+    def __init__(self, user_id, max_pending, loop):
+        super().__init__(user_id, max_pending)
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+
+    def push(self, event, version=None):
+        super().push(event, version)
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def next_async(self, timeout):
+        """Like next(), suspending only this coroutine while it waits"""
+        # Cleared before looking, so a push landing in between still wakes the wait
+        self.wakeup.clear()
+        event = self.next(0)
+        if event is not None:
+            return event
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self.next(0)
+
+class SQLiteEventChannel:
+    """Carries events between worker processes through tables in a shared SQLite file
+
+    Each process appends the events it publishes and polls for those other
+    processes appended since its last look. Processes also note which users
+    have a stream open with them, so a write only goes through the table
+    when a dashboard in another process is listening for it.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            event TEXT NOT NULL,
+            version INTEGER,
+            created INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS event_listeners (
+            user_id TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            expires INTEGER NOT NULL,
+            PRIMARY KEY (user_id, origin)
+        ) WITHOUT ROWID;
+    '''
+    # AUTOINCREMENT: ids are never reused after a purge, so "newer than" stays true
+    PUBLISH_SQL = ('INSERT INTO events (origin, user_id, event, version, created) '
+                   'VALUES (?, ?, ?, ?, ?)')
+    POLL_SQL = ('SELECT id, user_id, event, version FROM events '
+                'WHERE id > ? AND origin != ? ORDER BY id')
+    LAST_ID_SQL = 'SELECT COALESCE(MAX(id), 0) FROM events'
+    LISTEN_SQL = ('INSERT INTO event_listeners (user_id, origin, expires) VALUES (?, ?, ?) '
+                  'ON CONFLICT(user_id, origin) DO UPDATE SET expires = excluded.expires')
+    UNLISTEN_SQL = 'DELETE FROM event_listeners WHERE user_id = ? AND origin = ?'
+    LISTENERS_SQL = 'SELECT DISTINCT user_id FROM event_listeners WHERE origin != ? AND expires > ?'
+    PURGE_EVENTS_SQL = 'DELETE FROM events WHERE created < ?'
+    PURGE_LISTENERS_SQL = 'DELETE FROM event_listeners WHERE expires <= ?'
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self.origin = secrets.token_hex(8)
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        # Only events published from now on are this process's business
+        self.last_id = conn.execute(self.LAST_ID_SQL).fetchone()[0]
+        conn.close()
+        self.next_purge = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @property
+    def connection(self):
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def publish(self, user_id, event, version=None):
+        """Hand an event to the other processes"""
+        self.connection.execute(self.PUBLISH_SQL,
+                                (self.origin, user_id, event, version, int(time.time())))
+
+    def listen(self, user_ids):
+        """Note, or renew the note, that this process has streams open for these users"""
+        expires = int(time.time()) + LISTENER_TTL
+        conn = self.connection
+        with conn:
+            conn.execute('BEGIN')
+            conn.executemany(self.LISTEN_SQL, [(user_id, self.origin, expires)
+                                               for user_id in user_ids])
+
+    def unlisten(self, user_id):
+        """Note that this process has no stream open for a user any more"""
+        self.connection.execute(self.UNLISTEN_SQL, (user_id, self.origin))
+
+    def poll(self):
+        """Other processes' new (user_id, event, version) events, and the users they stream"""
+        conn = self.connection
+        now = int(time.time())
+        rows = conn.execute(self.POLL_SQL, (self.last_id, self.origin)).fetchall()
+        if rows:
+            self.last_id = rows[-1][0]
+        listeners = {user_id for user_id, in conn.execute(self.LISTENERS_SQL, (self.origin, now))}
+        if now >= self.next_purge:
+            self.next_purge = now + EVENT_RETENTION
+            conn.execute(self.PURGE_EVENTS_SQL, (now - EVENT_RETENTION,))
+            conn.execute(self.PURGE_LISTENERS_SQL, (now,))
+        return [row[1:] for row in rows], listeners
+
+def create_event_channel(url):
+    """An event channel from a URL such as "sqlite:///healthylife.db", or None for memory://"""
+    if not url or url == 'memory://':
+        return None
+    if url.startswith('sqlite:///'):
+        return SQLiteEventChannel(url[len('sqlite:///'):])
+    raise ValueError(f'Unsupported event channel URL: {url}')
+
+class EventBroker:
+    """Routes each user's events to that user's open streams
+
+    max_streams caps the streams open in this process (None for no cap);
+    a channel, if given, carries events to and from other processes.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_EVENTS, max_subscribers=MAX_SUBSCRIBERS_PER_USER,
+                 max_streams=None, channel=None, poll_interval=POLL_INTERVAL):
+        self.max_pending = max_pending
+        self.max_subscribers = max_subscribers
+        self.max_streams = max_streams
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.subscribers = {}
+        self.streams = 0
+        # Users with a stream open in another process, as of the last poll
+        self.remote = frozenset()
+        self.poller = None
+        self.lock = threading.Lock()
+
+    def _start_poller(self):
+        # Started on first use, so it runs in the worker process rather than a parent it forked from
+        with self.lock:
+            if self.poller is None:
+                self.poller = threading.Thread(target=self._poll, name='events', daemon=True)
+                self.poller.start()
+
+    def _poll(self):
+        renew = 0
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                now = time.monotonic()
+                if now >= renew:
+                    renew = now + LISTENER_TTL / 3
+                    with self.lock:
+                        users = list(self.subscribers)
+                    if users:
+                        self.channel.listen(users)
+                events, self.remote = self.channel.poll()
+            except sqlite3.Error:
+                continue
+            for user_id, event, version in events:
+                self._deliver(user_id, event, version)
+
+    def subscribe(self, user_id, loop=None):
+        """Open a subscription, or return None if the user or this process has too many
+
+        With an event loop the subscription is an AsyncSubscription.
+        """
+        with self.lock:
+            if self.max_streams is not None and self.streams >= self.max_streams:
+                return None
+            subscriptions = self.subscribers.setdefault(user_id, set())
+            if len(subscriptions) >= self.max_subscribers:
+                return None
+            if loop is None:
+                subscription = Subscription(user_id, self.max_pending)
+            else:
+                subscription = AsyncSubscription(user_id, self.max_pending, loop)
+            subscriptions.add(subscription)
+            self.streams += 1
+            first = len(subscriptions) == 1
+        if self.channel is not None:
+            self._start_poller()
+            if first:
+                self.channel.listen([user_id])
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Close a subscription"""
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.user_id)
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            self.streams -= 1
+            last = not subscriptions
+            if last:
+                del self.subscribers[subscription.user_id]
+        if last and self.channel is not None:
+            try:
+                self.channel.unlisten(subscription.user_id)
+            except sqlite3.Error:
+                # The note runs out after LISTENER_TTL anyway
+                pass
+
+    def has_subscribers(self, user_id):
+        """Whether anyone, in this process or another, is listening for this user's events"""
+        if self.channel is not None and self.poller is None:
+            self._start_poller()
+        return user_id in self.subscribers or user_id in self.remote
+
+    def publish(self, user_id, event, version=None):
+        """Send an event (already encoded) about `version` of a user's data to their open streams"""
+        self._deliver(user_id, event, version)
+        if self.channel is not None and user_id in self.remote:
+            try:
+                self.channel.publish(user_id, event, version)
+            except sqlite3.Error:
+                # The change itself is saved; those dashboards catch up on their next load
+                pass
+
+    def _deliver(self, user_id, event, version=None):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.push(event, version)
+
+    def subscriber_count(self):
+        """Open subscriptions across all users"""
+        with self.lock:
+            return self.streams
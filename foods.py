@@ -0,0 +1,148 @@
+"""
+HealthyLife Pro - Food database
+Common foods from the bundled data/foods.csv with their calories per typical
+portion, searched by name while logging a meal. The file is read and indexed
+on the first search rather than at startup.
+
+Prefix search bisects a sorted list of every word of every food name: the
+words starting with a query term form one contiguous block, found the way a
+trie would find them but without an object per letter. When that finds too
+few foods, names sharing the most character trigrams with the query fill in,
+which catches typos ("brocoli", "yoghurt").
+"""
+
+import csv
+import os
+import re
+import threading
+from bisect import bisect_left
+
+from records import Record
+
+FOODS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'foods.csv')
+MAX_RESULTS = 20
+MAX_QUERY_LENGTH = 64
+# Share of trigrams (Dice coefficient) a name needs in common with the query to match
+MIN_SIMILARITY = 0.35
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+def normalize(text):
+    """Lowercase words of a name or query, punctuation dropped"""
+    return _WORD_RE.findall(text.lower())
+
+def trigrams(words):
+    """Character trigrams of a word list, padded so word starts count extra"""
+    grams = set()
+    for word in words:
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def _amount(text):
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+class Food(Record):
+    """One food and its calories per typical portion"""
+    __slots__ = ('name', 'portion', 'portion_grams', 'calories', 'kcal_per_100g')
+
+    def __init__(self, name, kcal_per_100g, portion, portion_grams):
+        self.name = name
+        self.kcal_per_100g = kcal_per_100g
+        self.portion = portion
+        self.portion_grams = portion_grams
+        self.calories = round(kcal_per_100g * portion_grams / 100)
+
+class FoodIndex:
+    """Prefix and trigram indexes over a list of foods"""
+
+    def __init__(self, foods):
+        self.foods = foods
+        words = sorted((word, food_id) for food_id, food in enumerate(foods)
+                       for word in set(normalize(food.name)))
+        self.words = [word for word, _ in words]
+        self.word_foods = [food_id for _, food_id in words]
+
+        grams = {}
+        self.gram_counts = []
+        for food_id, food in enumerate(foods):
+            food_grams = trigrams(normalize(food.name))
+            self.gram_counts.append(len(food_grams))
+            for gram in food_grams:
+                grams.setdefault(gram, []).append(food_id)
+        self.grams = {gram: tuple(ids) for gram, ids in grams.items()}
+
+    @classmethod
+    def load(cls, path=FOODS_PATH):
+        """Read foods from a CSV of name, kcal_per_100g, portion, portion_grams"""
+        with open(path, newline='', encoding='utf-8') as source:
+            foods = [Food(row['name'], _amount(row['kcal_per_100g']), row['portion'],
+                          _amount(row['portion_grams']))
+                     for row in csv.DictReader(source)]
+        return cls(foods)
+
+    def _starting_with(self, term):
+        """Ids of foods with a word starting with term"""
+        start = bisect_left(self.words, term)
+        end = bisect_left(self.words, term + '\uffff', start)
+        return set(self.word_foods[start:end])
+
+    def prefix(self, terms):
+        """Ids of foods with a word starting with each term, best first"""
+        matches = None
+        for term in terms:
+            ids = self._starting_with(term)
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+        query = ' '.join(terms)
+
+        def rank(food_id):
+            # Names starting with the query first, then those with every term
+            # as a whole word ("egg" before "eggplant"), then shorter names
+            name = self.foods[food_id].name
+            return (not name.lower().startswith(query),
+                    not set(terms) <= set(normalize(name)), len(name), name)
+        return sorted(matches, key=rank)
+
+    def fuzzy(self, terms):
+        """Ids of foods whose names look like the terms, most similar first"""
+        query = trigrams(terms)
+        shared = {}
+        for gram in query:
+            for food_id in self.grams.get(gram, ()):
+                shared[food_id] = shared.get(food_id, 0) + 1
+        scored = [(2 * count / (len(query) + self.gram_counts[food_id]), food_id)
+                  for food_id, count in shared.items()]
+        scored = [item for item in scored if item[0] >= MIN_SIMILARITY]
+        scored.sort(key=lambda item: (-item[0], self.foods[item[1]].name))
+        return [food_id for _, food_id in scored]
+
+    def search(self, query, limit=8):
+        """Up to `limit` foods matching a query, prefix matches before fuzzy ones"""
+        terms = normalize(query[:MAX_QUERY_LENGTH])
+        if not terms:
+            return []
+        found = self.prefix(terms)[:limit]
+        if len(found) < limit:
+            seen = set(found)
+            found += [food_id for food_id in self.fuzzy(terms)
+                      if food_id not in seen][:limit - len(found)]
+        return [self.foods[food_id] for food_id in found]
+
+_index = None
+_index_lock = threading.Lock()
+
+def food_index():
+    """The bundled food index, loaded on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FoodIndex.load()
+    return _index
+
+def search_foods(query, limit=8):
+    """Foods matching a query from the bundled database"""
+    return food_index().search(query, limit)
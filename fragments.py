@@ -0,0 +1,65 @@
+"""
+HealthyLife Pro - Rendered-fragment cache
+Each dashboard section's HTML is kept per user, stamped with the version of
+the user's data it was rendered from, so a repeat page load only re-renders
+the sections that changed. Any save bumps the version, which makes every
+stamped fragment stale; a write handler then carries the sections it did
+not touch over to the new version. Saves made elsewhere (another worker,
+a rollover) just leave stale fragments to be re-rendered on next use.
+"""
+
+import threading
+from collections import OrderedDict
+
+MAX_FRAGMENTS = 20000
+
+class FragmentCache:
+    """Rendered HTML per (user, section), least recently used dropped past max_entries"""
+
+    def __init__(self, max_entries=MAX_FRAGMENTS):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (user_id, section) -> (version, html)
+        self.sections = {}            # section -> [hits, misses]
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, user_id, section, version, render):
+        """A section's HTML at `version`, calling render() only if it isn't cached"""
+        if not self.max_entries:
+            return render()
+        key = (user_id, section)
+        with self.lock:
+            counts = self.sections.setdefault(section, [0, 0])
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                counts[0] += 1
+                self.entries.move_to_end(key)
+                return entry[1]
+            counts[1] += 1
+        html = render()
+        with self.lock:
+            self.entries[key] = (version, html)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return html
+
+    def advance(self, user_id, old_version, new_version, sections):
+        """Carry fragments a save left unchanged from old_version to new_version"""
+        with self.lock:
+            for section in sections:
+                entry = self.entries.get((user_id, section))
+                if entry is not None and entry[0] == old_version:
+                    self.entries[(user_id, section)] = (new_version, entry[1])
+
+    def stats(self):
+        """Hits, misses and hit rate per section, plus the cache's size"""
+        with self.lock:
+            sections = {
+                section: {'hits': hits, 'misses': misses,
+                          'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None}
+                for section, (hits, misses) in self.sections.items()
+            }
+            return {'sections': sections, 'entries': len(self.entries),
+                    'max_entries': self.max_entries, 'evictions': self.evictions}
@@ -0,0 +1,72 @@
+"""
+HealthyLife Pro - Daily history
+Each user's log is partitioned by day; at rollover the finished day is sealed
+into a compact record and appended to the store instead of being discarded.
+"""
+
+from datetime import date, timedelta
+
+from records import as_json
+
+
+# Longest range a single history query may ask for
+MAX_RANGE_DAYS = 366
+
+def seal_day(data):
+    """Compact record of one finished day, leaving out anything never logged"""
+    record = {}
+    if data.water_count:
+        record['water_count'] = data.water_count
+    if data.habits:
+        record['habits'] = dict(data.habits)
+    if data.meals:
+        record['meals'] = [meal.to_json() for meal in data.meals]
+    if data.exercises:
+        record['exercises'] = [exercise.to_json() for exercise in data.exercises]
+    if data.sleep_data:
+        record['sleep_data'] = data.sleep_data.to_json()
+    return record
+
+def expand_day(day, record):
+    """Full day view of a sealed record, with empty defaults restored"""
+    return {
+        'day': day,
+        'water_count': record.get('water_count', 0),
+        'habits': record.get('habits', {}),
+        'meals': record.get('meals', []),
+        'exercises': record.get('exercises', []),
+        'sleep_data': record.get('sleep_data', {}),
+    }
+
+def parse_day(value):
+    """Parse a YYYY-MM-DD day key, raising ValueError if malformed"""
+    return date.fromisoformat(value)
+
+def day_range(start, end):
+    """Day keys from start to end inclusive, oldest first"""
+    first, last = parse_day(start), parse_day(end)
+    return [(first + timedelta(days=offset)).isoformat()
+            for offset in range((last - first).days + 1)]
+
+def shift_day(day, days):
+    """The day key `days` after (or before, if negative) `day`"""
+    return (parse_day(day) + timedelta(days=days)).isoformat()
+
+def add_entry(record, kind, entry):
+    """Add an imported entry to a day record, following the live logging rules"""
+    entry = as_json(entry)
+    if kind == 'meal':
+        # Like add_meal: a new meal replaces the one of the same type
+        meals = [m for m in record.get('meals', []) if m.get('type') != entry['type']]
+        record['meals'] = meals + [entry]
+    elif kind == 'exercise':
+        record['exercises'] = record.get('exercises', []) + [entry]
+    elif kind == 'sleep':
+        record['sleep_data'] = entry
+    elif kind == 'water':
+        record['water_count'] = entry['count']
+    elif kind == 'habits':
+        record['habits'] = {**record.get('habits', {}), **entry['habits']}
+    else:
+        raise ValueError(f'Unknown entry kind: {kind}')
+    return record
@@ -0,0 +1,42 @@
+"""
+HealthyLife Pro - Per-user locking
+A fixed set of lock stripes, picked by user id: requests for the same user
+always share a lock and run one at a time, while different users almost
+always land on different stripes and proceed in parallel.
+UserLocks guards threads (app.py); AsyncUserLocks guards coroutines (asgi.py).
+"""
+
+import asyncio
+import threading
+import zlib
+
+DEFAULT_STRIPES = 256
+
+def _stripe(user_id, stripes):
+    # crc32 rather than hash(): stable across processes and restarts
+    return stripes[zlib.crc32(user_id.encode('utf-8')) % len(stripes)]
+
+class UserLocks:
+    """Lock-striped map from user id to a re-entrant lock"""
+
+    def __init__(self, stripes=DEFAULT_STRIPES):
+        # Re-entrant, so a handler holding its user's lock can call helpers that take it too
+        self.stripes = [threading.RLock() for _ in range(stripes)]
+
+    def __call__(self, user_id):
+        """The lock guarding one user's data"""
+        return _stripe(user_id, self.stripes)
+
+class AsyncUserLocks:
+    """Lock-striped map from user id to an asyncio lock
+
+    Waiting for a busy user suspends only that request's coroutine, never the
+    event loop. Unlike UserLocks these are not re-entrant.
+    """
+
+    def __init__(self, stripes=DEFAULT_STRIPES):
+        self.stripes = [asyncio.Lock() for _ in range(stripes)]
+
+    def __call__(self, user_id):
+        """The lock guarding one user's data"""
+        return _stripe(user_id, self.stripes)
@@ -0,0 +1,84 @@
+"""
+HealthyLife Pro - Exercise calorie estimates
+Calories burned are worked out from an activity's MET (metabolic equivalent)
+value in the bundled data/met.csv, the session's duration and the user's
+body weight, for exercises logged without a calorie count of their own.
+
+Names are normalized once when the table is loaded, so looking an exercise
+up is a dict lookup: the whole name first ("Rock climbing"), then the longest
+run of its words that is a known activity ("Morning run" finds "run").
+"""
+
+import csv
+import os
+import re
+
+MET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'met.csv')
+# Used until the user sets their weight in their profile
+DEFAULT_WEIGHT_KG = 70
+MAX_NAME_WORDS = 8
+
+_WORD_RE = re.compile(r'[a-z]+')
+
+def activity_key(name):
+    """Lookup key for an exercise name: lowercase words, plural "s" dropped"""
+    return ' '.join(word[:-1] if len(word) > 3 and word.endswith('s') else word
+                    for word in _WORD_RE.findall(name.lower()))
+
+def calories_burned(met, minutes, weight_kg):
+    """Calories for `minutes` of an activity at `met` by someone weighing weight_kg"""
+    return round(met * 3.5 * weight_kg / 200 * minutes)
+
+class MetTable:
+    """MET values by normalized activity name"""
+
+    def __init__(self, mets):
+        self.mets = mets
+
+    @classmethod
+    def load(cls, path=MET_PATH):
+        """Read MET values from a CSV of activity, met"""
+        with open(path, newline='', encoding='utf-8') as source:
+            return cls({activity_key(row['activity']): float(row['met'])
+                        for row in csv.DictReader(source)})
+
+    def lookup(self, name):
+        """MET value for an exercise name, or None if no activity matches"""
+        key = activity_key(name)
+        met = self.mets.get(key)
+        if met is not None or not key:
+            return met
+        words = key.split()[:MAX_NAME_WORDS]
+        for length in range(len(words) - 1, 0, -1):
+            for start in range(len(words) - length + 1):
+                met = self.mets.get(' '.join(words[start:start + length]))
+                if met is not None:
+                    return met
+        return None
+
+    def estimate(self, name, minutes, weight_kg=None):
+        """Calories burned by one exercise, or None if its activity is unknown"""
+        met = self.lookup(name)
+        if met is None:
+            return None
+        return calories_burned(met, minutes, weight_kg or DEFAULT_WEIGHT_KG)
+
+    def fill_calories(self, exercises, weight_kg=None):
+        """Estimate calories for exercises that have none, returning those left unknown
+
+        Takes any number of exercises at once, say a whole import batch or a
+        user's history, looking each distinct name up only once.
+        """
+        weight_kg = weight_kg or DEFAULT_WEIGHT_KG
+        mets = {}
+        unknown = []
+        for exercise in exercises:
+            if exercise.calories is not None:
+                continue
+            name = exercise.name
+            met = mets[name] if name in mets else mets.setdefault(name, self.lookup(name))
+            if met is None:
+                unknown.append(exercise)
+            else:
+                exercise.calories = calories_burned(met, exercise.duration, weight_kg)
+        return unknown
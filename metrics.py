@@ -0,0 +1,147 @@
+"""
+HealthyLife Pro - Metrics
+Histograms and counters exported in Prometheus text format. Each thread
+records into its own shard without taking a lock; a scrape adds the shards
+up. Shards of threads that have exited are folded into one retired shard so
+short-lived threads don't pile up.
+"""
+
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from functools import wraps
+
+SECONDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BYTES = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+
+class Metrics:
+    """A registry of histograms and counters, sharded per thread"""
+
+    def __init__(self, prefix='healthylife'):
+        self.prefix = prefix
+        self.enabled = True
+        self.help = {}       # name -> (type, help text, buckets)
+        self.shards = []     # live threads' shards
+        self.retired = {}    # merged shards of exited threads
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets=SECONDS):
+        """Declare a histogram"""
+        self.help[name] = ('histogram', help_text, buckets)
+
+    def counter(self, name, help_text):
+        """Declare a counter"""
+        self.help[name] = ('counter', help_text, None)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self.shards.append(shard)
+            weakref.finalize(threading.current_thread(), self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            self.shards.remove(shard)
+            _merge(self.retired, shard)
+
+    def observe(self, name, labels, value):
+        """Record one value in a histogram; labels is a tuple of (key, value) pairs"""
+        if not self.enabled:
+            return
+        buckets = self.help[name][2]
+        shard = self._shard()
+        series = shard.get((name, labels))
+        if series is None:
+            # One count per bucket plus +Inf, then the running sum
+            series = shard[(name, labels)] = [0] * (len(buckets) + 1) + [0.0]
+        series[bisect_left(buckets, value)] += 1
+        series[-1] += value
+
+    def inc(self, name, labels, amount=1):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        shard = self._shard()
+        series = shard.get((name, labels))
+        if series is None:
+            series = shard[(name, labels)] = [0]
+        series[0] += amount
+
+    def timed(self, name, label_name, label=None):
+        """Decorator recording a function's run time in histogram `name`"""
+        def decorate(func):
+            labels = ((label_name, label or func.__name__),)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, labels, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        """Every series summed across threads, as {(name, labels): values}"""
+        with self._lock:
+            shards = [shard.copy() for shard in self.shards]
+            total = {key: list(values) for key, values in self.retired.items()}
+        for shard in shards:
+            _merge(total, shard)
+        return total
+
+    def render(self):
+        """All metrics in Prometheus text exposition format"""
+        by_name = {}
+        for (name, labels), values in sorted(self.snapshot().items()):
+            by_name.setdefault(name, []).append((labels, values))
+
+        lines = []
+        for name, (kind, help_text, buckets) in self.help.items():
+            full_name = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            for labels, values in by_name.get(name, ()):
+                if kind == 'counter':
+                    lines.append(f'{full_name}{_labels(labels)} {values[0]}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), values):
+                    cumulative += count
+                    lines.append(f'{full_name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{full_name}_sum{_labels(labels)} {values[-1]}')
+                lines.append(f'{full_name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+def _merge(total, shard):
+    for key, values in shard.items():
+        current = total.get(key)
+        if current is None:
+            total[key] = list(values)
+        else:
+            for index, value in enumerate(values):
+                current[index] += value
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+def instrument_storage(storage, metrics, name='storage_duration_seconds'):
+    """Time a storage backend's calls, keeping the backend's own type"""
+    for operation in ('load', 'save', 'save_with_days', 'seal_day', 'merge_days', 'load_days',
+                      'load_rollups'):
+        method = getattr(storage, operation, None)
+        if method is not None:
+            setattr(storage, operation, metrics.timed(name, 'operation', operation)(method))
+    return storage
@@ -0,0 +1,242 @@
+"""
+HealthyLife Pro - Record types
+Slotted classes for logged meals, exercises and sleep and for a user's day.
+Entries are validated when they come in and keep only their known fields.
+"""
+
+from rollover import validate_timezone
+from sleep import SleepLog
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snack')
+
+DEFAULT_HABITS = ('meditation', 'exercise', 'reading', 'water_intake', 'healthy_eating')
+
+def _object(payload, what):
+    """The payload itself, raising ValueError unless it is a JSON object"""
+    if not isinstance(payload, dict):
+        raise ValueError(f'{what} must be a JSON object')
+    return payload
+
+def _number(payload, field, minimum=0, maximum=None):
+    value = payload.get(field)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f'{field} must be a number')
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f'{field} out of range')
+    return value
+
+def _text(payload, field):
+    value = payload.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f'{field} is required')
+    return value.strip()
+
+def _clock(value, field):
+    """Minutes after midnight for an HH:MM time"""
+    try:
+        hour, minute = map(int, value.split(':'))
+    except (AttributeError, ValueError):
+        raise ValueError(f'{field} must be HH:MM') from None
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f'{field} must be HH:MM')
+    return hour * 60 + minute
+
+def _timestamp(payload):
+    value = payload.get('timestamp', '')
+    if value:
+        _clock(value, 'timestamp')
+    return value
+
+def sleep_duration(bedtime, wake_time):
+    """Hours slept between two HH:MM times, crossing midnight if needed"""
+    bed_total = _clock(bedtime, 'bedtime')
+    wake_total = _clock(wake_time, 'wake_time')
+    if wake_total < bed_total:
+        wake_total += 24 * 60
+    return round((wake_total - bed_total) / 60.0, 1)
+
+class Record:
+    """Base for slotted records that round-trip through JSON"""
+    __slots__ = ()
+
+    def to_json(self):
+        """The record as a JSON-ready dict"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_json() == other.to_json()
+
+    def __repr__(self):
+        fields = ', '.join(f'{f}={getattr(self, f)!r}' for f in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+class Meal(Record):
+    """A logged meal"""
+    __slots__ = ('type', 'items', 'calories', 'timestamp')
+
+    def __init__(self, type, items, calories, timestamp=''):
+        self.type = type
+        self.items = items
+        self.calories = calories
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_json(cls, payload):
+        """Validate a meal from client or stored JSON"""
+        _object(payload, 'meal')
+        meal_type = _text(payload, 'type').lower()
+        if meal_type not in MEAL_TYPES:
+            raise ValueError(f'type must be one of {", ".join(MEAL_TYPES)}')
+        return cls(meal_type, _text(payload, 'items'), _number(payload, 'calories'),
+                   _timestamp(payload))
+
+class Exercise(Record):
+    """A logged exercise session; calories left out are None until estimated"""
+    __slots__ = ('name', 'duration', 'calories', 'timestamp')
+
+    def __init__(self, name, duration, calories, timestamp=''):
+        self.name = name
+        self.duration = duration
+        self.calories = calories
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_json(cls, payload):
+        """Validate an exercise from client or stored JSON"""
+        _object(payload, 'exercise')
+        calories = None if payload.get('calories') is None else _number(payload, 'calories')
+        return cls(_text(payload, 'name'), _number(payload, 'duration'), calories,
+                   _timestamp(payload))
+
+class Sleep(Record):
+    """A logged night's sleep"""
+    __slots__ = ('bedtime', 'wake_time', 'quality', 'duration')
+
+    def __init__(self, bedtime, wake_time, quality, duration):
+        self.bedtime = bedtime
+        self.wake_time = wake_time
+        self.quality = quality
+        self.duration = duration
+
+    @classmethod
+    def from_json(cls, payload):
+        """Validate a night's sleep, working out its duration"""
+        _object(payload, 'sleep')
+        bedtime = payload.get('bedtime')
+        wake_time = payload.get('wake_time')
+        return cls(bedtime, wake_time, _number(payload, 'quality', 1, 10),
+                   sleep_duration(bedtime, wake_time))
+
+def validate_water(payload):
+    """A day's glass count"""
+    _object(payload, 'water')
+    return {'count': int(_number(payload, 'count', 0, 100))}
+
+def validate_habits(payload):
+    """Habit names mapped to whether they were completed"""
+    habits = _object(payload, 'habits').get('habits')
+    if not isinstance(habits, dict) or not all(
+            isinstance(name, str) and name and isinstance(done, bool)
+            for name, done in habits.items()):
+        raise ValueError('habits must map habit names to true/false')
+    return {'habits': habits}
+
+def validate_profile(payload):
+    """Changes to a user's settings; fields left out are kept as they are"""
+    if not isinstance(payload, dict) or not payload:
+        raise ValueError('profile must be an object of settings to change')
+    changes = {}
+    for field, value in payload.items():
+        if field == 'timezone':
+            changes['timezone'] = validate_timezone(value)
+        elif field == 'weight_kg':
+            changes['weight_kg'] = _number(payload, 'weight_kg', 20, 400)
+        elif field == 'sleep_target_hours':
+            changes['sleep_target_hours'] = _number(payload, 'sleep_target_hours', 4, 12)
+        else:
+            raise ValueError(f'Unknown profile setting: {field}')
+    return changes
+
+def as_json(entry):
+    """JSON form of a record, or the entry itself if it is already plain data"""
+    return entry.to_json() if isinstance(entry, Record) else entry
+
+class DayState:
+    """One user's data for the day in progress"""
+    __slots__ = ('water_count', 'habits', 'meals', 'exercises', 'sleep_data',
+                 'totals', 'last_updated', 'profile', 'version', 'sleep_log')
+
+    def __init__(self, last_updated, habits=None, water_count=0, meals=None,
+                 exercises=None, sleep_data=None, totals=None, profile=None, version=0,
+                 sleep_log=None):
+        self.last_updated = last_updated
+        self.profile = profile if profile is not None else {}
+        # Bumped on every save; tags cached copies of the user's pages
+        self.version = version
+        self.water_count = water_count
+        self.habits = habits if habits is not None else dict.fromkeys(DEFAULT_HABITS, False)
+        self.meals = meals if meals is not None else []
+        self.exercises = exercises if exercises is not None else []
+        self.sleep_data = sleep_data
+        self.totals = totals
+        # Recent nights for sleep analytics; None until built from history
+        self.sleep_log = sleep_log
+
+    def start_day(self, day):
+        """Clear the log for a new day, keeping the user's habit list, profile and recent nights"""
+        self.last_updated = day
+        self.water_count = 0
+        self.habits = dict.fromkeys(self.habits, False)
+        self.meals = []
+        self.exercises = []
+        self.sleep_data = None
+
+    def to_json(self):
+        """The day as a JSON-ready dict"""
+        return {
+            'water_count': self.water_count,
+            'habits': self.habits,
+            'meals': [meal.to_json() for meal in self.meals],
+            'exercises': [exercise.to_json() for exercise in self.exercises],
+            'sleep_data': self.sleep_data.to_json() if self.sleep_data else {},
+            'totals': self.totals,
+            'last_updated': self.last_updated,
+            'profile': self.profile,
+            'version': self.version,
+            'sleep_log': self.sleep_log.to_json() if self.sleep_log is not None else None,
+        }
+
+    @classmethod
+    def from_json(cls, payload):
+        """Rebuild a day from stored JSON, dropping entries that no longer validate"""
+        dropped = False
+
+        def load(record_type, item):
+            nonlocal dropped
+            try:
+                return record_type.from_json(item)
+            except ValueError:
+                dropped = True
+                return None
+
+        meals = [m for m in (load(Meal, item) for item in payload.get('meals', [])) if m]
+        exercises = [e for e in (load(Exercise, item) for item in payload.get('exercises', [])) if e]
+        sleep = load(Sleep, payload['sleep_data']) if payload.get('sleep_data') else None
+        try:
+            sleep_log = SleepLog.from_json(payload['sleep_log']) if payload.get('sleep_log') else None
+        except ValueError:
+            # Rebuilt from history when next needed
+            sleep_log = None
+        return cls(
+            payload['last_updated'],
+            habits=payload.get('habits'),
+            water_count=payload.get('water_count', 0),
+            meals=meals,
+            exercises=exercises,
+            sleep_data=sleep,
+            # Totals no longer match once an entry is dropped; they get rebuilt
+            totals=None if dropped else payload.get('totals'),
+            profile=payload.get('profile'),
+            version=payload.get('version', 0),
+            sleep_log=sleep_log,
+        )
@@ -0,0 +1,63 @@
+"""
+HealthyLife Pro - Conditional and compressed responses
+Per-user pages and reports are tagged with the user's data version, which
+every save bumps, so a client revalidating an unchanged one gets a 304
+before anything is rendered. Bodies that must be sent are compressed on the
+fly when they are big enough for it to pay off.
+"""
+
+import gzip
+import hashlib
+import zlib
+
+from assets import brotli, negotiate_encoding
+
+# Smaller bodies fit in a packet or two anyway; compressing them costs more than it saves
+MIN_COMPRESS_BYTES = 1024
+COMPRESSIBLE_TYPES = ('text/html', 'application/json', 'text/plain')
+
+# Per-user responses may be stored, but only by the browser and only until revalidated
+REVALIDATE_CACHE_CONTROL = 'private, no-cache'
+
+def source_tag(*paths):
+    """Short digest of source files, so a deploy never revalidates stale responses"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()[:8]
+
+def user_etag(user_id, version, *parts):
+    """Weak ETag for one user's response at one data version"""
+    tag = '.'.join([f'{zlib.crc32(user_id.encode("utf-8")):08x}', str(version),
+                    *map(str, parts)])
+    return f'W/"{tag}"'
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header names etag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == opaque for tag in if_none_match.split(','))
+
+def compressible(content_type):
+    """Whether responses of this type are worth compressing"""
+    return (content_type or '').split(';', 1)[0].strip() in COMPRESSIBLE_TYPES
+
+def compress_body(body, accept_encoding):
+    """Return (encoding, body), compressed if it is big enough and the client accepts it
+
+    Uses faster settings than the precompressed static assets, since this
+    runs on every response.
+    """
+    if len(body) < MIN_COMPRESS_BYTES:
+        return 'identity', body
+    offered = ('br', 'gzip', 'identity') if brotli is not None else ('gzip', 'identity')
+    encoding = negotiate_encoding(accept_encoding, offered)
+    if encoding == 'br':
+        return encoding, brotli.compress(body, quality=5)
+    if encoding == 'gzip':
+        return encoding, gzip.compress(body, compresslevel=6, mtime=0)
+    return encoding, body
@@ -0,0 +1,144 @@
+"""
+HealthyLife Pro - Daily rollover
+A user's day ends at midnight in their own timezone. Day keys are cached
+per timezone until that zone's next midnight, so checking whether a day has
+ended costs a dict lookup and a string compare rather than formatting the
+clock on every request. Recently active users are tracked with the day
+they are on, and a background sweep seals and resets each one's day shortly
+after their midnight, so the first request of the morning finds the new day
+already waiting. Requests still roll a day over themselves if the sweep has
+not reached it yet.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+MAX_TRACKED_USERS = 100000
+SWEEP_INTERVAL = 30
+
+# Timezone name (None for the server's local time) -> (day key, valid until epoch seconds)
+_day_keys = {}
+
+@lru_cache(maxsize=None)
+def _zone(timezone):
+    return ZoneInfo(timezone) if timezone else None
+
+def validate_timezone(timezone):
+    """An IANA timezone name such as "Europe/Berlin", raising ValueError if unknown"""
+    if not isinstance(timezone, str) or not timezone:
+        raise ValueError('timezone must be a name such as "Europe/Berlin"')
+    try:
+        _zone(timezone)
+    except (KeyError, ValueError):
+        # ZoneInfoNotFoundError is a KeyError; malformed names raise ValueError
+        raise ValueError(f'Unknown timezone: {timezone}') from None
+    return timezone
+
+def today(timezone=None):
+    """The current day key (YYYY-MM-DD) in a timezone, or in server local time"""
+    now = time.time()
+    cached = _day_keys.get(timezone)
+    if cached is not None and now < cached[1]:
+        return cached[0]
+    local = datetime.fromtimestamp(now, _zone(timezone))
+    midnight = datetime.combine(local.date() + timedelta(days=1), datetime.min.time(),
+                                local.tzinfo)
+    day = local.date().isoformat()
+    _day_keys[timezone] = (day, midnight.timestamp())
+    return day
+
+def clock(timezone=None):
+    """The current HH:MM in a timezone, or in server local time"""
+    return datetime.now(_zone(timezone)).strftime('%H:%M')
+
+class RolloverScheduler:
+    """Recently active users and the day each is on, for the background sweep
+
+    Only the last max_users users seen are tracked; anyone dropped is rolled
+    over by their next request instead. The sweep thread is started by the
+    first track() after start(), so a pre-fork master that never serves a
+    request never runs one.
+    """
+
+    def __init__(self, max_users=MAX_TRACKED_USERS):
+        self.max_users = max_users
+        self.users = OrderedDict()  # user_id -> (timezone, day key)
+        self.counters = {'sweeps': 0, 'rolled': 0, 'errors': 0}
+        self.lock = threading.Lock()
+        self.roll = None
+        self.interval = SWEEP_INTERVAL
+        self.thread = None
+
+    def track(self, user_id, timezone, day):
+        """Note that a user is active and on `day`"""
+        with self.lock:
+            self.users[user_id] = (timezone, day)
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+            if self.roll is not None and self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='rollover', daemon=True)
+                self.thread.start()
+
+    def forget(self, user_id):
+        """Stop tracking a user"""
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def due(self):
+        """Tracked users whose day has ended"""
+        with self.lock:
+            tracked = list(self.users.items())
+        return [user_id for user_id, (timezone, day) in tracked if day < today(timezone)]
+
+    def _count(self, user_id, error):
+        with self.lock:
+            if error:
+                self.counters['errors'] += 1
+                # Leave them to their next request rather than retrying forever
+                self.users.pop(user_id, None)
+            else:
+                self.counters['rolled'] += 1
+
+    def sweep(self, roll):
+        """Call roll(user_id) for every user whose day has ended"""
+        for user_id in self.due():
+            try:
+                roll(user_id)
+            except Exception:
+                self._count(user_id, True)
+            else:
+                self._count(user_id, False)
+        with self.lock:
+            self.counters['sweeps'] += 1
+
+    async def sweep_async(self, roll):
+        """sweep() for a coroutine function roll(user_id)"""
+        for user_id in self.due():
+            try:
+                await roll(user_id)
+            except Exception:
+                self._count(user_id, True)
+            else:
+                self._count(user_id, False)
+        with self.lock:
+            self.counters['sweeps'] += 1
+
+    def start(self, roll, interval=SWEEP_INTERVAL):
+        """Sweep with roll(user_id) every `interval` seconds once users are tracked"""
+        self.roll = roll
+        self.interval = interval
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sweep(self.roll)
+
+    def stats(self):
+        """Sweep counts and how many users are tracked"""
+        with self.lock:
+            return {**self.counters, 'tracked': len(self.users), 'max_users': self.max_users}
@@ -0,0 +1,72 @@
+"""
+HealthyLife Pro - Production server
+Pre-fork launcher built on gunicorn: a master process supervises several
+worker processes, each serving requests from a pool of threads over
+keep-alive connections. Send the master SIGHUP to reload the code and
+replace the workers gracefully, without dropping requests in flight.
+
+Requires: pip install gunicorn
+"""
+
+from sessions import MemorySessionStore
+from storage import CachedStorage, MemoryStorage, WriteBehindStorage
+
+def check_shared_state(storage, session_store, workers, broker=None):
+    """Refuse several workers when each would keep its own copy of users' data"""
+    if workers > 1 and isinstance(storage, MemoryStorage):
+        raise ValueError(
+            'In-memory storage is private to each worker process, so users would see '
+            'different data on every request. Use --workers 1 or configure shared storage, '
+            'e.g. HEALTHYLIFE_STORAGE=sqlite:///healthylife.db')
+    if workers > 1 and isinstance(storage, CachedStorage):
+        raise ValueError(
+            'The user cache is private to each worker process, so a worker would serve and '
+            'overwrite data another worker had changed. Use --workers 1 or unset '
+            'HEALTHYLIFE_CACHE_USERS.')
+    if workers > 1 and isinstance(storage, WriteBehindStorage):
+        raise ValueError(
+            'The write-behind buffer is private to each worker process, so workers would '
+            'overwrite each other\'s saves. Use --workers 1 or unset HEALTHYLIFE_WRITE_BEHIND.')
+    if workers > 1 and isinstance(session_store, MemorySessionStore):
+        raise ValueError(
+            'In-memory sessions are private to each worker process, so a browser would be '
+            'a different user on every worker. Use --workers 1 or set '
+            'HEALTHYLIFE_SESSIONS=sqlite:///healthylife.db')
+    if workers > 1 and broker is not None and broker.channel is None:
+        raise ValueError(
+            'Without an event channel, live updates only reach dashboards streaming from '
+            'the worker that made the change. Use --workers 1 or set '
+            'HEALTHYLIFE_EVENTS=sqlite:///healthylife.db')
+
+def serve(app_path, host='0.0.0.0', port=5000, workers=2, threads=4, keepalive=5,
+          timeout=30, graceful_timeout=30, max_requests=0):
+    """Run the WSGI app at app_path ("module:attribute") under gunicorn until stopped"""
+    try:
+        from gunicorn.app.base import BaseApplication
+        from gunicorn.util import import_app
+    except ImportError:
+        raise SystemExit('Production mode needs gunicorn: pip install gunicorn') from None
+
+    options = {
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'threads': threads,
+        # gthread workers keep idle client connections open this many seconds
+        'keepalive': keepalive,
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests // 10,
+        'worker_class': 'gthread',
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Imported in each worker, so a SIGHUP reload picks up new code
+            return import_app(app_path)
+
+    Server().run()
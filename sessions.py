@@ -0,0 +1,195 @@
+"""
+HealthyLife Pro - Server-side sessions
+The session cookie holds only an opaque random id; the session's contents
+live in a store (in-memory LRU or SQLite). A request that doesn't change its
+session writes nothing and sends no cookie, so reads skip serialization and
+signing entirely.
+
+Sessions are only started by a visitor's first change to their data, and
+stored ones expire along with their cookie, so the stores don't fill up with
+visitors who never come back.
+
+Pick a store with HEALTHYLIFE_SESSIONS ("memory://" or "sqlite:///path.db");
+by default sessions live wherever HEALTHYLIFE_STORAGE keeps users' data.
+"""
+
+import json
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{43}$')
+SESSION_LIFETIME = timedelta(days=400)
+MAX_MEMORY_SESSIONS = 100000
+# How often a store deletes sessions whose cookie has expired
+PURGE_INTERVAL = 3600
+
+def new_session_id():
+    """A fresh unguessable session id (256 random bits)"""
+    return secrets.token_urlsafe(32)
+
+class MemorySessionStore:
+    """Sessions in this process, dropping the least recently used past max_sessions"""
+
+    def __init__(self, max_sessions=MAX_MEMORY_SESSIONS):
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, session_id):
+        """A session's data, or None if it is unknown"""
+        with self.lock:
+            data = self.sessions.get(session_id)
+            if data is not None:
+                self.sessions.move_to_end(session_id)
+            return data
+
+    def save(self, session_id, data):
+        """Store a session's data"""
+        with self.lock:
+            self.sessions[session_id] = data
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+    def delete(self, session_id):
+        """Forget a session"""
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+class SQLiteSessionStore:
+    """Sessions in a SQLite table, shared by every worker using the file
+
+    Each row expires when its cookie does, SESSION_LIFETIME after it was last
+    saved; expired rows are never loaded and are deleted every PURGE_INTERVAL.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires INTEGER NOT NULL
+        ) WITHOUT ROWID
+    '''
+    LOAD_SQL = 'SELECT data FROM sessions WHERE session_id = ? AND expires > ?'
+    SAVE_SQL = ('INSERT INTO sessions (session_id, data, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, '
+                'expires = excluded.expires')
+    DELETE_SQL = 'DELETE FROM sessions WHERE session_id = ?'
+    PURGE_SQL = 'DELETE FROM sessions WHERE expires <= ?'
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self.next_purge = 0
+        conn = self._connect()
+        conn.execute(self.SCHEMA)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(sessions)')]
+        if 'expires' not in columns:
+            # Sessions saved before rows expired get a full lifetime from now
+            conn.execute('ALTER TABLE sessions ADD COLUMN expires INTEGER NOT NULL DEFAULT '
+                         f'{self._expiry()}')
+        conn.close()
+
+    def _expiry(self):
+        return int(time.time() + SESSION_LIFETIME.total_seconds())
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @property
+    def connection(self):
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def load(self, session_id):
+        """A session's data, or None if it is unknown"""
+        row = self.connection.execute(self.LOAD_SQL, (session_id, int(time.time()))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, data):
+        """Store a session's data until its cookie expires"""
+        self.connection.execute(self.SAVE_SQL, (session_id, json.dumps(data, separators=(',', ':')),
+                                                self._expiry()))
+        self.purge()
+
+    def purge(self, force=False):
+        """Delete expired sessions, at most once every PURGE_INTERVAL unless forced"""
+        now = time.time()
+        if not force and now < self.next_purge:
+            return 0
+        self.next_purge = now + PURGE_INTERVAL
+        return self.connection.execute(self.PURGE_SQL, (int(now),)).rowcount
+
+    def delete(self, session_id):
+        """Forget a session"""
+        self.connection.execute(self.DELETE_SQL, (session_id,))
+
+def create_session_store(url):
+    """Create a session store from a URL such as "sqlite:///healthylife.db" """
+    if not url or url == 'memory://':
+        return MemorySessionStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteSessionStore(url[len('sqlite:///'):])
+    raise ValueError(f'Unsupported session store URL: {url}')
+
+class ServerSession(CallbackDict, SessionMixin):
+    """A session's data, noting whether the request changed it"""
+
+    def __init__(self, initial=None, session_id=None, new=False):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.session_id = session_id
+        self.new = new
+        self.modified = False
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by a session store"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        session_id = request.cookies.get(self.get_cookie_name(app))
+        if session_id and SESSION_ID_RE.match(session_id):
+            data = self.store.load(session_id)
+            if data is not None:
+                return ServerSession(data, session_id)
+        return ServerSession(session_id=new_session_id(), new=True)
+
+    def save_session(self, app, session, response):
+        if not session.modified:
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if not session.new:
+                self.store.delete(session.session_id)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        self.store.save(session.session_id, dict(session))
+        response.set_cookie(
+            name, session.session_id, max_age=SESSION_LIFETIME,
+            domain=domain, path=path,
+            httponly=self.get_cookie_httponly(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app) or 'Lax',
+        )
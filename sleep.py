@@ -0,0 +1,171 @@
+"""
+HealthyLife Pro - Sleep analytics
+Each user's last SLEEP_WINDOW nights are kept in a ring buffer along with
+running sums over them, so a newly logged night updates sleep debt, bedtime
+and wake-time regularity and the quality trend in constant time: its terms
+are added and those of the night it pushes out are subtracted.
+
+Bed and wake times are averaged as angles on a 24-hour clock (circular
+statistics), so nights at 23:30 and 00:30 average to midnight, not noon, and
+their spread is the circular standard deviation.
+"""
+
+import math
+
+SLEEP_WINDOW = 14
+TARGET_HOURS = 8
+# How far back a user's nights are looked for when their log is first built
+SLEEP_HISTORY_DAYS = 90
+
+MINUTES_PER_DAY = 24 * 60
+# Spread of bed or wake times, in minutes, that scores 0 for regularity
+IRREGULAR_MINUTES = 120
+
+# Running sums kept over the nights in the buffer
+(HOURS, BED_COS, BED_SIN, WAKE_COS, WAKE_SIN, QUALITY, SEQ_QUALITY) = range(7)
+
+def _minutes(clock):
+    hour, minute = clock.split(':')
+    return int(hour) * 60 + int(minute)
+
+def _angle(minutes):
+    return minutes / MINUTES_PER_DAY * 2 * math.pi
+
+def _circular(cos_sum, sin_sum, count):
+    """Mean clock time, spread in minutes and regularity of `count` times
+
+    Regularity is 100 when every time is the same, falling to 0 at a spread
+    of IRREGULAR_MINUTES or more.
+    """
+    length = math.hypot(cos_sum, sin_sum) / count
+    if length < 1e-9:
+        # Spread evenly round the clock: there is no mean time
+        return {'mean': None, 'deviation_minutes': None, 'regularity': 0}
+    mean = round(math.atan2(sin_sum, cos_sum) / (2 * math.pi) * MINUTES_PER_DAY) % MINUTES_PER_DAY
+    deviation = math.sqrt(-2 * math.log(min(length, 1.0))) / (2 * math.pi) * MINUTES_PER_DAY
+    return {'mean': f'{mean // 60:02d}:{mean % 60:02d}', 'deviation_minutes': round(deviation),
+            'regularity': round(max(0, 1 - deviation / IRREGULAR_MINUTES) * 100)}
+
+class SleepLog:
+    """Ring buffer of a user's most recent nights with running sums over them"""
+    __slots__ = ('nights', 'start', 'count', 'next_seq', 'sums', 'updates')
+
+    def __init__(self, capacity=SLEEP_WINDOW):
+        # Each night is (seq, day, bedtime minutes, wake minutes, hours, quality)
+        self.nights = [None] * capacity
+        self.start = 0
+        self.count = 0
+        self.next_seq = 0
+        self.sums = [0.0] * 7
+        self.updates = 0
+
+    @classmethod
+    def from_nights(cls, nights, capacity=SLEEP_WINDOW):
+        """A log of the latest of some (day, Sleep) pairs"""
+        log = cls(capacity)
+        for day, sleep in sorted(nights, key=lambda night: night[0])[-capacity:]:
+            log.record(day, sleep)
+        return log
+
+    def _apply(self, night, sign):
+        _, _, bedtime, wake_time, hours, quality = night
+        sums = self.sums
+        sums[HOURS] += sign * hours
+        sums[BED_COS] += sign * math.cos(_angle(bedtime))
+        sums[BED_SIN] += sign * math.sin(_angle(bedtime))
+        sums[WAKE_COS] += sign * math.cos(_angle(wake_time))
+        sums[WAKE_SIN] += sign * math.sin(_angle(wake_time))
+        sums[QUALITY] += sign * quality
+        sums[SEQ_QUALITY] += sign * night[0] * quality
+
+    def _resum(self):
+        # Adding and subtracting floats drifts; start the sums over once per lap of the buffer
+        self.sums = [0.0] * 7
+        for night in self.latest():
+            self._apply(night, 1)
+        self.updates = 0
+
+    def latest(self):
+        """Nights in the buffer, oldest first"""
+        capacity = len(self.nights)
+        return [self.nights[(self.start + i) % capacity] for i in range(self.count)]
+
+    def record(self, day, sleep):
+        """Add a night, replacing one already logged for the same day"""
+        capacity = len(self.nights)
+        newest = (self.start + self.count - 1) % capacity
+        if self.count and self.nights[newest][1] == day:
+            seq, slot = self.nights[newest][0], newest
+            self._apply(self.nights[slot], -1)
+        else:
+            if self.count and self.nights[newest][1] > day:
+                raise ValueError('nights must be recorded in order')
+            seq, self.next_seq = self.next_seq, self.next_seq + 1
+            if self.count == capacity:
+                slot = self.start
+                self._apply(self.nights[slot], -1)
+                self.start = (self.start + 1) % capacity
+            else:
+                slot = (self.start + self.count) % capacity
+                self.count += 1
+        night = (seq, day, _minutes(sleep.bedtime), _minutes(sleep.wake_time),
+                 sleep.duration, sleep.quality)
+        self.nights[slot] = night
+        self._apply(night, 1)
+        self.updates += 1
+        if self.updates >= capacity:
+            self._resum()
+
+    def stats(self, target_hours=TARGET_HOURS):
+        """Sleep debt, bedtime and wake-time regularity and quality trend over the buffer"""
+        count, sums = self.count, self.sums
+        stats = {'window': len(self.nights), 'nights': count, 'target_hours': target_hours}
+        if not count:
+            return {**stats, 'average_hours': None, 'sleep_debt_hours': 0, 'bedtime': None,
+                    'wake_time': None, 'consistency_score': None,
+                    'quality': {'average': None, 'trend_per_night': None}}
+
+        bedtime = _circular(sums[BED_COS], sums[BED_SIN], count)
+        wake_time = _circular(sums[WAKE_COS], sums[WAKE_SIN], count)
+        # Least-squares slope of quality over the nights, numbered from 0 for the oldest
+        first = self.nights[self.start][0]
+        x_sum = count * (count - 1) / 2
+        x_squares = (count - 1) * count * (2 * count - 1) / 6
+        xq_sum = sums[SEQ_QUALITY] - first * sums[QUALITY]
+        spread = count * x_squares - x_sum * x_sum
+        trend = (count * xq_sum - x_sum * sums[QUALITY]) / spread if spread else None
+        return {
+            **stats,
+            'average_hours': round(sums[HOURS] / count, 1),
+            # Hours short of the target over these nights; negative is a surplus
+            'sleep_debt_hours': round(count * target_hours - sums[HOURS], 1),
+            'bedtime': bedtime,
+            'wake_time': wake_time,
+            'consistency_score': round((bedtime['regularity'] + wake_time['regularity']) / 2),
+            'quality': {'average': round(sums[QUALITY] / count, 1),
+                        'trend_per_night': None if trend is None else round(trend, 2)},
+        }
+
+    def to_json(self):
+        """The log as a JSON-ready dict"""
+        return {'capacity': len(self.nights), 'nights': [list(night) for night in self.latest()],
+                'next_seq': self.next_seq, 'sums': self.sums, 'updates': self.updates}
+
+    @classmethod
+    def from_json(cls, payload):
+        """Rebuild a stored log, raising ValueError if it is malformed"""
+        try:
+            capacity = int(payload['capacity'])
+            nights = [tuple(night) for night in payload['nights']]
+            sums = [float(value) for value in payload['sums']]
+            next_seq, updates = int(payload['next_seq']), int(payload['updates'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Malformed sleep log') from None
+        if capacity < 1 or len(nights) > capacity or len(sums) != 7 or any(
+                len(night) != 6 for night in nights):
+            raise ValueError('Malformed sleep log')
+        log = cls(capacity)
+        log.nights[:len(nights)] = nights
+        log.count = len(nights)
+        log.next_seq, log.sums, log.updates = next_seq, sums, updates
+        return log
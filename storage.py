@@ -0,0 +1,586 @@
+"""
+HealthyLife Pro - Storage backends
+Pick one with HEALTHYLIFE_STORAGE: "memory://" (default) or "sqlite:///path/to/file.db"
+"""
+
+import asyncio
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics import rollup_day
+from history import add_entry, day_range
+from records import DayState
+
+MAX_MEMORY_USERS = 100000
+
+class SaveConflict(Exception):
+    """Another process saved the user's data since it was loaded"""
+
+class MemoryStorage:
+    """Keeps users' data in this process; lost on restart
+
+    Past max_users the least recently used user is forgotten along with
+    their history, the same way the in-memory session store forgets old
+    sessions, so the process stays a fixed size however many visitors come.
+    """
+
+    def __init__(self, max_users=MAX_MEMORY_USERS):
+        self.max_users = max_users
+        self.users = OrderedDict()
+        self.days = {}
+        self.rollups = {}
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def load(self, user_id):
+        """Return a user's data, or None for an unknown user"""
+        with self.lock:
+            data = self.users.get(user_id)
+            if data is not None:
+                self.users.move_to_end(user_id)
+            return data
+
+    def save(self, user_id, data):
+        """Store a user's data"""
+        with self.lock:
+            self.users[user_id] = data
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_users:
+                evicted, _ = self.users.popitem(last=False)
+                self.days.pop(evicted, None)
+                self.rollups.pop(evicted, None)
+                self.evictions += 1
+
+    def save_with_days(self, user_id, data, entries):
+        """Add imported entries to past days and store a user's data"""
+        self.merge_days(user_id, entries)
+        self.save(user_id, data)
+
+    # History is guarded by the same lock as the users, so eviction (which
+    # drops a user's history in save()) never interleaves with a seal or read
+
+    def seal_day(self, user_id, day, record, rollup):
+        """Append a finished day and its rollup; an already sealed day is kept"""
+        with self.lock:
+            self.days.setdefault(user_id, {}).setdefault(day, record)
+            self.rollups.setdefault(user_id, {}).setdefault(day, rollup)
+
+    def merge_days(self, user_id, entries):
+        """Add imported entries, as {day: [(kind, entry), ...]}, to past days"""
+        with self.lock:
+            days = self.days.setdefault(user_id, {})
+            rollups = self.rollups.setdefault(user_id, {})
+            for day, items in entries.items():
+                # Build a new record so readers holding the old one never see it change
+                record = dict(days.get(day, {}))
+                for kind, entry in items:
+                    add_entry(record, kind, entry)
+                days[day] = record
+                rollups[day] = rollup_day(record)
+
+    def load_days(self, user_id, start, end):
+        """Sealed (day, record) pairs from start to end inclusive, oldest first"""
+        with self.lock:
+            days = self.days.get(user_id)
+            if not days:
+                return []
+            # Probe each requested day rather than scanning the whole history
+            return [(day, days[day]) for day in day_range(start, end) if day in days]
+
+    def load_rollups(self, user_id, start, end):
+        """Sealed (day, rollup) pairs from start to end inclusive, oldest first"""
+        with self.lock:
+            rollups = self.rollups.get(user_id)
+            if not rollups:
+                return []
+            return [(day, rollups[day]) for day in day_range(start, end) if day in rollups]
+
+    def iter_rollups(self, batch_size=10000):
+        """Every user's sealed rollups as batches of (user_id, day, rollup)"""
+        # Snapshot under the lock, then batch without holding it
+        with self.lock:
+            snapshot = [(user_id, list(rollups.items()))
+                        for user_id, rollups in self.rollups.items()]
+        batch = []
+        for user_id, rollups in snapshot:
+            for day, rollup in rollups:
+                batch.append((user_id, day, rollup))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def stats(self):
+        """How many users are kept and how many have been forgotten"""
+        with self.lock:
+            return {'users': len(self.users), 'max_users': self.max_users,
+                    'evictions': self.evictions}
+
+    def close(self):
+        """Release resources held by this backend"""
+
+class SQLiteStorage:
+    """Stores users' data in a SQLite database shared by every worker
+
+    The database runs in WAL mode so readers never block the single writer,
+    and each thread keeps its own connection. Every query is a fixed SQL
+    string, so sqlite3's per-connection statement cache reuses the prepared
+    statement on each call.
+
+    User locks only guard threads of one process, so save() is optimistic:
+    it only replaces the version the data was loaded at (data.version - 1,
+    as app.save_user_data bumps it) and raises SaveConflict when another
+    worker got there first, for the caller to load again and retry.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS days (
+            user_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            record TEXT NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS rollups (
+            user_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            rollup TEXT NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID;
+    '''
+    LOAD_SQL = 'SELECT data FROM users WHERE user_id = ?'
+    UPDATE_SQL = 'UPDATE users SET data = ?, version = ? WHERE user_id = ? AND version = ?'
+    INSERT_SQL = ('INSERT INTO users (user_id, data, version) VALUES (?, ?, ?) '
+                  'ON CONFLICT(user_id) DO NOTHING')
+    # Unconditional, for write-behind batches: a single worker's latest data wins
+    SAVE_SQL = ('INSERT INTO users (user_id, data, version) '
+                "VALUES (?1, ?2, json_extract(?2, '$.version')) "
+                'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, version = excluded.version')
+    VERSION_BACKFILL_SQL = "UPDATE users SET version = COALESCE(json_extract(data, '$.version'), 0)"
+    SEAL_DAY_SQL = 'INSERT OR IGNORE INTO days (user_id, day, record) VALUES (?, ?, ?)'
+    SEAL_ROLLUP_SQL = 'INSERT OR IGNORE INTO rollups (user_id, day, rollup) VALUES (?, ?, ?)'
+    LOAD_DAY_SQL = 'SELECT record FROM days WHERE user_id = ? AND day = ?'
+    PUT_DAY_SQL = ('INSERT INTO days (user_id, day, record) VALUES (?, ?, ?) '
+                   'ON CONFLICT(user_id, day) DO UPDATE SET record = excluded.record')
+    PUT_ROLLUP_SQL = ('INSERT INTO rollups (user_id, day, rollup) VALUES (?, ?, ?) '
+                      'ON CONFLICT(user_id, day) DO UPDATE SET rollup = excluded.rollup')
+    # Served by the (user_id, day) primary key, so cost follows the range size
+    LOAD_DAYS_SQL = ('SELECT day, record FROM days '
+                     'WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day')
+    LOAD_ROLLUPS_SQL = ('SELECT day, rollup FROM rollups '
+                        'WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day')
+    ALL_ROLLUPS_SQL = 'SELECT user_id, day, rollup FROM rollups'
+    MISSING_ROLLUPS_SQL = ('SELECT d.user_id, d.day, d.record FROM days d '
+                           'LEFT JOIN rollups r ON r.user_id = d.user_id AND r.day = d.day '
+                           'WHERE r.day IS NULL')
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        # Create the schema up front, but leave per-thread connections to be
+        # opened lazily so forked workers never share a connection
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+        if 'version' not in columns:
+            # Users saved before versions were checked start at their stored version
+            conn.execute('ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+            conn.execute(self.VERSION_BACKFILL_SQL)
+        self._backfill_rollups(conn)
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _backfill_rollups(self, conn):
+        """Roll up days sealed before rollups were stored"""
+        rows = conn.execute(self.MISSING_ROLLUPS_SQL).fetchall()
+        if rows:
+            with conn:
+                conn.execute('BEGIN')
+                conn.executemany(self.SEAL_ROLLUP_SQL, [
+                    (user_id, day, json.dumps(rollup_day(json.loads(record)), separators=(',', ':')))
+                    for user_id, day, record in rows
+                ])
+
+    @property
+    def connection(self):
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def load(self, user_id):
+        """Return a user's data, or None for an unknown user"""
+        row = self.connection.execute(self.LOAD_SQL, (user_id,)).fetchone()
+        return self.decode(row[0]) if row else None
+
+    def save(self, user_id, data):
+        """Store a user's data, raising SaveConflict if their stored version has moved on"""
+        self._save(self.connection, user_id, data)
+
+    def _save(self, conn, user_id, data):
+        payload = self.encode(data)
+        if conn.execute(self.UPDATE_SQL,
+                        (payload, data.version, user_id, data.version - 1)).rowcount:
+            return
+        if not conn.execute(self.INSERT_SQL, (user_id, payload, data.version)).rowcount:
+            raise SaveConflict(user_id)
+
+    def save_with_days(self, user_id, data, entries):
+        """Add imported entries to past days and store a user's data in one transaction
+
+        On SaveConflict neither lands, so the caller can load and try again.
+        """
+        conn = self.connection
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._merge(conn, user_id, entries)
+            self._save(conn, user_id, data)
+
+    def encode(self, data):
+        """A user's data as the JSON text stored in the users table"""
+        return json.dumps(data.to_json(), separators=(',', ':'))
+
+    def decode(self, payload):
+        """A user's data from its stored JSON text"""
+        return DayState.from_json(json.loads(payload))
+
+    def save_encoded(self, rows):
+        """Store many users' encoded data, as (user_id, payload) pairs, in one transaction"""
+        conn = self.connection
+        with conn:
+            conn.execute('BEGIN')
+            conn.executemany(self.SAVE_SQL, rows)
+
+    def seal_day(self, user_id, day, record, rollup):
+        """Append a finished day and its rollup; an already sealed day is kept"""
+        conn = self.connection
+        with conn:
+            conn.execute('BEGIN')
+            conn.execute(self.SEAL_DAY_SQL,
+                         (user_id, day, json.dumps(record, separators=(',', ':'))))
+            conn.execute(self.SEAL_ROLLUP_SQL,
+                         (user_id, day, json.dumps(rollup, separators=(',', ':'))))
+
+    def merge_days(self, user_id, entries):
+        """Add imported entries, as {day: [(kind, entry), ...]}, to past days"""
+        conn = self.connection
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._merge(conn, user_id, entries)
+
+    def _merge(self, conn, user_id, entries):
+        for day, items in entries.items():
+            row = conn.execute(self.LOAD_DAY_SQL, (user_id, day)).fetchone()
+            record = json.loads(row[0]) if row else {}
+            for kind, entry in items:
+                add_entry(record, kind, entry)
+            conn.execute(self.PUT_DAY_SQL,
+                         (user_id, day, json.dumps(record, separators=(',', ':'))))
+            conn.execute(self.PUT_ROLLUP_SQL,
+                         (user_id, day, json.dumps(rollup_day(record), separators=(',', ':'))))
+
+    def load_days(self, user_id, start, end):
+        """Sealed (day, record) pairs from start to end inclusive, oldest first"""
+        rows = self.connection.execute(self.LOAD_DAYS_SQL, (user_id, start, end))
+        return [(day, json.loads(record)) for day, record in rows]
+
+    def load_rollups(self, user_id, start, end):
+        """Sealed (day, rollup) pairs from start to end inclusive, oldest first"""
+        rows = self.connection.execute(self.LOAD_ROLLUPS_SQL, (user_id, start, end))
+        return [(day, json.loads(rollup)) for day, rollup in rows]
+
+    def iter_rollups(self, batch_size=10000):
+        """Every user's sealed rollups as batches of (user_id, day, rollup)"""
+        cursor = self.connection.execute(self.ALL_ROLLUPS_SQL)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [(user_id, day, json.loads(rollup)) for user_id, day, rollup in rows]
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class WriteBehindStorage:
+    """Buffers saves to a SQLite backend and writes them in batches
+
+    A save only encodes the user's data and parks it; a background thread
+    writes everything parked every flush_interval seconds (sooner once
+    max_batch users are waiting), one transaction per batch. Saving a user
+    who is still waiting replaces their parked data, so a burst of clicks
+    costs one write. Loads see parked data first. Up to flush_interval
+    seconds of saves are lost if the process dies; the buffer is private to
+    the process, so it is for single-worker deployments.
+    """
+
+    def __init__(self, backend, flush_interval=0.25, max_batch=500):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.parked = {}     # user_id -> encoded data not yet handed to the flusher
+        self.in_flight = {}  # user_id -> encoded data being written right now
+        self.counters = {'saves': 0, 'coalesced': 0, 'flushes': 0, 'written': 0, 'errors': 0}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.flusher = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def load(self, user_id):
+        """Return a user's data, or None for an unknown user"""
+        with self.lock:
+            payload = self.parked.get(user_id) or self.in_flight.get(user_id)
+        if payload is not None:
+            return self.backend.decode(payload)
+        return self.backend.load(user_id)
+
+    def save(self, user_id, data):
+        """Park a user's data for the next flush"""
+        payload = self.backend.encode(data)
+        with self.lock:
+            self.counters['saves'] += 1
+            if user_id in self.parked:
+                self.counters['coalesced'] += 1
+            self.parked[user_id] = payload
+            full = len(self.parked) >= self.max_batch
+        if full:
+            self.wake.set()
+
+    def save_with_days(self, user_id, data, entries):
+        """Add imported entries to past days now and park a user's data"""
+        # Single-worker only, so no other process can get in between the two
+        self.backend.merge_days(user_id, entries)
+        self.save(user_id, data)
+
+    def flush(self):
+        """Write everything parked so far, a batch at a time"""
+        while True:
+            with self.lock:
+                if not self.parked:
+                    return
+                # Oldest first: re-saving a parked user keeps their place
+                batch = list(self.parked.items())[:self.max_batch]
+                for user_id, payload in batch:
+                    del self.parked[user_id]
+                    self.in_flight[user_id] = payload
+            try:
+                self.backend.save_encoded(batch)
+            except sqlite3.Error:
+                with self.lock:
+                    self.counters['errors'] += 1
+                    for user_id, payload in batch:
+                        self.parked.setdefault(user_id, payload)
+                        del self.in_flight[user_id]
+                return
+            with self.lock:
+                for user_id, _ in batch:
+                    del self.in_flight[user_id]
+                self.counters['flushes'] += 1
+                self.counters['written'] += len(batch)
+
+    def _run(self):
+        while not self.stopping:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def stats(self):
+        """Save, coalesce and flush counts, plus how many users are waiting"""
+        with self.lock:
+            return {**self.counters, 'pending': len(self.parked) + len(self.in_flight),
+                    'flush_interval': self.flush_interval, 'max_batch': self.max_batch}
+
+    def close(self):
+        """Stop the flusher and write whatever is still parked"""
+        if self.stopping:
+            return
+        self.stopping = True
+        self.wake.set()
+        self.flusher.join()
+        self.flush()
+        self.backend.close()
+
+    def __getattr__(self, name):
+        # Day history, rollups and imports go straight to the backend
+        return getattr(self.backend, name)
+
+class CachedStorage:
+    """Keeps recently active users' data in memory in front of a SQLite backend
+
+    Loads of a cached user skip the query and the JSON decode; saves write
+    through to the backend (which may itself be a WriteBehindStorage) and
+    refresh the cache. At most max_users are cached, least recently used
+    first out, and a user idle for ttl seconds is dropped (0 keeps them until
+    evicted). The cache is private to the process, so it is for
+    single-worker deployments: another worker's writes would not be seen.
+    """
+
+    def __init__(self, backend, max_users=10000, ttl=0):
+        self.backend = backend
+        self.max_users = max_users
+        self.ttl = ttl
+        self.entries = OrderedDict()  # user_id -> (data, last used), least recent first
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        # Least recently used entries are at the front, so stop at the first live one
+        while self.entries:
+            user_id, (_, used) = next(iter(self.entries.items()))
+            if now - used < self.ttl:
+                return
+            del self.entries[user_id]
+            self.counters['expired'] += 1
+
+    def _put(self, user_id, data, now):
+        self.entries[user_id] = (data, now)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_users:
+            self.entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def load(self, user_id):
+        """Return a user's data, or None for an unknown user"""
+        now = time.monotonic()
+        with self.lock:
+            if self.ttl:
+                self._expire(now)
+            entry = self.entries.get(user_id)
+            if entry is not None:
+                self.counters['hits'] += 1
+                self._put(user_id, entry[0], now)
+                return entry[0]
+            self.counters['misses'] += 1
+        data = self.backend.load(user_id)
+        if data is not None:
+            with self.lock:
+                self._put(user_id, data, now)
+        return data
+
+    def save(self, user_id, data):
+        """Store a user's data in the backend and the cache"""
+        self._store(user_id, data, self.backend.save, user_id, data)
+
+    def save_with_days(self, user_id, data, entries):
+        """Add imported entries to past days and store a user's data, as the backend does"""
+        self._store(user_id, data, self.backend.save_with_days, user_id, data, entries)
+
+    def _store(self, user_id, data, save, *args):
+        try:
+            save(*args)
+        except Exception:
+            # The cached copy may hold changes that never reached the backend
+            with self.lock:
+                self.entries.pop(user_id, None)
+            raise
+        with self.lock:
+            self._put(user_id, data, time.monotonic())
+
+    def stats(self):
+        """Hit, miss and eviction counts, plus the backend's own stats"""
+        stats = self.backend.stats() if hasattr(self.backend, 'stats') else {}
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            stats['cache'] = {**self.counters, 'users': len(self.entries),
+                              'max_users': self.max_users, 'ttl': self.ttl,
+                              'hit_rate': round(self.counters['hits'] / lookups, 4) if lookups else None}
+        return stats
+
+    def close(self):
+        """Drop the cache and close the backend"""
+        with self.lock:
+            self.entries.clear()
+        self.backend.close()
+
+    def __getattr__(self, name):
+        # Day history, rollups and imports go straight to the backend
+        return getattr(self.backend, name)
+
+class AsyncStorage:
+    """Awaitable view of a storage backend, for the ASGI app
+
+    SQLite calls run on a small thread pool so disk I/O never blocks the
+    event loop; the in-memory backend does no I/O and is called directly.
+    """
+
+    def __init__(self, backend, max_workers=8):
+        self.backend = backend
+        self.executor = (None if isinstance(backend, MemoryStorage)
+                         else ThreadPoolExecutor(max_workers, thread_name_prefix='storage'))
+
+    async def _call(self, func, *args):
+        if self.executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def run(self, func, *args):
+        """Run another blocking call (e.g. a session lookup) on the same pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def load(self, user_id):
+        """Return a user's data, or None for an unknown user"""
+        return await self._call(self.backend.load, user_id)
+
+    async def save(self, user_id, data):
+        """Store a user's data"""
+        await self._call(self.backend.save, user_id, data)
+
+    async def seal_day(self, user_id, day, record, rollup):
+        """Append a finished day and its rollup; an already sealed day is kept"""
+        await self._call(self.backend.seal_day, user_id, day, record, rollup)
+
+    async def load_days(self, user_id, start, end):
+        """Sealed (day, record) pairs from start to end inclusive, oldest first"""
+        return await self._call(self.backend.load_days, user_id, start, end)
+
+    async def load_rollups(self, user_id, start, end):
+        """Sealed (day, rollup) pairs from start to end inclusive, oldest first"""
+        return await self._call(self.backend.load_rollups, user_id, start, end)
+
+    def close(self):
+        """Stop the thread pool"""
+        if self.executor is not None:
+            self.executor.shutdown()
+
+def create_storage(url, write_behind=0, max_batch=500, cache_users=0, cache_ttl=0):
+    """Create a storage backend from a URL such as "sqlite:///healthylife.db"
+
+    A write_behind interval in seconds buffers SQLite saves (see
+    WriteBehindStorage); cache_users > 0 keeps that many active users in
+    memory in front of SQLite (see CachedStorage). For memory:// storage,
+    cache_users instead caps how many users are kept at all.
+    """
+    if not url or url == 'memory://':
+        # Memory saves are already free; there is nothing to batch or cache
+        return MemoryStorage(cache_users or MAX_MEMORY_USERS)
+    if url.startswith('sqlite:///'):
+        backend = SQLiteStorage(url[len('sqlite:///'):])
+        if write_behind > 0:
+            backend = WriteBehindStorage(backend, write_behind, max_batch)
+        if cache_users > 0:
+            backend = CachedStorage(backend, cache_users, cache_ttl)
+        return backend
+    raise ValueError(f'Unsupported storage URL: {url}')
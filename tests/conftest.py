@@ -0,0 +1,27 @@
+"""Run the tests against the app modules in the repository root"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Tests roll days over themselves rather than racing the background sweep
+os.environ.setdefault('HEALTHYLIFE_ROLLOVER_SWEEP', '0')
+
+import pytest
+
+@pytest.fixture
+def app(monkeypatch):
+    """The Flask app module with fresh in-memory storage, caches and rollover tracking"""
+    import app
+    from fragments import FragmentCache
+    from rollover import RolloverScheduler
+    from storage import MemoryStorage
+
+    monkeypatch.setattr(app, 'storage', MemoryStorage())
+    monkeypatch.setattr(app, 'fragment_cache', FragmentCache())
+    monkeypatch.setattr(app, 'rollovers', RolloverScheduler())
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
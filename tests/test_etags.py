@@ -0,0 +1,30 @@
+"""
+Conditional GETs: a client whose copy is current gets a 304 without the
+response being rebuilt, and any change to the user's data gives a new ETag.
+"""
+
+import pytest
+
+@pytest.mark.parametrize('path', ['/', '/api/analytics', '/api/sleep/analytics'])
+def test_etag_revalidation(client, path):
+    client.post('/api/water', json={'count': 2})
+    first = client.get(path)
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+
+    cached = client.get(path, headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert cached.get_data() == b''
+
+    client.post('/api/sleep', json={'bedtime': '23:00', 'wake_time': '07:00', 'quality': 7})
+    changed = client.get(path, headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+def test_etags_are_per_user(app, client):
+    client.post('/api/water', json={'count': 2})
+    etag = client.get('/').headers['ETag']
+    other = app.app.test_client()
+    other.post('/api/water', json={'count': 2})
+    assert other.get('/', headers={'If-None-Match': etag}).status_code == 200
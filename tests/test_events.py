@@ -0,0 +1,48 @@
+"""
+Live events: the per-process stream cap, and delivery between worker
+processes through a shared SQLite channel (two brokers stand in for two
+workers).
+"""
+
+import os
+import time
+
+from events import EventBroker, SQLiteEventChannel
+
+def wait_for(subscription, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        event = subscription.next(0.05)
+        if event is not None:
+            return event
+    return None
+
+def test_stream_cap():
+    broker = EventBroker(max_streams=2)
+    first, second = broker.subscribe('a'), broker.subscribe('b')
+    assert broker.subscribe('c') is None
+    broker.unsubscribe(first)
+    assert broker.subscribe('c') is not None
+    broker.unsubscribe(second)
+
+def test_events_cross_processes(tmp_path):
+    path = os.path.join(tmp_path, 'events.db')
+    writer = EventBroker(channel=SQLiteEventChannel(path), poll_interval=0.05)
+    reader = EventBroker(channel=SQLiteEventChannel(path), poll_interval=0.05)
+    subscription = reader.subscribe('user')
+    # The writer learns about the reader's stream on its next poll
+    deadline = time.monotonic() + 3
+    while not writer.has_subscribers('user') and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert writer.has_subscribers('user')
+    assert not writer.has_subscribers('someone else')
+
+    writer.publish('user', 'older', 1)
+    assert wait_for(subscription) == 'older'
+    # A relayed event about an older version than one already seen is dropped
+    reader.publish('user', 'local', 3)
+    writer.publish('user', 'stale', 2)
+    writer.publish('user', 'newer', 4)
+    assert wait_for(subscription) == 'local'
+    assert wait_for(subscription) == 'newer'
+    reader.unsubscribe(subscription)
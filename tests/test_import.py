@@ -0,0 +1,70 @@
+"""
+NDJSON import: past days go into history and today's lines into today's
+data, and a batch whose save keeps conflicting lands nowhere.
+"""
+
+import json
+import os
+
+import pytest
+
+import rollover
+from records import DayState, Meal
+from storage import CachedStorage, SaveConflict, SQLiteStorage
+
+TODAY, YESTERDAY = '2024-03-10', '2024-03-09'
+
+@pytest.fixture(autouse=True)
+def fixed_day(monkeypatch):
+    monkeypatch.setattr(rollover, 'today', lambda timezone=None: TODAY)
+
+def ndjson(*lines):
+    return '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines)
+
+LINES = ndjson(
+    {'kind': 'meal', 'day': YESTERDAY, 'type': 'dinner', 'items': 'Curry', 'calories': 700},
+    {'kind': 'water', 'day': YESTERDAY, 'count': 6},
+    'not json',
+    {'kind': 'meal', 'day': TODAY, 'type': 'breakfast', 'items': 'Oats', 'calories': 350},
+    {'kind': 'snack', 'day': TODAY},
+)
+
+def test_import_lands_in_history_and_today(app, client):
+    summary = client.post('/api/import', data=LINES).get_json()
+    assert summary['success'] and summary['imported'] == 3 and summary['failed'] == []
+    assert [error['line'] for error in summary['errors']] == [3, 5]
+
+    history = client.get(f'/api/history?start={YESTERDAY}&end={TODAY}').get_json()['days']
+    assert [meal['items'] for meal in history[0]['meals']] == ['Curry']
+    assert history[0]['water_count'] == 6
+    assert [meal['items'] for meal in history[1]['meals']] == ['Oats']
+
+def test_conflicting_batch_is_reported_and_not_saved(app, client, monkeypatch, tmp_path):
+    backend = SQLiteStorage(os.path.join(tmp_path, 'import.db'))
+    monkeypatch.setattr(app, 'storage', CachedStorage(backend))
+    client.post('/api/water', json={'count': 1})
+    # Another worker saves this user before every attempt
+    def conflict(user_id, data, entries):
+        raise SaveConflict(user_id)
+    monkeypatch.setattr(backend, 'save_with_days', conflict)
+
+    summary = client.post('/api/import', data=LINES).get_json()
+    assert not summary['success']
+    assert summary['imported'] == 0
+    assert [(batch['first_line'], batch['last_line']) for batch in summary['failed']] == [(1, 4)]
+    history = client.get(f'/api/history?start={YESTERDAY}&end={TODAY}').get_json()['days']
+    assert [(day['day'], day['meals']) for day in history] == [(TODAY, [])]
+
+def test_sqlite_conflict_rolls_back_past_days(tmp_path):
+    path = os.path.join(tmp_path, 'import.db')
+    first, second = SQLiteStorage(path), SQLiteStorage(path)
+    first.save('user', DayState(TODAY, version=1))
+    mine, theirs = first.load('user'), second.load('user')
+    theirs.version += 1
+    second.save('user', theirs)
+    mine.version += 1
+
+    meal = Meal('dinner', 'Curry', 700)
+    with pytest.raises(SaveConflict):
+        first.save_with_days('user', mine, {YESTERDAY: [('meal', meal)]})
+    assert first.load_days('user', YESTERDAY, YESTERDAY) == []
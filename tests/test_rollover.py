@@ -0,0 +1,74 @@
+"""
+Days end at midnight in each user's timezone: the finished day is sealed
+into history, whether by the user's next request or by the background sweep,
+and the dashboard starts the new day empty.
+"""
+
+import pytest
+
+import rollover
+
+DAY, NEXT_DAY = '2024-03-10', '2024-03-11'
+EAST = 'Pacific/Kiritimati'
+
+@pytest.fixture
+def days(monkeypatch):
+    """rollover.today() per timezone (None for server time), changed by the test"""
+    days = {}
+    monkeypatch.setattr(rollover, 'today', lambda timezone=None: days.get(timezone, days[None]))
+    days[None] = DAY
+    return days
+
+def user_id(client):
+    with client.session_transaction() as sess:
+        return sess['user_id']
+
+def log_day(client):
+    assert client.post('/api/water', json={'count': 5}).status_code == 200
+    assert client.post('/api/meals', json={'type': 'lunch', 'items': 'Lentil soup',
+                                           'calories': 450}).status_code == 200
+
+def test_request_seals_finished_day(client, days):
+    log_day(client)
+    days[None] = NEXT_DAY
+
+    page = client.get('/').get_data(as_text=True)
+    assert 'Lentil soup' not in page
+    history = client.get(f'/api/history?start={DAY}&end={NEXT_DAY}').get_json()['days']
+    assert [day['day'] for day in history] == [DAY, NEXT_DAY]
+    assert history[0]['water_count'] == 5
+    assert [meal['items'] for meal in history[0]['meals']] == ['Lentil soup']
+    assert history[1]['water_count'] == 0 and history[1]['meals'] == []
+
+def test_fragments_do_not_outlive_the_day(client, days):
+    log_day(client)
+    # Cache today's fragments, then start a new day
+    assert 'Lentil soup' in client.get('/').get_data(as_text=True)
+    days[None] = NEXT_DAY
+    update = client.post('/api/water', json={'count': 1}).get_json()['update']
+    assert 'Lentil soup' not in client.get('/').get_data(as_text=True)
+    assert update['text']['water-count'] == 1
+
+def test_sweep_rolls_over_tracked_users(app, client, days):
+    log_day(client)
+    days[None] = NEXT_DAY
+    app.rollovers.sweep(app.roll_over_user)
+
+    data = app.storage.load(user_id(client))
+    assert data.last_updated == NEXT_DAY and data.meals == []
+    assert [day for day, _ in app.storage.load_days(user_id(client), DAY, DAY)] == [DAY]
+    assert app.rollovers.stats()['rolled'] == 1
+
+def test_rollover_follows_each_users_timezone(app, days):
+    east, server = app.app.test_client(), app.app.test_client()
+    assert east.post('/api/profile', json={'timezone': EAST}).status_code == 200
+    log_day(east)
+    log_day(server)
+    # Midnight has passed in Kiritimati but not in server time
+    days[EAST] = NEXT_DAY
+    assert app.rollovers.due() == [user_id(east)]
+    app.rollovers.sweep(app.roll_over_user)
+
+    assert app.storage.load(user_id(east)).last_updated == NEXT_DAY
+    assert app.storage.load(user_id(server)).last_updated == DAY
+    assert app.storage.load(user_id(server)).water_count == 5
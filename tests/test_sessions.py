@@ -0,0 +1,54 @@
+"""
+Server-side sessions: a visitor only gets a session (and a saved user) with
+their first change, and SQLite-stored sessions expire with their cookie.
+"""
+
+import sqlite3
+
+from sessions import SQLiteSessionStore, new_session_id
+
+COOKIE = 'healthylife_sid'
+
+def test_reads_start_no_session(app, client):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert 'Set-Cookie' not in response.headers
+    assert client.get('/api/analytics').status_code == 200
+    assert client.get_cookie(COOKIE) is None
+    assert app.storage.users == {}
+
+def test_first_write_starts_session(app, client):
+    response = client.post('/api/water', json={'count': 2})
+    assert COOKIE in response.headers['Set-Cookie']
+    with client.session_transaction() as sess:
+        user_id = sess['user_id']
+    assert app.storage.load(user_id).water_count == 2
+    # The same session carries on, without setting its cookie again
+    response = client.post('/api/water', json={'count': 3})
+    assert 'Set-Cookie' not in response.headers
+    assert app.storage.load(user_id).water_count == 3
+
+def test_sqlite_sessions_expire(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+    live, stale = new_session_id(), new_session_id()
+    store.save(live, {'user_id': 'a'})
+    store.save(stale, {'user_id': 'b'})
+    store.connection.execute('UPDATE sessions SET expires = 0 WHERE session_id = ?', (stale,))
+
+    assert store.load(live) == {'user_id': 'a'}
+    assert store.load(stale) is None
+    assert store.purge(force=True) == 1
+    assert store.connection.execute('SELECT session_id FROM sessions').fetchall() == [(live,)]
+
+def test_sqlite_sessions_from_before_expiry_are_kept(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE sessions (session_id TEXT PRIMARY KEY, data TEXT NOT NULL) '
+                 'WITHOUT ROWID')
+    conn.execute('INSERT INTO sessions VALUES (?, ?)', ('old', '{"user_id": "c"}'))
+    conn.commit()
+    conn.close()
+
+    store = SQLiteSessionStore(path)
+    assert store.load('old') == {'user_id': 'c'}
+    assert store.purge(force=True) == 0
@@ -0,0 +1,58 @@
+"""
+Sleep statistics: circular means and spreads of bed and wake times, sleep
+debt, and the ring buffer's running sums against a log built from scratch.
+"""
+
+import pytest
+
+from records import Sleep
+from sleep import SleepLog
+
+def night(bedtime, wake_time, hours=8, quality=7):
+    return Sleep(bedtime, wake_time, quality, hours)
+
+def test_bedtimes_average_across_midnight():
+    log = SleepLog.from_nights([('2024-03-01', night('23:30', '07:00')),
+                                ('2024-03-02', night('00:30', '07:00'))])
+    stats = log.stats()
+    assert stats['bedtime']['mean'] == '00:00'
+    assert stats['bedtime']['deviation_minutes'] == 30
+    assert stats['wake_time'] == {'mean': '07:00', 'deviation_minutes': 0, 'regularity': 100}
+
+def test_sleep_debt():
+    log = SleepLog.from_nights([('2024-03-01', night('23:00', '06:00', hours=7)),
+                                ('2024-03-02', night('23:00', '05:00', hours=6))])
+    stats = log.stats(target_hours=8)
+    assert stats['sleep_debt_hours'] == 3
+    assert stats['average_hours'] == 6.5
+
+def test_ring_buffer_matches_rebuilt_log():
+    nights = [(f'2024-03-{day:02d}', night(f'{22 + day % 3:02d}:{day * 7 % 60:02d}', '07:15',
+                                            hours=6 + day % 3, quality=day % 10))
+              for day in range(1, 31)]
+    log = SleepLog(capacity=14)
+    for day, sleep in nights:
+        log.record(day, sleep)
+    rebuilt = SleepLog.from_nights(nights, capacity=14)
+    # Sequence numbers count every night recorded, so only the nights themselves match
+    assert [night[1:] for night in log.latest()] == [night[1:] for night in rebuilt.latest()]
+    assert log.stats() == rebuilt.stats()
+    assert log.stats()['nights'] == 14
+
+def test_same_day_replaces_and_order_is_enforced():
+    log = SleepLog()
+    log.record('2024-03-02', night('23:00', '07:00', hours=8))
+    log.record('2024-03-02', night('23:00', '06:00', hours=7))
+    assert log.stats()['nights'] == 1
+    assert log.stats()['average_hours'] == 7
+    with pytest.raises(ValueError):
+        log.record('2024-03-01', night('23:00', '07:00'))
+
+def test_json_roundtrip():
+    log = SleepLog.from_nights([(f'2024-03-{day:02d}', night('23:15', '07:00', quality=day))
+                                for day in range(1, 6)])
+    restored = SleepLog.from_json(log.to_json())
+    assert restored.latest() == log.latest()
+    assert restored.stats() == log.stats()
+    with pytest.raises(ValueError):
+        SleepLog.from_json({'capacity': 'lots'})